@@ -1,6 +1,6 @@
 import logging
 
-from ..gpx_reader.constants import __url__, __version__
+from pelican.plugins.gpx_reader.constants import __url__, __version__
 
 __title__ = "pelican.plugins.everything_writer"
 __description__ = "Everything Writer for Pelican"
@@ -11,3 +11,9 @@ __email__ = "w_minchin@hotmail.com"
 logger = logging.getLogger(__name__)
 
 LOG_PREFIX = "[Everything Writer]"
+
+# also write compressed copies of XML files (e.g. `all.gpx.gz` next to
+# `all.gpx`), for web servers that can serve them directly (e.g. nginx's
+# `gzip_static`)
+XML_PRECOMPRESS_GZIP = False
+XML_PRECOMPRESS_BROTLI = False  # requires `brotli` to be installed
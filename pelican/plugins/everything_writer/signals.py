@@ -2,3 +2,4 @@ from blinker import signal
 
 image_content_written = signal("image_content_written")
 xml_content_written = signal("xml_content_written")
+data_content_written = signal("data_content_written")
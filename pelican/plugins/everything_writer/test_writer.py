@@ -0,0 +1,52 @@
+import gzip
+
+import pytest
+
+from pelican.settings import DEFAULT_CONFIG
+
+from .writer import EverythingWriter
+
+# in pieces, as combined GPX files are written
+XML = ["<gpx>", "<trk><name>Café</name></trk>", "</gpx>"]
+
+
+def write(output_path, name="gpx/all.gpx", xml=XML, **settings):
+    """Write `xml` to `name` with a new writer; returns the file written."""
+    writer = EverythingWriter(str(output_path), settings={**DEFAULT_CONFIG, **settings})
+    writer.write_xml(name, None, {}, iter(xml))
+    return output_path / name
+
+
+def test_write_xml_precompressed_off(tmp_path):
+    output_file = write(tmp_path)
+    assert output_file.read_text(encoding="utf-8") == "".join(XML)
+    assert [x.name for x in output_file.parent.iterdir()] == ["all.gpx"]
+
+
+def test_write_xml_precompressed_gzip(tmp_path):
+    output_file = write(tmp_path / "1", XML_PRECOMPRESS_GZIP=True)
+    compressed = output_file.with_name("all.gpx.gz").read_bytes()
+    assert gzip.decompress(compressed) == output_file.read_bytes()
+
+    # the same from build to build
+    output_file = write(tmp_path / "2", XML_PRECOMPRESS_GZIP=True)
+    assert output_file.with_name("all.gpx.gz").read_bytes() == compressed
+
+
+def test_write_xml_precompressed_brotli(tmp_path):
+    brotli = pytest.importorskip("brotli")
+    output_file = write(tmp_path, XML_PRECOMPRESS_BROTLI=True)
+    compressed = output_file.with_name("all.gpx.br").read_bytes()
+    assert brotli.decompress(compressed) == output_file.read_bytes()
+
+
+def test_write_xml_precompressed_skipped_write(tmp_path):
+    writer = EverythingWriter(
+        str(tmp_path), settings={**DEFAULT_CONFIG, "XML_PRECOMPRESS_GZIP": True}
+    )
+    writer.write_xml("all.gpx", None, {}, "<gpx>first</gpx>", override_output=True)
+    # skipped by Pelican, as the first write overrides it
+    writer.write_xml("all.gpx", None, {}, "<gpx>second</gpx>")
+
+    compressed = (tmp_path / "all.gpx.gz").read_bytes()
+    assert gzip.decompress(compressed) == b"<gpx>first</gpx>"
@@ -1,3 +1,5 @@
+from contextlib import ExitStack
+import gzip
 import logging
 import os
 from pathlib import Path
@@ -7,7 +9,7 @@ from urllib.parse import urljoin
 from pelican.writers import Writer
 
 from . import signals
-from .constants import LOG_PREFIX
+from .constants import LOG_PREFIX, XML_PRECOMPRESS_BROTLI, XML_PRECOMPRESS_GZIP
 
 try:
     from pelican.utils import is_selected_for_writing
@@ -15,9 +17,42 @@ except ImportError:
     # function was removed in Pelican 4.9.0
     is_selected_for_writing = lambda _1, _2: True
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 logger = logging.getLogger(__name__)
 
 
+def image_format(output_file):
+    """Pillow's format for the file's extension (e.g. "JPEG", for ".jpg")."""
+    from PIL import Image
+
+    return Image.registered_extensions().get(output_file.suffix.lower())
+
+
+class _BrotliFile:
+    """Minimal writable file that Brotli compresses as it goes."""
+
+    def __init__(self, filename):
+        self._file = open(filename, "wb")
+        self._compressor = brotli.Compressor(quality=11)
+
+    def write(self, data):
+        self._file.write(self._compressor.process(data))
+
+    def close(self):
+        self._file.write(self._compressor.finish())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class EverythingWriter(Writer):
     """Pelican writer, extended to output XML files."""
 
@@ -42,16 +77,46 @@ class EverythingWriter(Writer):
                 )
 
 
+    def _precompressed_files(self, output_file):
+        """
+        Open the compressed copies to be written next to `output_file`.
+
+        Which copies are written is set by the XML_PRECOMPRESS_* settings.
+        """
+        files = []
+        if self.settings.get("XML_PRECOMPRESS_GZIP", XML_PRECOMPRESS_GZIP):
+            # mtime of 0 keeps the output the same from build to build
+            files.append(
+                gzip.GzipFile(f"{output_file}.gz", "wb", compresslevel=9, mtime=0)
+            )
+        if self.settings.get("XML_PRECOMPRESS_BROTLI", XML_PRECOMPRESS_BROTLI):
+            if brotli:
+                files.append(_BrotliFile(f"{output_file}.br"))
+            else:
+                logger.warning(
+                    "%s XML_PRECOMPRESS_BROTLI is set, but brotli is not "
+                    "installed. Skipping %s.br",
+                    LOG_PREFIX,
+                    output_file,
+                )
+        return files
+
     def write_xml(self, name, template, context, xml, override_output=False, **kwargs):
         """
         Write out an XML file.
 
+        Compressed copies are written alongside, if turned on by the
+        XML_PRECOMPRESS_* settings. These are compressed as the XML is written,
+        so when `xml` is given in pieces, the whole file never needs to be in
+        memory.
+
         Args:
         -----
             name: output filename
             template: currently ignored
             context: dict that would normally be passed to the templates
-            xml: raw XML to write to disk
+            xml: raw XML to write to disk, either as a string, or an iterable
+                of strings (written one after the other)
             override_output: boolean telling if we can override previous output
                 with the same name (and if next files written with the same
                 name should be skipped to keep that one)
@@ -75,8 +140,29 @@ class EverythingWriter(Writer):
         # create root folders, if they don't already exist
         output_file.parent.mkdir(exist_ok=True, parents=True)
 
-        with self._open_w(output_file, "utf-8", override=override_output) as f:
-            f.write(xml)
+        if isinstance(xml, str):
+            xml = (xml,)
+
+        with ExitStack() as stack:
+            f = stack.enter_context(
+                self._open_w(output_file, "utf-8", override=override_output)
+            )
+            # Pelican skips a duplicate write by sending it to devnull; the
+            # compressed copies of the first write are then left as they are
+            compressed_files = (
+                []
+                if f.name == os.devnull
+                else [
+                    stack.enter_context(x)
+                    for x in self._precompressed_files(output_file)
+                ]
+            )
+            for chunk in xml:
+                f.write(chunk)
+                if compressed_files:
+                    chunk = chunk.encode("utf-8")
+                    for compressed_f in compressed_files:
+                        compressed_f.write(chunk)
 
         logger.info("%s Writing XML %s", LOG_PREFIX, output_file)
         # Send a signal to say we're writing a file with some specific
@@ -86,6 +172,58 @@ class EverythingWriter(Writer):
             context=localcontext,
         )
 
+    def write_data(
+        self, name, template, context, data, override_output=False, **kwargs
+    ):
+        """
+        Write out a data file (e.g. JSON, or a binary format).
+
+        Args:
+        -----
+            name: output filename
+            template: currently ignored
+            context: dict that would normally be passed to the templates
+            data: raw data to write to disk; either a string (written as
+                UTF-8), or bytes
+            override_output: boolean telling if we can override previous output
+                with the same name (and if next files written with the same
+                name should be skipped to keep that one)
+            **kwargs: currently ignored
+        """
+        if (
+            name is False
+            or name == ""
+            or not name
+            or not is_selected_for_writing(
+                self.settings, os.path.join(self.output_path, name)
+            )
+        ):
+            return
+
+        localcontext = context.copy()
+        localcontext["output_file"] = name
+        localcontext.update(kwargs)
+
+        output_file = Path(self.output_path).resolve() / name
+        # create root folders, if they don't already exist
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+
+        with self._open_w(output_file, "utf-8", override=override_output) as f:
+            if isinstance(data, bytes):
+                # `_open_w()` only opens in text mode, but does the checks for
+                # overwriting files, so write to the underlying binary file
+                f.buffer.write(data)
+            else:
+                f.write(data)
+
+        logger.info("%s Writing data %s", LOG_PREFIX, output_file)
+        # Send a signal to say we're writing a file with some specific
+        # local context.
+        signals.data_content_written.send(
+            output_file,
+            context=localcontext,
+        )
+
     def write_image(
         self, name, template, context, image, override_output=False, **kwargs
     ):
@@ -120,9 +258,8 @@ class EverythingWriter(Writer):
         output_file = Path(self.output_path).resolve() / name
         # create root folders, if they don't already exist
         output_file.parent.mkdir(exist_ok=True, parents=True)
-        image_format = output_file.suffix.removeprefix(".").lower()
 
-        image.save(output_file, format=image_format)
+        image.save(output_file, format=image_format(output_file))
 
         logger.info("%s Writing image %s", LOG_PREFIX, output_file)
         # Send a signal to say we're writing a file with some specific
@@ -131,3 +268,67 @@ class EverythingWriter(Writer):
             output_file,
             context=localcontext,
         )
+
+    def write_animation(
+        self,
+        name,
+        template,
+        context,
+        frames,
+        duration=500,
+        override_output=False,
+        **kwargs,
+    ):
+        """
+        Write (Pillow) images to disk, as the frames of an animation.
+
+        Args:
+        -----
+            name: output filename. Output file format is derived from this,
+                and needs to be one that Pillow can save animations in (e.g.
+                WebP, GIF, or PNG).
+            template: currently ignored
+            context: dict that would normally be passed to the templates
+            frames: list of Pillow images, in order. Pillow needs them all
+                at once, so they are all in memory until written.
+            duration: how long each frame is shown, in milliseconds
+            override_output: boolean telling if we can override previous output
+                with the same name (and if next files written with the same
+                name should be skipped to keep that one)
+            **kwargs: currently ignored
+        """
+        if (
+            name is False
+            or name == ""
+            or not name
+            or not frames
+            or not is_selected_for_writing(
+                self.settings, os.path.join(self.output_path, name)
+            )
+        ):
+            return
+
+        localcontext = context.copy()
+        localcontext["output_file"] = name
+        localcontext.update(kwargs)
+
+        output_file = Path(self.output_path).resolve() / name
+        # create root folders, if they don't already exist
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+
+        frames[0].save(
+            output_file,
+            format=image_format(output_file),
+            save_all=True,
+            append_images=frames[1:],
+            duration=duration,
+            loop=0,
+        )
+
+        logger.info("%s Writing animation %s", LOG_PREFIX, output_file)
+        # Send a signal to say we're writing a file with some specific
+        # local context.
+        signals.image_content_written.send(
+            output_file,
+            context=localcontext,
+        )
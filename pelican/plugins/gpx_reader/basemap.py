@@ -0,0 +1,268 @@
+"""
+Basemaps, drawn under heatmap images.
+
+A heatmap's basemap comes from either:
+
+- ``tiles``: a template for "slippy map" tiles (as used by OpenStreetMap),
+  either a URL, such as ``"https://tile.openstreetmap.org/{z}/{x}/{y}.png"``,
+  or a local path, such as ``"tiles/{z}/{x}/{y}.png"``. Downloaded tiles are
+  kept on disk, so a site can be rebuilt offline, and a local tile directory
+  can be used for sites that are always built offline; or
+- ``background_image``: an image file, stretched over the whole heatmap.
+
+The basemap only depends on the area the heatmap covers, its projection and
+scale, and the source; so it is made once, and shared by all the images of the
+heatmap (see `cache.BasemapCache`).
+"""
+
+import io
+import logging
+import math
+import os
+from pathlib import Path
+import urllib.error
+import urllib.request
+
+from PIL import Image, ImageColor
+import numpy as np
+
+from .constants import INDENT, __url__, __version__
+
+logger = logging.getLogger(__name__)
+
+# pixels along each side of a map tile
+MAP_TILE_SIZE = 256
+# most tile servers stop here
+MAX_ZOOM = 19
+# map tiles downloaded for one basemap; any more are left missing (the
+# basemap isn't kept between builds, so later builds download them, and
+# finish it). Also keeps within tile servers' limits on bulk downloading
+MAX_TILE_DOWNLOADS = 250
+# seconds to wait for a tile server; one that doesn't answer isn't tried
+# again for the rest of the basemap
+TILE_TIMEOUT = 10
+# tile servers (e.g. OpenStreetMap's) ask that requests identify themselves
+USER_AGENT = f"pelican-gpx-reader/{__version__} (+{__url__})"
+# for converting scale to a zoom level, as in Web Mercator; in meters
+EARTH_RADIUS = 6378137
+MAX_LATITUDE = 85.0511
+
+
+def basemap_source(heatmap_settings):
+    """
+    What the basemap of a heatmap is drawn from.
+
+    Returns:
+        ("tiles", template), ("image", path), or None if it has no basemap
+    """
+    if heatmap_settings.get("tiles"):
+        return ("tiles", heatmap_settings["tiles"])
+    if heatmap_settings.get("background_image"):
+        return ("image", heatmap_settings["background_image"])
+    return None
+
+
+def is_url(template):
+    return template.startswith(("http://", "https://"))
+
+
+def zoom_for_scale(meters_per_pixel):
+    """Least zoom level with tiles at least as detailed as the heatmap."""
+    zoom = math.ceil(
+        math.log2(2 * math.pi * EARTH_RADIUS / MAP_TILE_SIZE / meters_per_pixel)
+    )
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+class TileDownloads:
+    """
+    Downloads of the map tiles for one basemap: at most `MAX_TILE_DOWNLOADS`,
+    each waiting at most `TILE_TIMEOUT` seconds, and none after the tile
+    server has failed to answer, so a slow or unreachable server can't hold
+    up the build.
+    """
+
+    def __init__(self):
+        self.limit = MAX_TILE_DOWNLOADS
+        self.count = 0
+        # tiles not downloaded, as over the limit or after `failure`
+        self.skipped = 0
+        self.failure = None
+
+    def fetch(self, location):
+        """Contents of the tile at `location` (a URL), or None."""
+        if self.failure is not None or self.count >= self.limit:
+            self.skipped += 1
+            return None
+
+        self.count += 1
+        request = urllib.request.Request(location, headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=TILE_TIMEOUT) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            # the server answered; only this tile is missing
+            logger.debug("%sCould not download tile %s: %s", INDENT, location, e)
+        except (urllib.error.URLError, OSError) as e:
+            logger.debug("%sCould not download tile %s: %s", INDENT, location, e)
+            self.failure = e
+        return None
+
+
+def load_tile(template, zoom, x, y, tile_dir=None, downloads=None):
+    """
+    One map tile, as an RGBA array, or None if it isn't available.
+
+    Tiles from a URL are stored under `tile_dir` (if given), and only
+    downloaded (through `downloads`, a `TileDownloads`) if they aren't there
+    already.
+    """
+    location = template.format(z=zoom, x=x, y=y)
+    if is_url(template):
+        cached = Path(tile_dir, str(zoom), str(x), str(y)) if tile_dir else None
+        if cached is not None and cached.is_file():
+            data = cached.read_bytes()
+        else:
+            data = (downloads or TileDownloads()).fetch(location)
+            if data is None:
+                return None
+            if cached is not None:
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                cached.write_bytes(data)
+        source = io.BytesIO(data)
+    else:
+        source = os.path.expanduser(location)
+        if not os.path.isfile(source):
+            return None
+
+    try:
+        with Image.open(source) as tile:
+            tile = tile.convert("RGBA")
+            if tile.size != (MAP_TILE_SIZE, MAP_TILE_SIZE):
+                tile = tile.resize((MAP_TILE_SIZE, MAP_TILE_SIZE))
+            return np.asarray(tile)
+    except OSError as e:
+        logger.debug("%sCould not read tile %s: %s", INDENT, location, e)
+        return None
+
+
+def tiles_basemap(template, projection, origin, shape, background=None, tile_dir=None):
+    """
+    Basemap made from map tiles.
+
+    Tiles are in Web Mercator, but both projections keep latitude and
+    longitude apart (rows and columns of the image depend only on one or the
+    other), so each row and column of the image is simply matched to a row or
+    column of the tiles at the nearest (more detailed) zoom level.
+
+    Tiles that can't be loaded are left blank (or the ``background`` colour),
+    and counted in the image's ``info["missing_tiles"]``. Downloads are
+    limited as set out in `TileDownloads`.
+    """
+    rows, columns = shape
+    latitude, longitude = projection.unproject(
+        origin[0] + np.arange(columns, dtype=np.float64),
+        origin[1] + np.arange(rows, dtype=np.float64),
+    )
+
+    zoom = zoom_for_scale(projection.meters_per_pixel)
+    world = MAP_TILE_SIZE * 2**zoom
+    tile_x = np.floor((longitude + 180) / 360 * world).astype(np.int64) % world
+    latitude = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    tile_y = np.clip(
+        np.floor((1 - np.arcsinh(np.tan(latitude)) / math.pi) / 2 * world),
+        0,
+        world - 1,
+    ).astype(np.int64)
+
+    pixels = np.zeros((rows, columns, 4), dtype=np.uint8)
+    if background:
+        pixels[...] = ImageColor.getrgb(background)[:3] + (255,)
+
+    tile_columns = tile_x // MAP_TILE_SIZE
+    tile_rows = tile_y // MAP_TILE_SIZE
+    missing = 0
+    downloads = TileDownloads()
+    for tile_row in np.unique(tile_rows):
+        row_selection = np.flatnonzero(tile_rows == tile_row)
+        for tile_column in np.unique(tile_columns):
+            tile = load_tile(
+                template,
+                zoom,
+                int(tile_column),
+                int(tile_row),
+                tile_dir=tile_dir,
+                downloads=downloads,
+            )
+            if tile is None:
+                missing += 1
+                continue
+            column_selection = np.flatnonzero(tile_columns == tile_column)
+            pixels[np.ix_(row_selection, column_selection)] = tile[
+                np.ix_(
+                    tile_y[row_selection] % MAP_TILE_SIZE,
+                    tile_x[column_selection] % MAP_TILE_SIZE,
+                )
+            ]
+
+    if downloads.failure is not None:
+        logger.warning(
+            "%sStopped downloading map tiles from %s: %s",
+            INDENT,
+            template,
+            downloads.failure,
+        )
+    elif downloads.skipped:
+        logger.warning(
+            "%sOnly downloading %s map tiles per image; %s more are left for "
+            "later builds",
+            INDENT,
+            downloads.limit,
+            downloads.skipped,
+        )
+    if missing:
+        logger.warning(
+            "%s%s map tile%s missing (zoom %s) from %s",
+            INDENT,
+            missing,
+            "s" if missing != 1 else "",
+            zoom,
+            template,
+        )
+    basemap = Image.fromarray(pixels)
+    basemap.info["missing_tiles"] = missing
+    return basemap
+
+
+def make_basemap(heatmap_settings, projection, origin, shape, tile_dir=None):
+    """
+    Basemap for a heatmap image.
+
+    Args:
+        heatmap_settings (dict): settings of the heatmap
+        projection (heatmap.Projection): as used to draw the heatmap
+        origin: (x, y) of the top left corner of the image, in projected
+            pixels
+        shape: (rows, columns) of the image
+        tile_dir: where to keep downloaded tiles
+
+    Returns:
+        RGBA PIL.Image, or None if the heatmap has no basemap
+    """
+    source = basemap_source(heatmap_settings)
+    if source is None:
+        return None
+
+    kind, location = source
+    if kind == "tiles":
+        return tiles_basemap(
+            location,
+            projection,
+            origin,
+            shape,
+            background=heatmap_settings["background"],
+            tile_dir=tile_dir,
+        )
+
+    with Image.open(location) as background:
+        return background.convert("RGBA").resize((shape[1], shape[0]))
@@ -0,0 +1,210 @@
+"""
+Limits on the work done for a single GPX file, so one pathological file (e.g.
+from a logger left running for weeks) can't stall the build, or run it out of
+memory:
+
+- ``GPX_MAX_FILE_SIZE``: size of the GPX (once decompressed), in MB;
+- ``GPX_MAX_POINTS``: number of track points;
+- ``GPX_MAX_READ_TIME``: time to read the file (parse, clean, simplify, and
+  so on), in seconds.
+
+Size and points are checked before the file is parsed, from the raw bytes
+(see `scan.measure_gpx()`). For the time limit, files are read in a worker
+process (see `ReadWorker`), which is stopped if a file takes too long, even
+if it is stuck in C code (such as the XML parser). Where there can't be one
+(no ``fork``, or already in a worker, as for ``gpx-reader warm``), it is
+checked with a timer signal instead (see `time_limit()`), which only
+interrupts Python code, and only applies where there is one (not on
+Windows), in the main thread. Files over any of these raise
+`OverBudgetGPXException`, and are recorded as failed by the generator, which
+carries on with the rest.
+
+Heatmap images have limits of their own (``max_pixels`` and ``max_memory``;
+see `heatmap.fit_heatmap()`).
+"""
+
+from contextlib import contextmanager
+import logging
+import multiprocessing
+from pathlib import Path
+import signal
+import threading
+
+from .constants import INDENT
+from .exceptions import OverBudgetGPXException
+from .scan import measure_gpx
+
+logger = logging.getLogger(__name__)
+
+
+def check_size(source_file, pelican_settings):
+    """
+    Raise `OverBudgetGPXException` if the GPX file is over
+    ``GPX_MAX_FILE_SIZE`` or ``GPX_MAX_POINTS``.
+    """
+    max_size = pelican_settings["GPX_MAX_FILE_SIZE"]
+    max_bytes = int(max_size * 2**20) if max_size else None
+    max_points = pelican_settings["GPX_MAX_POINTS"]
+    if max_bytes is None and max_points is None:
+        return
+
+    source_file = Path(source_file)
+    if max_points is None and source_file.suffix.lower() == ".gpx":
+        # not compressed, so no need to read it
+        size, points = source_file.stat().st_size, 0
+    else:
+        size, points = measure_gpx(source_file, max_bytes, max_points)
+
+    if max_bytes is not None and size > max_bytes:
+        raise OverBudgetGPXException(
+            f"{source_file.name} is over {size / 2**20:,.1f} MB "
+            f"(GPX_MAX_FILE_SIZE is {max_size:,} MB)"
+        )
+    if max_points is not None and points > max_points:
+        raise OverBudgetGPXException(
+            f"{source_file.name} has over {points:,} points "
+            f"(GPX_MAX_POINTS is {max_points:,})"
+        )
+
+
+def _over_time(source_file, seconds):
+    return OverBudgetGPXException(
+        f"{Path(source_file).name} took over {seconds:,} seconds to read "
+        f"(GPX_MAX_READ_TIME)"
+    )
+
+
+class ReadWorker:
+    """
+    A process to read GPX files in, one at a time, so one that takes longer
+    than ``GPX_MAX_READ_TIME`` can be stopped.
+
+    It is forked from this process when first needed, so has everything
+    already loaded, and is kept for the files that follow (so what it loads
+    along the way, such as privacy zones, is reused). It is only replaced
+    after a file runs out of time.
+    """
+
+    def __init__(self, function):
+        """
+        Args:
+            function: what reads a file; its arguments, and what it returns
+                (or raises), need to be picklable
+        """
+        self.function = function
+        self._process = None
+        self._connection = None
+
+    @staticmethod
+    def available():
+        """Can there be a worker here?"""
+        return (
+            "fork" in multiprocessing.get_all_start_methods()
+            # daemonic processes (e.g. those of a `multiprocessing.Pool`)
+            # can't start processes of their own
+            and not multiprocessing.current_process().daemon
+        )
+
+    def run(self, source_file, seconds, *args):
+        """
+        ``function(*args)``, in the worker; raise `OverBudgetGPXException`
+        (and stop the worker) if it takes over `seconds`.
+        """
+        if self._process is None or not self._process.is_alive():
+            self._start()
+        self._connection.send(args)
+        if not self._connection.poll(seconds):
+            self.stop()
+            raise _over_time(source_file, seconds)
+        try:
+            error, result = self._connection.recv()
+        except EOFError:
+            exitcode = self._process.exitcode
+            self.stop()
+            raise RuntimeError(
+                f"Process reading {Path(source_file).name} stopped "
+                f"(exit code {exitcode})"
+            )
+        if error is not None:
+            raise error
+        return result
+
+    def _start(self):
+        context = multiprocessing.get_context("fork")
+        self._connection, worker_connection = context.Pipe()
+        self._process = context.Process(
+            target=_serve,
+            args=(self.function, worker_connection),
+            daemon=True,
+        )
+        self._process.start()
+        worker_connection.close()
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+        self._process = None
+        self._connection = None
+
+
+def _serve(function, connection):
+    """In the worker: call `function` with what is sent, and send back the result."""
+    while True:
+        try:
+            args = connection.recv()
+        except EOFError:
+            return
+        try:
+            reply = (None, function(*args))
+        except Exception as e:
+            reply = (e, None)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # e.g. an exception that can't be pickled
+            connection.send((RuntimeError(repr(reply[0] or e)), None))
+
+
+@contextmanager
+def time_limit(source_file, pelican_settings):
+    """
+    Raise `OverBudgetGPXException` if the body takes longer than
+    ``GPX_MAX_READ_TIME``.
+
+    Only Python code is interrupted: a file stuck in C code (e.g. the XML
+    parser) is only stopped once it gets back to Python. Use a `ReadWorker`
+    where there can be one.
+    """
+    seconds = pelican_settings["GPX_MAX_READ_TIME"]
+    if not seconds:
+        yield
+        return
+    if (
+        not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        logger.debug("%sGPX_MAX_READ_TIME can't be checked here", INDENT)
+        yield
+        return
+
+    timed_out = []
+
+    def on_timer(signum, frame):
+        timed_out.append(True)
+        raise _over_time(source_file, seconds)
+
+    previous_handler = signal.signal(signal.SIGALRM, on_timer)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    except Exception as e:
+        # gpxpy (for one) turns any error while parsing into one of its own
+        if timed_out and not isinstance(e, OverBudgetGPXException):
+            raise _over_time(source_file, seconds) from e
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
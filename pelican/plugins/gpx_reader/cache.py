@@ -0,0 +1,272 @@
+"""
+Caching of GPX Reader results between builds.
+
+Pelican's content cache is keyed by source file only, so cached results also
+record a fingerprint of the settings they were made with, at three levels:
+
+- *track*: reading, cleaning and simplifying a GPX file, and the metadata
+  generated from it (see `TRACK_SETTINGS`);
+- *clip*: trimming the track to a heatmap's ``extent``;
+- *render*: drawing the heatmap, which depends on all its settings.
+
+So changing one heatmap only redoes that heatmap's clips and renders.
+Basemaps are cached by what they are drawn from (see `BasemapCache`), and
+source files by their contents (see `SourceDigestIndex`).
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from .constants import INDENT, __version__
+
+logger = logging.getLogger(__name__)
+
+# settings used by `GPXReader.read()`, outside of the per-heatmap settings
+TRACK_SETTINGS = [
+    "GPX_AUTHOR",
+    "GPX_BINARY_SAVE_AS",
+    "GPX_CATEGORY",
+    "GPX_DECIMATE_DISTANCE",
+    "GPX_DECIMATE_SECONDS",
+    "GPX_GEOJSON_SAVE_AS",
+    "GPX_IMAGE_SAVE_AS",
+    "GPX_MAX_FILE_SIZE",
+    "GPX_MAX_POINTS",
+    "GPX_MAX_READ_TIME",
+    "GPX_MAX_SPEED",
+    "GPX_POLYLINE_SAVE_AS",
+    "GPX_PRIVACY_ZONES",
+    "GPX_SAVE_AS",
+    "GPX_SIMPLIFY_DISTANCE",
+    "GPX_STATUS",
+    "GPX_STOP_RADIUS",
+    "GPX_STOP_TIME",
+    "GPX_STOPPED_SPEED",
+    "TIMEZONE",
+]
+
+
+def settings_fingerprint(*values):
+    """Short digest of settings values, stable from one build to the next."""
+    encoded = json.dumps(values, sort_keys=True, default=repr).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def track_fingerprint(settings):
+    values = {key: settings.get(key) for key in TRACK_SETTINGS}
+    if values["GPX_PRIVACY_ZONES"]:
+        # imported here, as this is worked out as the generator is set up,
+        # before there are any GPX files (and polygons loads NumPy)
+        from .polygons import extent_key
+
+        # so editing a GeoJSON file of zones counts as a change
+        values["GPX_PRIVACY_ZONES"] = [
+            extent_key(zone) for zone in values["GPX_PRIVACY_ZONES"]
+        ]
+    # a new version of the plugin may store things differently
+    return settings_fingerprint(__version__, values)
+
+
+def clip_fingerprint(heatmap_settings):
+    from .polygons import extent_key
+
+    extent = extent_key(heatmap_settings["extent"])
+    if heatmap_settings["variants"]:
+        # the metadata then also has the size of each image
+        return settings_fingerprint(extent, heatmap_settings)
+    return settings_fingerprint(extent)
+
+
+def render_fingerprint(heatmap_settings):
+    # each variant is cached as an image of its own, and doesn't change the
+    # others
+    return settings_fingerprint(
+        {key: value for key, value in heatmap_settings.items() if key != "variants"}
+    )
+
+
+class HeatmapImageCache:
+    """
+    Rendered heatmap images, kept under ``CACHE_PATH`` between builds.
+
+    Images are stored under the name they are written out as, which includes
+    the hash of the GPX data they were rendered from, in a folder per render
+    fingerprint of the heatmap settings. So an image is reused whenever the
+    same GPX data comes up again for an unchanged heatmap.
+
+    Follows Pelican's content caching settings: images are saved if
+    ``CACHE_CONTENT`` is set, and reused if ``LOAD_CONTENT_CACHE`` is set.
+    """
+
+    def __init__(self, settings):
+        self.path = Path(settings["CACHE_PATH"]).resolve() / "gpx_heatmaps"
+        self.heatmaps = settings["GPX_HEATMAPS"]
+        self.save_policy = settings["CACHE_CONTENT"]
+        self.load_policy = settings["LOAD_CONTENT_CACHE"]
+
+    def _cache_file(self, name, heatmap):
+        return self.path / render_fingerprint(self.heatmaps[heatmap]) / name
+
+    def has(self, name, heatmap):
+        return self.load_policy and self._cache_file(name, heatmap).is_file()
+
+    def get(self, name, heatmap):
+        """Cached image, or None if it hasn't been cached."""
+        if not self.has(name, heatmap):
+            return None
+
+        from PIL import Image
+
+        image = Image.open(self._cache_file(name, heatmap))
+        image.load()
+        logger.debug("%sUsing cached heatmap %s", INDENT, name)
+        return image
+
+    def put(self, name, heatmap, image):
+        from pelican.plugins.everything_writer.writer import image_format
+
+        if not self.save_policy:
+            return
+
+        cache_file = self._cache_file(name, heatmap)
+        cache_file.parent.mkdir(exist_ok=True, parents=True)
+        image.save(cache_file, format=image_format(cache_file))
+
+
+class BasemapCache:
+    """
+    Basemaps for heatmap images, made once per (area, projection, scale,
+    source), and shared by all the images that match.
+
+    The latest basemaps are kept in memory, and all of them under
+    ``CACHE_PATH`` between builds, following Pelican's content caching
+    settings as `HeatmapImageCache` does. Map tiles downloaded to make them
+    are always kept, so a site can be rebuilt offline. Basemaps with tiles
+    missing (e.g. made while offline) are only kept in memory, so a later
+    build makes them again, whole.
+    """
+
+    # basemaps kept in memory; each heatmap (with a fixed extent) only needs
+    # the one
+    in_memory = 4
+
+    def __init__(self, settings):
+        cache_path = Path(settings["CACHE_PATH"]).resolve()
+        self.path = cache_path / "gpx_basemaps"
+        self.tile_dir = cache_path / "gpx_tiles"
+        self.save_policy = settings["CACHE_CONTENT"]
+        self.load_policy = settings["LOAD_CONTENT_CACHE"]
+        self._basemaps = {}
+
+    def _key(self, heatmap_settings, projection, origin, shape):
+        from .basemap import basemap_source
+
+        kind, location = basemap_source(heatmap_settings)
+        if kind == "image":
+            # pick up changes to the image itself
+            stat = os.stat(location)
+            source = (kind, os.path.abspath(location), stat.st_mtime_ns, stat.st_size)
+        else:
+            source = (kind, location, heatmap_settings["background"])
+        return settings_fingerprint(
+            source,
+            heatmap_settings["projection"],
+            projection.meters_per_pixel,
+            [round(x, 3) for x in origin],
+            list(shape),
+        )
+
+    def tile_dir_for(self, template):
+        """Where tiles downloaded from `template` are kept."""
+        return self.tile_dir / settings_fingerprint(template)
+
+    def get(self, heatmap_settings, projection, origin, shape):
+        """
+        Basemap for a heatmap image (see `basemap.make_basemap()`), or None if
+        the heatmap doesn't have one.
+        """
+        from PIL import Image
+
+        from .basemap import basemap_source, make_basemap
+
+        source = basemap_source(heatmap_settings)
+        if source is None:
+            return None
+
+        key = self._key(heatmap_settings, projection, origin, shape)
+        basemap = self._basemaps.get(key)
+        if basemap is not None:
+            return basemap
+
+        cache_file = self.path / f"{key}.png"
+        if self.load_policy and cache_file.is_file():
+            basemap = Image.open(cache_file)
+            basemap.load()
+            logger.debug("%sUsing cached basemap %s", INDENT, key)
+        else:
+            logger.debug("%sMaking basemap %s", INDENT, key)
+            basemap = make_basemap(
+                heatmap_settings,
+                projection,
+                origin,
+                shape,
+                tile_dir=self.tile_dir_for(source[1]),
+            )
+            if basemap.info.get("missing_tiles"):
+                # made again next time, once the tiles can be had
+                logger.debug("%sNot caching basemap %s: tiles missing", INDENT, key)
+            elif self.save_policy:
+                cache_file.parent.mkdir(exist_ok=True, parents=True)
+                basemap.save(cache_file, format="png")
+
+        if len(self._basemaps) >= self.in_memory:
+            self._basemaps.pop(next(iter(self._basemaps)))
+        self._basemaps[key] = basemap
+        return basemap
+
+
+class SourceDigestIndex:
+    """
+    Digests of the bytes of GPX source files, kept under ``CACHE_PATH``
+    between builds, and only worked out again for files whose modification
+    time or size has changed.
+
+    Follows Pelican's content caching settings, as `HeatmapImageCache` does.
+    """
+
+    def __init__(self, settings):
+        self.path = Path(settings["CACHE_PATH"]).resolve() / "gpx_digests.json"
+        self.save_policy = settings["CACHE_CONTENT"]
+        self.index = {}
+        self.changed = False
+        if settings["LOAD_CONTENT_CACHE"] and self.path.is_file():
+            try:
+                self.index = json.loads(self.path.read_text())
+            except ValueError:
+                logger.debug("%sIgnoring unreadable %s", INDENT, self.path)
+
+    def digest(self, path):
+        """Digest of the file at (absolute) `path`."""
+        from .hasher import file_digest
+
+        stat = os.stat(path)
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        entry = self.index.get(path)
+        if entry is not None and entry[:2] == stamp:
+            return entry[2]
+
+        digest = file_digest(path)
+        self.index[path] = stamp + [digest]
+        self.changed = True
+        return digest
+
+    def save(self):
+        if not (self.save_policy and self.changed):
+            return
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.path.write_text(json.dumps(self.index, sort_keys=True))
+        self.changed = False
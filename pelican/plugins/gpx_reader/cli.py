@@ -0,0 +1,297 @@
+"""
+Command line tool to fill Pelican's content cache ahead of a site build.
+
+Parsing GPX files (and rendering their heatmaps) is the slow part of building
+a site with many tracks, and Pelican does it one file at a time. ``gpx-reader
+warm`` does the same work across several processes, and stores the results in
+Pelican's cache, so the next ``pelican`` run only has to load them.
+
+    gpx-reader warm content/ -s pelicanconf.py --workers 8 --heatmaps
+
+The cache is written the same way Pelican writes it, so it follows the
+``CACHE_PATH``, ``CONTENT_CACHING_LAYER`` and ``GZIP_CACHE`` settings. The
+site must have ``CACHE_CONTENT`` and ``LOAD_CONTENT_CACHE`` turned on for the
+build to make use of it.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import os
+import sys
+
+from .constants import LOG_PREFIX, __version__
+
+logger = logging.getLogger(__name__)
+
+# set in each worker process by `_init_worker()`
+_worker_settings = None
+_worker_reader = None
+_worker_cache = None
+_worker_basemaps = None
+
+
+def load_settings(settings_file, content_dir=None):
+    """
+    Pelican settings, as they would be for a site build.
+
+    The existing cache is always loaded, so files already in it aren't read
+    again.
+    """
+    from pelican import Pelican
+    from pelican.settings import read_settings
+
+    from . import register
+
+    override = {"LOAD_CONTENT_CACHE": True}
+    if content_dir is not None:
+        override["PATH"] = os.path.abspath(content_dir)
+
+    settings = read_settings(settings_file, override=override)
+    # make sure this plugin is hooked up, even if it isn't listed in PLUGINS
+    register()
+    # loads the other plugins, and fills in the GPX Reader default settings
+    pelican = Pelican(settings)
+    return pelican
+
+
+def _init_worker(settings_file, content_dir):
+    from .cache import BasemapCache, HeatmapImageCache
+    from .reader import GPXReader
+
+    global _worker_settings, _worker_reader, _worker_cache, _worker_basemaps
+
+    _worker_settings = load_settings(settings_file, content_dir).settings
+    _worker_reader = GPXReader(_worker_settings)
+    _worker_cache = HeatmapImageCache(_worker_settings)
+    _worker_basemaps = BasemapCache(_worker_settings)
+
+
+def _read_gpx(path):
+    """
+    Read one GPX file, in a worker process.
+
+    Returns:
+        (path, (content, metadata)), or (path, None) if the file couldn't be
+        read; it will be read again (and the error reported) by the main
+        process. Files over their budget aren't read again; the exception is
+        returned instead, and raised by the main process.
+    """
+    from .exceptions import OverBudgetGPXException
+
+    try:
+        return path, _worker_reader.read(path)
+    except OverBudgetGPXException as e:
+        return path, e
+    except Exception as e:
+        logger.debug("%s Could not read %s: %s", LOG_PREFIX, path, e)
+        return path, None
+
+
+def _render_heatmap(heatmap_save_as, points, heatmap):
+    """
+    Render one heatmap image (and its variants), in a worker process, and
+    cache it.
+    """
+    from .heatmap import generate_heatmap_variants
+
+    images = generate_heatmap_variants(
+        [points],
+        _worker_settings["GPX_HEATMAPS"][heatmap],
+        heatmap_save_as,
+        basemaps=_worker_basemaps,
+    )
+    for name, image in images.items():
+        _worker_cache.put(name, heatmap, image)
+    return heatmap_save_as
+
+
+def _is_cached(generator, fn):
+    """Is the GPX file already in (an up-to-date entry of) Pelican's cache?"""
+    if generator.settings["CONTENT_CACHING_LAYER"] == "generator":
+        return generator.get_cached_data(fn, None) is not None
+
+    path = os.path.abspath(os.path.join(generator.path, fn))
+    _, metadata = generator.readers.get_cached_data(path, (None, None))
+    return metadata is not None
+
+
+def _is_heatmap_cached(generator, heatmap_save_as, heatmap):
+    """Is the heatmap image (and each of its variants) already cached?"""
+    if not generator.settings["GPX_HEATMAPS"][heatmap]["variants"]:
+        # without opening the image
+        return generator.heatmap_cache.has(heatmap_save_as, heatmap)
+    return generator._cached_heatmap_images(heatmap_save_as, heatmap) is not None
+
+
+def _precomputed_read(results, read, path):
+    """`GPXReader.read()`, using the results from the worker processes."""
+    result = results.pop(path, None)
+    if result is None:
+        return read(path)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def warm(settings_file, content_dir=None, workers=None, heatmaps=False):
+    """
+    Fill Pelican's cache with the GPX files under `content_dir`.
+
+    Returns:
+        int: exit code
+    """
+    from .generator import GPXGenerator
+
+    pelican = load_settings(settings_file, content_dir)
+    settings = pelican.settings
+
+    if not settings["CACHE_CONTENT"]:
+        logger.error(
+            "%s CACHE_CONTENT is turned off, so there is no cache to warm.",
+            LOG_PREFIX,
+        )
+        return 1
+
+    context = settings.copy()
+    context["generated_content"] = {}
+    context["static_links"] = set()
+    context["static_content"] = {}
+    context["localsiteurl"] = settings["SITEURL"]
+
+    generator = GPXGenerator(
+        context=context,
+        settings=settings,
+        path=pelican.path,
+        theme=pelican.theme,
+        output_path=pelican.output_path,
+    )
+
+    to_read = [
+        os.path.abspath(os.path.join(generator.path, fn))
+        for fn in generator.source_files()
+        if not _is_cached(generator, fn)
+    ]
+    logger.info(
+        "%s %s GPX file(s) to read, with %s worker(s).",
+        LOG_PREFIX,
+        len(to_read),
+        workers,
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(settings_file, content_dir),
+    ) as executor:
+        results = dict(
+            future.result()
+            for future in as_completed(
+                executor.submit(_read_gpx, path) for path in to_read
+            )
+        )
+
+        # Let the generator do the rest, so the cache is filled exactly as it
+        # would be in a site build.
+        reader = generator.readers.readers["gpx"]
+        reader.read = lambda path, read=reader.read: _precomputed_read(
+            results, read, path
+        )
+        generator.generate_context()
+
+        if heatmaps:
+            to_render = []
+            for gpx_article in generator.gpxes:
+                if not gpx_article.valid:
+                    continue
+                for heatmap in settings["GPX_HEATMAPS"]:
+                    heatmap_save_as = getattr(gpx_article, f"gpx_{heatmap}_image")
+                    if heatmap_save_as and not _is_heatmap_cached(
+                        generator, heatmap_save_as, heatmap
+                    ):
+                        to_render.append(
+                            (
+                                heatmap_save_as,
+                                generator._heatmap_points(gpx_article, heatmap),
+                                heatmap,
+                            )
+                        )
+
+            logger.info("%s %s heatmap(s) to render.", LOG_PREFIX, len(to_render))
+            for future in as_completed(
+                executor.submit(_render_heatmap, *args) for args in to_render
+            ):
+                future.result()
+
+    failed = [
+        path
+        for path, content in generator.context["generated_content"].items()
+        if content is None
+    ]
+    logger.info(
+        "%s Cache ready: %s GPX file(s) cached, %s failed.",
+        LOG_PREFIX,
+        len(generator.gpxes),
+        len(failed),
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="gpx-reader",
+        description="Tools for the GPX Reader plugin for Pelican.",
+    )
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {__version__}"
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Show debugging output."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm_parser = subparsers.add_parser(
+        "warm",
+        help="Read GPX files in parallel, and store them in Pelican's cache.",
+    )
+    warm_parser.add_argument(
+        "content_dir",
+        nargs="?",
+        help="Content directory. Defaults to PATH from the settings file.",
+    )
+    warm_parser.add_argument(
+        "-s",
+        "--settings",
+        default="pelicanconf.py",
+        help="Pelican settings file. Defaults to %(default)s",
+    )
+    warm_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes. Defaults to %(default)s",
+    )
+    warm_parser.add_argument(
+        "--heatmaps",
+        action="store_true",
+        help="Also render (and cache) the heatmap of each GPX file.",
+    )
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s: %(message)s",
+    )
+
+    if args.command == "warm":
+        return warm(
+            args.settings,
+            content_dir=args.content_dir,
+            workers=args.workers,
+            heatmaps=args.heatmaps,
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
+from importlib.util import find_spec
 import logging
 
-from ._vendor.heatmap import heatmap
-
 logger = logging.getLogger(__name__)
 
 __title__ = "pelican.plugins.gpx_reader"
@@ -22,7 +21,36 @@ GPX_EXCLUDES = list()
 GPX_AUTHOR = "GPX Reader"
 GPX_CATEGORY = "GPX"
 GPX_STATUS = "published"
+# limits on reading each GPX file; files over them are skipped (see
+# `budget.py`). Size is once decompressed, in MB; time in seconds. None for no
+# limit
+GPX_MAX_FILE_SIZE = 256
+GPX_MAX_POINTS = None
+GPX_MAX_READ_TIME = None
+# before simplifying, drop points this soon after (in seconds), or this close
+# along the track to (in meters), the last point kept; None to not
+GPX_DECIMATE_SECONDS = None
+GPX_DECIMATE_DISTANCE = None
 GPX_SIMPLIFY_DISTANCE = 5  # in meters
+GPX_STOPPED_SPEED = 1  # in km/h; slower than this is not "moving"
+# points that jump away (and back) faster than this, in km/h, are bad fixes;
+# None to keep them
+GPX_MAX_SPEED = 1000
+# standing still this long (in seconds), within this distance (in meters), is
+# a stop; the points logged during it are collapsed. None to keep them all
+# (e.g. 60 and 20)
+GPX_STOP_TIME = None
+GPX_STOP_RADIUS = None
+# points near these places are removed from tracks; each is (lat, long,
+# radius in meters), or a polygon, as for a heatmap extent (see `privacy.py`)
+GPX_PRIVACY_ZONES = list()
+# the same trip recorded more than once (e.g. on a watch and a phone): "keep"
+# all the recordings, "skip" all but one, or "exclude-combined" (keep them
+# all, but only that one is used for combined files); see `overlaps.py`.
+# Recordings by different people on a shared trip match too, so only "keep"
+# leaves them all in
+GPX_OVERLAPS = "keep"
+GPX_OVERLAP_DISTANCE = 50  # in meters; recordings further apart are different
 GPX_HEATMAPS = {"default": dict()}
 GPX_SAVE_AS = "gpx/{heatmap}/{slug}.gpx"
 ALL_GPX_SAVE_AS = "gpx/{heatmap}/combined/all.gpx"
@@ -48,6 +76,45 @@ MONTH_GPX_IMAGE_SAVE_AS = GPX_IMAGE_SAVE_AS
 WEEK_GPX_IMAGE_SAVE_AS = GPX_IMAGE_SAVE_AS
 DAY_GPX_IMAGE_SAVE_AS = GPX_IMAGE_SAVE_AS
 
+# compact versions of the tracks, for web maps; see `formats.py`. Off (None)
+# by default; to turn one on, set it to where to save it, with the same keys
+# as GPX_SAVE_AS (per track) or ALL_GPX_SAVE_AS etc (per period), e.g.
+#   GPX_GEOJSON_SAVE_AS = "gpx/{heatmap}/{slug}.geojson"
+#   ALL_GPX_POLYLINE_SAVE_AS = "gpx/{heatmap}/combined/all.polyline"
+#   YEAR_GPX_BINARY_SAVE_AS = "gpx/{heatmap}/combined/{date:%Y}.bin"
+GPX_COORDINATE_PRECISION = 5  # decimal places kept; 5 is about 1 m
+GPX_GEOJSON_SAVE_AS = None
+ALL_GPX_GEOJSON_SAVE_AS = None
+YEAR_GPX_GEOJSON_SAVE_AS = None
+MONTH_GPX_GEOJSON_SAVE_AS = None
+WEEK_GPX_GEOJSON_SAVE_AS = None
+DAY_GPX_GEOJSON_SAVE_AS = None
+GPX_POLYLINE_SAVE_AS = None
+ALL_GPX_POLYLINE_SAVE_AS = None
+YEAR_GPX_POLYLINE_SAVE_AS = None
+MONTH_GPX_POLYLINE_SAVE_AS = None
+WEEK_GPX_POLYLINE_SAVE_AS = None
+DAY_GPX_POLYLINE_SAVE_AS = None
+GPX_BINARY_SAVE_AS = None
+ALL_GPX_BINARY_SAVE_AS = None
+YEAR_GPX_BINARY_SAVE_AS = None
+MONTH_GPX_BINARY_SAVE_AS = None
+WEEK_GPX_BINARY_SAVE_AS = None
+DAY_GPX_BINARY_SAVE_AS = None
+
+# heatmap animations, one frame per GPX_ANIMATION_PERIOD ("year", "month",
+# "week", or "day"): "cumulative" shows everything up to each frame, "rolling"
+# the last GPX_ANIMATION_WINDOW days. Each can be saved as an animation (WebP,
+# GIF, or PNG, by extension) and/or as a still image per frame (with {date}
+# the start of the period); None to not
+GPX_ANIMATION_PERIOD = "month"
+GPX_ANIMATION_WINDOW = 90  # in days
+GPX_ANIMATION_FRAME_DURATION = 500  # in milliseconds
+CUMULATIVE_GPX_ANIMATION_SAVE_AS = None
+CUMULATIVE_GPX_FRAME_SAVE_AS = None
+ROLLING_GPX_ANIMATION_SAVE_AS = None
+ROLLING_GPX_FRAME_SAVE_AS = None
+
 # per heatmap
 GPX_SCALE = 250  # meters per pixel (approx.)
 GPX_BACKGROUND = "black"  # output image background
@@ -56,25 +123,43 @@ GPX_RADIUS = 3  # point radius, default is 5
 GPX_KERNEL = "linear"
 GPX_PROJECTION = "mercator"
 GPX_GRADIENT = None
-if heatmap:
-    GPX_HSVA_MIN = heatmap.ColorMap().DEFAULT_HSVA_MIN_STR
-    GPX_HSVA_MAX = heatmap.ColorMap().DEFAULT_HSVA_MAX_STR
-else:
-    GPX_HSVA_MIN = None
-    GPX_HSVA_MAX = None
+# same as heatmap.ColorMap.DEFAULT_HSVA_MIN_STR and ...MAX_STR, but copied here
+# so the heatmap library doesn't need to be imported to read the defaults
+GPX_HSVA_MIN = "000ffff00"
+GPX_HSVA_MAX = "02affffff"
 GPX_EXTENT = None
 GPX_BACKGROUND_IMAGE = None
+# map tiles to draw heatmaps over, as a URL or local path template with {z},
+# {x}, and {y}; e.g. "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+GPX_TILES = None
+# limits on the size of heatmap images; None for no limit
+GPX_MAX_PIXELS = 64_000_000
+GPX_MAX_MEMORY = 512  # in MB
+# for heatmaps over those limits: "clip" to where most of the points are (only
+# without an extent), then raise the scale as needed; or only "scale"
+GPX_OVERSIZE = "clip"
+# smaller copies of each heatmap image (e.g. for ``srcset``), as how many times
+# smaller each way; e.g. [2, 4] for half and quarter size. Saved as the image
+# is, with their width added (e.g. "abc-640w.png")
+GPX_VARIANTS = None
 
 
 def test_enabled(log=True):
-    if heatmap:
+    """
+    Check the libraries needed to draw heatmaps are available.
+
+    This only looks for the libraries, rather than importing them, so it is
+    cheap to call at startup. They are imported the first time they are
+    needed.
+    """
+    try:
+        heatmap_spec = find_spec("numpy") and find_spec("PIL")
+    except ImportError:
+        heatmap_spec = None
+
+    if heatmap_spec:
         if log:
-            logger.info(
-                "%s enabled, version %s, heatmap version %s",
-                LOG_PREFIX,
-                __version__,
-                heatmap.__version__,
-            )
+            logger.info("%s enabled, version %s", LOG_PREFIX, __version__)
         return True
     else:
         if log:
@@ -1,5 +1,9 @@
+import re
+
 from pelican.contents import Content
 
+_TRIMMED_ATTRIBUTE = re.compile(r"gpx_(?P<heatmap>.+)_trimmed")
+
 
 class GPX(Content):
     mandatory_properties = ("title", "date")
@@ -9,3 +13,66 @@ class GPX(Content):
     )
     default_status = "published"
     default_template = "article"
+
+    def trimmed(self, heatmap, keep=True):
+        """
+        GPX XML, trimmed to the extent of `heatmap`.
+
+        Only done the first time it is asked for, and then kept until
+        `release()` (and not cached between builds), unless `keep` is False.
+        """
+        trimmed = self.__dict__.setdefault("_trimmed", {})
+        if heatmap in trimmed:
+            return trimmed[heatmap]
+
+        from .gpx import trimmed_xml
+
+        xml = trimmed_xml(self._content, heatmap, self.settings)
+        if keep:
+            trimmed[heatmap] = xml
+        return xml
+
+    def heatmap_points(self, heatmap):
+        """
+        Track points (as `points.TrackPoints`), trimmed to the extent of
+        `heatmap`.
+
+        Kept until `release()`, as `trimmed()` is, so the points (and their
+        projections) are shared by every image they are drawn in.
+        """
+        points = self.__dict__.setdefault("_heatmap_points", {})
+        if heatmap not in points:
+            from .gpx import clip_points
+
+            points[heatmap] = clip_points(
+                self.gpx_point_data, self.settings["GPX_HEATMAPS"][heatmap]
+            )
+        return points[heatmap]
+
+    def release(self, heatmap):
+        """
+        Drop the trimmed GPX and track points kept for `heatmap`. They are
+        made again if they are asked for after this.
+        """
+        self.__dict__.get("_trimmed", {}).pop(heatmap, None)
+        self.__dict__.get("_heatmap_points", {}).pop(heatmap, None)
+
+    def __getattr__(self, name):
+        # ``gpx_{heatmap}_trimmed``, as it was available before trimming was
+        # deferred
+        match = _TRIMMED_ATTRIBUTE.fullmatch(name)
+        if (
+            match
+            and "settings" in self.__dict__
+            and match["heatmap"] in self.settings["GPX_HEATMAPS"]
+        ):
+            return self.trimmed(match["heatmap"])
+        raise AttributeError(
+            f"{self.__class__.__name__!r} object has no attribute {name!r}"
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_trimmed", None)
+        state.pop("_heatmap_points", None)
+        return state
@@ -1,2 +1,6 @@
 class TooShortGPXException(ValueError):
     """GPX has less than 2 points, and so won't generate a heatmap cleanly."""
+
+
+class OverBudgetGPXException(RuntimeError):
+    """GPX file is too large, or took too long, to read; see `budget`."""
@@ -0,0 +1,73 @@
+"""
+Opening GPX source files, which may be compressed or bundled in a zip file.
+"""
+
+import bz2
+import gzip
+import lzma
+from pathlib import Path
+import zipfile
+
+# single GPX file, compressed
+_DECOMPRESSORS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+GPX_FILE_EXTENSIONS = [
+    "gpx",
+    "gpx.gz",
+    "gpx.bz2",
+    "gpx.xz",
+    "zip",  # any number of GPX files, read together
+]
+
+
+def is_gpx_path(path):
+    """Does the filename look like a GPX file we can read?"""
+    name = Path(path).name.lower()
+    return any(name.endswith(f".{ext}") for ext in GPX_FILE_EXTENSIONS)
+
+
+def gpx_stem(path):
+    """
+    Filename, without the GPX or compression extensions.
+
+    e.g. ``20200221.gpx.gz`` becomes ``20200221``.
+    """
+    name = Path(path).name
+    for ext in sorted(GPX_FILE_EXTENSIONS, key=len, reverse=True):
+        if name.lower().endswith(f".{ext}"):
+            return name[: -(len(ext) + 1)]
+    return Path(path).stem
+
+
+def open_gpx_files(path):
+    """
+    Yield each GPX document in `path`, as a (binary) file object.
+
+    Compressed files are decompressed as they are read, rather than being
+    expanded in full first. A zip file yields each of the GPX files it
+    contains, in turn. Each file object is closed when the next one is asked
+    for.
+
+    Yields:
+        (str, file object): name of the GPX document, and its contents
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(".gpx"):
+                    continue
+                with archive.open(member) as f:
+                    yield member.filename, f
+    elif suffix in _DECOMPRESSORS:
+        with _DECOMPRESSORS[suffix](path, "rb") as f:
+            yield path.name, f
+    else:
+        with open(path, "rb") as f:
+            yield path.name, f
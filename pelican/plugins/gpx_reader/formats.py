@@ -0,0 +1,182 @@
+"""
+Compact, web-friendly encodings of track points.
+
+All of these work directly from point arrays (see `points.TrackPoints`), and
+never go through XML.
+
+Coordinates are quantized to `precision` decimal places (5 is about 1 m).
+
+Binary format
+-------------
+
+All integers are unsigned LEB128 varints; signed values are zigzag encoded
+first.
+
+- magic ``b"GPXB"``, then one byte each of format version (1) and precision
+- number of segments
+- for each segment: number of points, then for each point, the change in
+  latitude and then in longitude (as quantized integers) from the previous
+  point of the segment (the first point is relative to 0, 0)
+"""
+
+import json
+
+import numpy as np
+
+BINARY_MAGIC = b"GPXB"
+BINARY_VERSION = 1
+
+
+def _quantize(segment, precision):
+    """(N, 2) array of floats to (N, 2) array of integers."""
+    return np.round(segment * 10**precision).astype(np.int64)
+
+
+def _zigzag(values):
+    """Map signed integers to unsigned, so small negatives stay small."""
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _chunk(values, bits, continuation, offset):
+    """
+    Split unsigned integers into `bits`-sized chunks, least significant first.
+
+    Every chunk, except the last of each value, is flagged with
+    `continuation`, and then `offset` is added to every chunk. Done for all
+    values at once, rather than value by value.
+
+    Returns:
+        bytes
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+
+    max_chunks = -(-64 // bits)
+    shifts = np.arange(max_chunks, dtype=np.uint64) * np.uint64(bits)
+    shifted = values[:, None] >> shifts[None, :]
+    chunks = shifted & np.uint64((1 << bits) - 1)
+
+    # the first chunk is always used; later ones only if there is something
+    # left to encode
+    used = shifted > 0
+    used[:, 0] = True
+    more = np.zeros_like(used)
+    more[:, :-1] = used[:, 1:]
+
+    chunks = (chunks | np.where(more, np.uint64(continuation), np.uint64(0))) + offset
+    return chunks[used].astype(np.uint8).tobytes()
+
+
+def _varints(values):
+    return _chunk(values, bits=7, continuation=0x80, offset=np.uint64(0))
+
+
+def to_geojson(tracks, precision=5):
+    """
+    GeoJSON FeatureCollection, with one MultiLineString Feature per track.
+
+    Args:
+        tracks: iterable of (properties dict, TrackPoints)
+        precision (int): decimal places kept for each coordinate
+
+    Returns:
+        str
+    """
+    features = []
+    for properties, points in tracks:
+        lines = [
+            # GeoJSON is (longitude, latitude)
+            np.round(segment[:, ::-1], precision).tolist()
+            for segment in points.segment_coordinates()
+        ]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": properties,
+                "geometry": {"type": "MultiLineString", "coordinates": lines},
+            }
+        )
+
+    return json.dumps(
+        {"type": "FeatureCollection", "features": features},
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def encode_polyline(segment, precision=5):
+    """
+    Encode one segment with Google's Encoded Polyline Algorithm.
+
+    Args:
+        segment: (N, 2) array of (latitude, longitude)
+        precision (int): decimal places kept for each coordinate
+
+    Returns:
+        str
+    """
+    quantized = _quantize(segment, precision)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    # Google's version of zigzag: invert negatives after shifting
+    values = deltas.ravel() << 1
+    values = np.where(deltas.ravel() < 0, ~values, values).astype(np.uint64)
+    return _chunk(values, bits=5, continuation=0x20, offset=np.uint64(63)).decode(
+        "ascii"
+    )
+
+
+def to_polylines(tracks, precision=5):
+    """
+    Encoded polylines, one segment per line.
+
+    Args:
+        tracks: iterable of (properties dict, TrackPoints). The properties
+            are not used.
+        precision (int): decimal places kept for each coordinate
+
+    Returns:
+        str
+    """
+    return "\n".join(
+        encode_polyline(segment, precision)
+        for _, points in tracks
+        for segment in points.segment_coordinates()
+    )
+
+
+def to_binary(tracks, precision=5):
+    """
+    Delta and varint encoded points. See the module docstring for the layout.
+
+    Args:
+        tracks: iterable of (properties dict, TrackPoints). The properties
+            are not used.
+        precision (int): decimal places kept for each coordinate
+
+    Returns:
+        bytes
+    """
+    segments = [
+        segment for _, points in tracks for segment in points.segment_coordinates()
+    ]
+
+    parts = [
+        BINARY_MAGIC,
+        bytes((BINARY_VERSION, precision)),
+        _varints([len(segments)]),
+    ]
+    for segment in segments:
+        quantized = _quantize(segment, precision)
+        deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+        parts.append(_varints([len(segment)]))
+        parts.append(_varints(_zigzag(deltas.ravel())))
+    return b"".join(parts)
+
+
+# name (as used in settings and metadata keys) -> encoder
+DATA_FORMATS = {
+    "geojson": to_geojson,
+    "polyline": to_polylines,
+    "binary": to_binary,
+}
@@ -1,20 +1,29 @@
+from bisect import bisect_right
 import calendar
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import partial
 from itertools import groupby
 import logging
 from operator import attrgetter
-from pathlib import Path
+import os
 
-from pelican.generators import ArticlesGenerator, CachingGenerator
+from pelican.cache import FileStampDataCacher
+from pelican.generators import ArticlesGenerator, CachingGenerator, Generator
+from pelican.readers import Readers
 from pelican.utils import order_content
 
+try:
+    from pelican.utils import is_selected_for_writing
+except ImportError:
+    # function was removed in Pelican 4.9.0
+    is_selected_for_writing = lambda _1, _2: True
+
 from . import signals
 from .constants import LOG_PREFIX
 from .contents import GPX as GPXContent
-from .gpx import combine_gpx
+from .exceptions import OverBudgetGPXException
+from .files import is_gpx_path
 from .hasher import gpx_hash
-from .heatmap import generate_heatmap
 
 logger = logging.getLogger(__name__)
 gpx_count = 0
@@ -31,6 +40,29 @@ period_date_key = {
 }
 
 
+def period_start(date, period):
+    """First day of the `period` ("year", "month", "week", or "day") of `date`."""
+    if period == "year":
+        return date.replace(month=1, day=1)
+    elif period == "month":
+        return date.replace(day=1)
+    elif period == "week":
+        # ISO weeks, as for WEEK_GPX_SAVE_AS, start on Monday
+        return date - timedelta(days=date.weekday())
+    return date
+
+
+def next_period_start(start, period):
+    """First day of the `period` after the one starting on `start`."""
+    if period == "year":
+        return start.replace(year=start.year + 1)
+    elif period == "month":
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    return start + timedelta(days=7 if period == "week" else 1)
+
+
 class GPXArticleGenerator(ArticlesGenerator):
     def generate_pages(self, writer):
         """Generate the pages on the disk"""
@@ -51,15 +83,105 @@ class GPXArticleGenerator(ArticlesGenerator):
         # self.generate_drafts(write)
 
 
+class GPXReaders(Readers):
+    """
+    Pelican's `Readers`, with file stamps (for the reader level cache) that
+    also cover the settings used to read GPX files, as `GPXGenerator`'s do.
+    """
+
+    def __init__(self, settings, cache_name, track_fingerprint):
+        self.track_fingerprint = track_fingerprint
+        super().__init__(settings, cache_name)
+
+    def _get_file_stamp(self, filename):
+        return super()._get_file_stamp(filename), self.track_fingerprint
+
+
 class GPXGenerator(CachingGenerator):
     def __init__(self, *args, **kwargs):
         """initialize properties"""
+        from .cache import (
+            BasemapCache,
+            HeatmapImageCache,
+            SourceDigestIndex,
+            track_fingerprint,
+        )
+
         self.gpxes = []
         self.dates = {}
 
-        super().__init__(*args, **kwargs)
+        # As `CachingGenerator.__init__()`, but with `GPXReaders`. Pelican's
+        # own `Readers` is made without a cache, so the reader level cache is
+        # only loaded once.
+        cls_name = self.__class__.__name__
+        Generator.__init__(self, *args, readers_cache_name="", **kwargs)
+        self.track_fingerprint = track_fingerprint(self.settings)
+        self.readers = GPXReaders(
+            self.settings, f"{cls_name}-Readers", self.track_fingerprint
+        )
+
+        cache_this_level = self.settings["CONTENT_CACHING_LAYER"] == "generator"
+        FileStampDataCacher.__init__(
+            self,
+            self.settings,
+            cls_name,
+            caching_policy=cache_this_level and self.settings["CACHE_CONTENT"],
+            load_policy=cache_this_level and self.settings["LOAD_CONTENT_CACHE"],
+        )
+
+        self.heatmap_cache = HeatmapImageCache(self.settings)
+        self.basemap_cache = BasemapCache(self.settings)
+        self.digest_index = SourceDigestIndex(self.settings)
+
         signals.gpx_generator_init.send(self)
 
+    def _get_file_stamp(self, filename):
+        """
+        File stamp for the cache.
+
+        Also covers the settings used to read the file, so cached results are
+        dropped when those change.
+        """
+        return super()._get_file_stamp(filename), self.track_fingerprint
+
+    def _include_path(self, path, extensions=None):
+        """
+        Inclusion logic for `.get_files()`.
+
+        GPX files can have multiple extensions (e.g. ``.gpx.gz``), which
+        Pelican's default extension check can't match, and we don't want to
+        register the compression extensions with Pelican for every generator.
+        """
+        return super()._include_path(path, extensions=False) and is_gpx_path(path)
+
+    def source_files(self):
+        """
+        GPX source files, relative to the content path.
+
+        Files with exactly the same contents as another (e.g. the same track
+        exported twice) are skipped, before they are read, keeping the first
+        (by path).
+        """
+        files = {}
+        for fn in sorted(
+            self.get_files(
+                self.settings["GPX_PATHS"], exclude=self.settings["GPX_EXCLUDES"]
+            )
+        ):
+            digest = self.digest_index.digest(os.path.join(self.path, fn))
+            files.setdefault(digest, []).append(fn)
+        self.digest_index.save()
+
+        for copies in files.values():
+            if len(copies) > 1:
+                logger.info(
+                    "%s Skipping %s, same as %s",
+                    LOG_PREFIX,
+                    ", ".join(copies[1:]),
+                    copies[0],
+                )
+        return [copies[0] for copies in files.values()]
+
     def generate_context(self):
         """
         Called by Pelican to fill context.
@@ -69,9 +191,7 @@ class GPXGenerator(CachingGenerator):
         """
         all_gpxes = []
 
-        for fn in self.get_files(
-            self.settings["GPX_PATHS"], exclude=self.settings["GPX_EXCLUDES"]
-        ):
+        for fn in self.source_files():
             gpx = self.get_cached_data(fn, None)
             if gpx is None:
                 try:
@@ -86,6 +206,11 @@ class GPXGenerator(CachingGenerator):
                         context_signal=signals.gpx_generator_context,
                         context_sender=self,
                     )
+                except OverBudgetGPXException as e:
+                    # not cached, so it is tried again if the limits change
+                    logger.warning("%s Skipping %s: %s", LOG_PREFIX, fn, e)
+                    self._add_failed_source_path(fn)
+                    continue
                 except Exception as e:
                     logger.error(
                         "Could not process %s\n%s",
@@ -100,12 +225,17 @@ class GPXGenerator(CachingGenerator):
                     self._add_failed_source_path(fn)
                     continue
 
+                self._refresh_heatmaps(fn, gpx)
+                self.cache_data(fn, gpx)
+            elif self._refresh_heatmaps(fn, gpx):
                 self.cache_data(fn, gpx)
 
             all_gpxes.append(gpx)
             self.add_source_path(gpx)
 
-        self.gpxes = order_content(all_gpxes)
+        from .overlaps import resolve_overlaps
+
+        self.gpxes = order_content(resolve_overlaps(all_gpxes, self.settings))
 
         self.dates = list(self.gpxes)
         self.dates.sort(
@@ -120,7 +250,151 @@ class GPXGenerator(CachingGenerator):
         gpx_count = len(self.gpxes)
         signals.gpx_generator_finalized.send(self)
 
+    def _refresh_heatmaps(self, fn, gpx):
+        """
+        Redo the heatmap metadata of a cached GPX file, for each heatmap that
+        has been added, or had its extent changed, since it was cached.
+
+        Only the (cached) point data is needed, rather than reading the source
+        file again.
+
+        Returns:
+            bool: if anything was redone
+        """
+        from .cache import clip_fingerprint
+
+        if not getattr(gpx, "valid", False):
+            return False
+
+        stale = [
+            heatmap
+            for heatmap, heatmap_settings in self.settings["GPX_HEATMAPS"].items()
+            if getattr(gpx, f"gpx_{heatmap}_fingerprint", None)
+            != clip_fingerprint(heatmap_settings)
+        ]
+        if not stale:
+            return False
+
+        from .gpx import heatmap_metadata
+
+        logger.debug(
+            "%s Re-trimming %s for heatmap(s): %s", LOG_PREFIX, fn, ", ".join(stale)
+        )
+        new_metadata = {}
+        for heatmap in stale:
+            new_metadata.update(
+                heatmap_metadata(
+                    gpx.gpx_point_data, heatmap, gpx.metadata, self.settings
+                )
+            )
+
+        gpx.metadata.update(new_metadata)
+        for key, value in new_metadata.items():
+            setattr(gpx, key, value)
+
+        # keep the reader level cache in step
+        path = os.path.abspath(os.path.join(self.path, fn))
+        content, metadata = self.readers.get_cached_data(path, (None, None))
+        if metadata is not None:
+            self.readers.cache_data(path, (content, {**metadata, **new_metadata}))
+
+        return True
+
+    def _heatmap_points(self, gpx_article, heatmap):
+        """Points (as `TrackPoints`) of `gpx_article`, trimmed for `heatmap`."""
+        return gpx_article.heatmap_points(heatmap)
+
+    def _encode_points(self, data_format, gpx_articles, heatmap):
+        """
+        Encode the points of `gpx_articles` (trimmed for `heatmap`).
+
+        Args:
+            data_format (str): a key of `formats.DATA_FORMATS`
+        """
+        from .formats import DATA_FORMATS
+
+        return DATA_FORMATS[data_format](
+            (
+                (
+                    {"slug": x.slug, "date": x.date.isoformat()},
+                    self._heatmap_points(x, heatmap),
+                )
+                for x in gpx_articles
+            ),
+            precision=self.settings["GPX_COORDINATE_PRECISION"],
+        )
+
+    def _combinable(self, gpxes):
+        """
+        GPX files to use for combined (period) files, heatmaps, and
+        animations: with a ``GPX_OVERLAPS`` of "exclude-combined", each trip
+        only once (see `overlaps.resolve_overlaps()`).
+        """
+        if self.settings["GPX_OVERLAPS"] == "exclude-combined":
+            return [x for x in gpxes if x.gpx_overlap_of is None]
+        return list(gpxes)
+
+    def _will_write(self, save_as):
+        """Will anything be written to `save_as` (i.e. it is set, and selected)?"""
+        return bool(save_as) and is_selected_for_writing(
+            self.settings, os.path.join(self.output_path, save_as)
+        )
+
+    def _cached_heatmap_images(self, heatmap_save_as, heatmap):
+        """
+        Heatmap image, and its variants, from the heatmap cache, or None
+        unless they are all there. See `_heatmap_images()`.
+        """
+        image = self.heatmap_cache.get(heatmap_save_as, heatmap)
+        if image is None:
+            return None
+
+        images = {heatmap_save_as: image}
+        heatmap_settings = self.settings["GPX_HEATMAPS"][heatmap]
+        if heatmap_settings["variants"]:
+            from .heatmap import variant_factors, variant_save_as
+
+            for factor in variant_factors(heatmap_settings):
+                name = variant_save_as(
+                    heatmap_save_as, (image.height, image.width), factor
+                )
+                images[name] = self.heatmap_cache.get(name, heatmap)
+                if images[name] is None:
+                    return None
+        return images
+
+    def _heatmap_images(self, heatmap_save_as, heatmap, tracks):
+        """
+        Heatmap image, and its variants (smaller copies; see the ``variants``
+        heatmap setting), by what they are saved as.
+
+        Taken from the heatmap cache if possible, and otherwise drawn (once,
+        for all the sizes) and added to the cache.
+
+        Args:
+            heatmap_save_as (str):
+            heatmap (str): heatmap name
+            tracks: function that returns the track points (as
+                `points.TrackPoints`) to draw. Only called if the images
+                aren't cached.
+        """
+        images = self._cached_heatmap_images(heatmap_save_as, heatmap)
+        if images is None:
+            from .heatmap import generate_heatmap_variants
+
+            images = generate_heatmap_variants(
+                tracks(),
+                self.settings["GPX_HEATMAPS"][heatmap],
+                heatmap_save_as,
+                basemaps=self.basemap_cache,
+            )
+            for name, image in images.items():
+                self.heatmap_cache.put(name, heatmap, image)
+        return images
+
     def generate_gpxes(self, heatmap, writer):
+        from .formats import DATA_FORMATS
+
         for gpx_article in self.gpxes:
             signals.gpx_generator_write_gpx.send(
                 self, content=gpx_article.content, heatmap=heatmap
@@ -136,33 +410,51 @@ class GPXGenerator(CachingGenerator):
 
             xml_save_as = getattr(gpx_article, f"gpx_{heatmap}_save_as")
             heatmap_save_as = getattr(gpx_article, f"gpx_{heatmap}_image")
-            xml = getattr(gpx_article, f"gpx_{heatmap}_trimmed")
 
-            if xml:
+            # the trimmed GPX is only made if something needs it
+            if self._will_write(xml_save_as):
                 writer.write_xml(
                     name=xml_save_as,
                     template=None,
                     context=self.context.copy(),
-                    xml=xml,
+                    xml=gpx_article.trimmed(heatmap),
                     gpx=gpx_article,
                     heatmap=heatmap,
                 )
 
-                writer.write_image(
-                    name=heatmap_save_as,
-                    template=None,
-                    context=self.context.copy(),
-                    image=generate_heatmap(
-                        Path(self.output_path).resolve() / xml_save_as,
-                        self.settings["GPX_HEATMAPS"][heatmap],
-                    ),
+            if self._will_write(heatmap_save_as):
+                for name, image in self._heatmap_images(
+                    heatmap_save_as,
+                    heatmap,
+                    lambda: [self._heatmap_points(gpx_article, heatmap)],
+                ).items():
+                    writer.write_image(
+                        name=name,
+                        template=None,
+                        context=self.context.copy(),
+                        image=image,
+                    )
+
+            for data_format in DATA_FORMATS:
+                data_save_as = getattr(
+                    gpx_article, f"gpx_{heatmap}_{data_format}_save_as"
                 )
+                if self._will_write(data_save_as):
+                    writer.write_data(
+                        name=data_save_as,
+                        template=None,
+                        context=self.context.copy(),
+                        data=self._encode_points(data_format, [gpx_article], heatmap),
+                        gpx=gpx_article,
+                        heatmap=heatmap,
+                    )
 
     def _geneate_one_period_inner(
         self,
         gpxes,
         xml_save_as_setting,
         heatmap_save_as_setting,
+        data_save_as_settings,
         date,
         gpx_log_name,
         heatmap_key,
@@ -180,6 +472,9 @@ class GPXGenerator(CachingGenerator):
                 need to be combined
             save_as_setting (str): the setting that is used to determine where
                 to save the combined file
+            data_save_as_settings (dict): {data format: setting} used to
+                determine where to save the combined file in each of the
+                compact formats (see `formats.DATA_FORMATS`)
             date (datetime.datetime): applied to `save_as_setting` to get final
                 filename
             gpx_log_name (str): used in logging to refer to this run
@@ -190,15 +485,20 @@ class GPXGenerator(CachingGenerator):
             writer (pelican.writers.Writer): class that does the actual write
                 to disk
         """
-        combined_gpx = combine_gpx(
-            [
-                getattr(x, f"gpx_{heatmap_key}_trimmed")
-                for x in gpxes
-                if getattr(x, "valid")
-            ],
-            f"{gpx_log_name} ({heatmap_key})",
-        )
-        my_hash = gpx_hash(combined_gpx.to_xml())
+        from .gpx import stream_combined_gpx
+
+        valid_gpxes = [x for x in gpxes if getattr(x, "valid")]
+        if not valid_gpxes:
+            # e.g. only too-short GPX files in this period
+            return
+
+        # the hash of the combined tracks, from the hash of each track (a
+        # single track keeps its own hash, so its outputs are shared)
+        track_hashes = [getattr(x, f"gpx_{heatmap_key}_hash") for x in valid_gpxes]
+        if len(track_hashes) == 1:
+            my_hash = track_hashes[0]
+        else:
+            my_hash = gpx_hash("".join(track_hashes))
         xml_save_as = xml_save_as_setting.format(
             date=date,
             heatmap=heatmap_key,
@@ -213,30 +513,46 @@ class GPXGenerator(CachingGenerator):
         local_context["period"] = context_period
         local_context["period_num"] = context_period_number
 
-        if combined_gpx:
+        # The combined GPX is only made if something needs it, and then as a
+        # stream, one track at a time, so it is never all in memory at once.
+        if self._will_write(xml_save_as):
             writer.write_xml(
                 name=xml_save_as,
                 template=None,
                 context=local_context,
-                xml=combined_gpx.to_xml(),
+                xml=stream_combined_gpx(
+                    (x.trimmed(heatmap_key, keep=False) for x in valid_gpxes),
+                    f"{gpx_log_name} ({heatmap_key})",
+                ),
             )
 
-            if Path(heatmap_save_as).exists():
-                logger(
-                    "%s Image already exists: %s (for %s)",
-                    LOG_PREFIX,
-                    heatmap_save_as,
-                    xml_save_as,
-                )
-            else:
+        if self._will_write(heatmap_save_as):
+            for name, image in self._heatmap_images(
+                heatmap_save_as,
+                heatmap_key,
+                lambda: (self._heatmap_points(x, heatmap_key) for x in valid_gpxes),
+            ).items():
                 writer.write_image(
-                    name=heatmap_save_as,
+                    name=name,
                     template=None,
                     context=local_context,
-                    image=generate_heatmap(
-                        Path(self.output_path).resolve() / xml_save_as,
-                        self.settings["GPX_HEATMAPS"][heatmap_key],
-                    ),
+                    image=image,
+                )
+
+        for data_format, data_save_as_setting in data_save_as_settings.items():
+            if not data_save_as_setting:
+                continue
+            data_save_as = data_save_as_setting.format(
+                date=date,
+                heatmap=heatmap_key,
+                hash=my_hash,
+            )
+            if self._will_write(data_save_as):
+                writer.write_data(
+                    name=data_save_as,
+                    template=None,
+                    context=local_context,
+                    data=self._encode_points(data_format, valid_gpxes, heatmap_key),
                 )
 
     def _generate_one_period(
@@ -246,6 +562,7 @@ class GPXGenerator(CachingGenerator):
         heatmap_key,
         xml_save_as_setting,
         heatmap_save_as_setting,
+        data_save_as_settings,
         writer,
     ):
         """
@@ -261,6 +578,7 @@ class GPXGenerator(CachingGenerator):
                 gpxes=dates,
                 xml_save_as_setting=xml_save_as_setting,
                 heatmap_save_as_setting=heatmap_save_as_setting,
+                data_save_as_settings=data_save_as_settings,
                 date=dates[0].date,
                 gpx_log_name="all",
                 heatmap_key=heatmap_key,
@@ -295,6 +613,7 @@ class GPXGenerator(CachingGenerator):
                     gpxes=gpxes,
                     xml_save_as_setting=xml_save_as_setting,
                     heatmap_save_as_setting=heatmap_save_as_setting,
+                    data_save_as_settings=data_save_as_settings,
                     date=archive[0].date,
                     gpx_log_name=gpx_log_name,
                     heatmap_key=heatmap_key,
@@ -311,6 +630,8 @@ class GPXGenerator(CachingGenerator):
         Generate per-year, (per-quarter), per-month, per-week, and per-day
         combined GPX files.
         """
+        from .formats import DATA_FORMATS
+
         period_save_as = {
             "all": self.settings["ALL_GPX_SAVE_AS"],
             "year": self.settings["YEAR_GPX_SAVE_AS"],
@@ -328,13 +649,131 @@ class GPXGenerator(CachingGenerator):
             "day": self.settings["DAY_GPX_IMAGE_SAVE_AS"],
         }
 
+        period_data_save_as = {
+            period: {
+                data_format: self.settings[
+                    f"{period.upper()}_GPX_{data_format.upper()}_SAVE_AS"
+                ]
+                for data_format in DATA_FORMATS
+            }
+            for period in period_save_as.keys()
+        }
+
+        dates = self._combinable(self.dates)
+
         for period in period_save_as.keys():
             xml_save_as = period_save_as[period]
             heatmap_save_as = period_heatmap_save_as[period]
-            if xml_save_as:
+            data_save_as = period_data_save_as[period]
+            if xml_save_as or any(data_save_as.values()):
                 key = period_date_key[period]
                 self._generate_one_period(
-                    self.dates, key, heatmap, xml_save_as, heatmap_save_as, writer
+                    dates,
+                    key,
+                    heatmap,
+                    xml_save_as,
+                    heatmap_save_as,
+                    data_save_as,
+                    writer,
+                )
+
+    def generate_animations(self, heatmap, writer):
+        """
+        Generate heatmap animations, with a frame per GPX_ANIMATION_PERIOD
+        (including those without any tracks), showing either everything up to
+        then ("cumulative"), or the last GPX_ANIMATION_WINDOW days ("rolling").
+
+        Each period's tracks are drawn once, for all the frames of both; see
+        `heatmap.AnimatedHeatmap`. Frames saved as images are written as they
+        are made, but the frames of an animation are all kept (as full size
+        RGBA images) until it is written, as Pillow saves them together: a
+        few years of months, at 1000 x 1000, is a few hundred MB.
+        """
+        period = self.settings["GPX_ANIMATION_PERIOD"]
+        window = self.settings["GPX_ANIMATION_WINDOW"]
+        kinds = {}
+        for kind in ("cumulative", "rolling"):
+            animation_save_as = self.settings[f"{kind.upper()}_GPX_ANIMATION_SAVE_AS"]
+            frame_save_as = self.settings[f"{kind.upper()}_GPX_FRAME_SAVE_AS"]
+            if animation_save_as:
+                animation_save_as = animation_save_as.format(heatmap=heatmap)
+            if (self._will_write(animation_save_as) or frame_save_as) and (
+                kind == "cumulative" or window
+            ):
+                kinds[kind] = (animation_save_as, frame_save_as)
+        if not kinds:
+            return
+
+        if period not in period_date_key or period == "all":
+            logger.warning(
+                "%s Unknown GPX_ANIMATION_PERIOD %r; should be one of year, "
+                "month, week, or day. Skipping animations.",
+                LOG_PREFIX,
+                period,
+            )
+            return
+
+        gpxes = self._combinable(x for x in self.dates if getattr(x, "valid"))
+        if not gpxes:
+            return
+        gpxes.sort(key=attrgetter("date"))
+
+        # the tracks of each period, in order; `start` ends up as the end of
+        # the last period
+        starts = []
+        periods = []
+        start = period_start(gpxes[0].date.date(), period)
+        index = 0
+        while index < len(gpxes):
+            end = next_period_start(start, period)
+            tracks = []
+            while index < len(gpxes) and gpxes[index].date.date() < end:
+                tracks.append(self._heatmap_points(gpxes[index], heatmap))
+                index += 1
+            starts.append(start)
+            periods.append(tracks)
+            start = end
+        ends = starts[1:] + [start]
+
+        from .heatmap import draw_animation
+
+        animation = draw_animation(
+            periods,
+            self.settings["GPX_HEATMAPS"][heatmap],
+            name=f"{heatmap} animation",
+        )
+        for kind, (animation_save_as, frame_save_as) in kinds.items():
+            if kind == "rolling":
+                # first period that ends after the start of each frame's window
+                firsts = [
+                    bisect_right(ends, end - timedelta(days=window)) for end in ends
+                ]
+            else:
+                firsts = None
+
+            frames = []
+            for start, image in zip(
+                starts, animation.make_images(firsts, basemaps=self.basemap_cache)
+            ):
+                if frame_save_as:
+                    writer.write_image(
+                        name=frame_save_as.format(date=start, heatmap=heatmap),
+                        template=None,
+                        context=self.context.copy(),
+                        image=image,
+                        heatmap=heatmap,
+                    )
+                if self._will_write(animation_save_as):
+                    frames.append(image)
+
+            if frames:
+                writer.write_animation(
+                    name=animation_save_as,
+                    template=None,
+                    context=self.context.copy(),
+                    frames=frames,
+                    duration=self.settings["GPX_ANIMATION_FRAME_DURATION"],
+                    heatmap=heatmap,
                 )
 
     def generate_output(self, writer):
@@ -344,6 +783,11 @@ class GPXGenerator(CachingGenerator):
         for heatmap in self.settings["GPX_HEATMAPS"].keys():
             self.generate_gpxes(heatmap=heatmap, writer=writer)
             self.generate_period_gpxes(heatmap=heatmap, writer=writer)
+            self.generate_animations(heatmap=heatmap, writer=writer)
+            # everything for this heatmap has been written, so its trimmed
+            # tracks aren't needed again (unless a template asks for them)
+            for gpx_article in self.gpxes:
+                gpx_article.release(heatmap)
 
         signals.gpx_writer_finalized.send(self, writer=writer)
 
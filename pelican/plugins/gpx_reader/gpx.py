@@ -2,10 +2,14 @@
 GPX functionality that isn't directly tied to a piece of the Pelican system.
 """
 
-from datetime import datetime
+import copy
+from datetime import datetime, timedelta
+from functools import cache
 import logging
+import re
 
 import gpxpy
+import numpy as np
 from pytz import timezone
 
 try:
@@ -18,39 +22,338 @@ except ImportError:
 
 from .constants import INDENT, LOG_PREFIX
 from .exceptions import TooShortGPXException
-from .hasher import gpx_hash
+from .files import gpx_stem, open_gpx_files
+from .formats import DATA_FORMATS
+from .hasher import points_hash
+from .points import (
+    TrackPoints,
+    decimated,
+    find_stops,
+    haversine,
+    outliers,
+    to_timestamp,
+    track_statistics,
+)
+from .polygons import is_polygon_extent, load_polygon
+from .privacy import load_privacy_zones
 
 logger = logging.getLogger(__name__)
 
 
-def clean_gpx(gpx):  # clean from basic issues
+@cache
+def _timezone_finder():
+    """TimezoneFinder loads its data files when created, so only do that once."""
+    return TimezoneFinder() if TimezoneFinder else None
+
+
+# xsi:schemaLocation, as ElementTree names it
+SCHEMA_LOCATION = "{http://www.w3.org/2001/XMLSchema-instance}schemaLocation"
+
+
+def parse_gpx(f):
+    """
+    Parse a GPX document from a (binary) file object, as `gpxpy.parse()`
+    does, but without holding its text in memory.
+
+    gpxpy reads the whole document into a string (and copies it once or
+    twice more) before building the XML tree from it. Here, the tree is
+    built as the file is read (and decompressed), with the same XML library
+    gpxpy uses, and handed to gpxpy to make its objects from. The tree and
+    those objects are still all in memory at once, though.
+    """
+    from gpxpy import gpxfield, parser
+
+    etree = parser.mod_etree
+    gpx = gpxpy.gpx.GPX()
+    # gpxpy drops the default namespace (that of GPX itself) from the tags
+    default_namespace = None
+    options = {"remove_comments": True} if parser.library() == "LXML" else {}
+    try:
+        parsing = etree.iterparse(f, events=("start-ns",), **options)
+        for _, (prefix, uri) in parsing:
+            if not prefix:
+                gpx.nsmap["defaultns"] = uri
+                if default_namespace is None:
+                    default_namespace = uri
+                continue
+            gpx.nsmap[prefix] = uri
+            etree.register_namespace(
+                f"noglobal_{prefix}" if prefix.startswith("ns") else prefix, uri
+            )
+        root = parsing.root
+    except Exception as e:
+        raise gpxpy.gpx.GPXXMLSyntaxException(f"Error parsing XML: {e}", e)
+
+    if default_namespace is not None:
+        qualifier = f"{{{default_namespace}}}"
+        for element in root.iter():
+            if isinstance(element.tag, str) and element.tag.startswith(qualifier):
+                element.tag = element.tag[len(qualifier) :]
+    if root.get(SCHEMA_LOCATION):
+        gpx.schema_locations = root.get(SCHEMA_LOCATION).split()
+
+    gpxfield.gpx_fields_from_xml(gpx, root, root.get("version"))
+    return gpx
+
+
+def read_gpx(source_file):
+    """
+    Parse a GPX file, which may be compressed, or a zip of several GPX files.
+
+    Each is parsed as it is decompressed (see `parse_gpx()`). The tracks,
+    routes, and waypoints of all the GPX files in a zip file are combined.
+    """
+    gpx = None
+    for _, f in open_gpx_files(source_file):
+        gpx_data = parse_gpx(f)
+        if gpx is None:
+            gpx = gpx_data
+        else:
+            gpx.waypoints.extend(gpx_data.waypoints)
+            gpx.routes.extend(gpx_data.routes)
+            gpx.tracks.extend(gpx_data.tracks)
+    return gpx
+
+
+def clean_gpx(gpx, pelican_settings=None):  # clean from basic issues
+    """
+    Drop bad points: those without a date (actually 1970-1-1), at 0N 0E, or
+    from the (mobile) network rather than GPS; and then those that jump away
+    and back faster than ``GPX_MAX_SPEED`` (see `points.outliers()`).
+    """
+    max_speed = pelican_settings["GPX_MAX_SPEED"] if pelican_settings else None
+
+    cut = 0
     for track in gpx.tracks:
         for segment in track.segments:
-            cut_index = []
-            for index, point in enumerate(segment.points):
-                # Clear away points without a date (actually 1970-1-1)
-                if point.time == datetime(1970, 1, 1):
-                    cut_index.append(index)
+            points = segment.points
+            keep = np.array(
+                [
+                    point.time != datetime(1970, 1, 1)
+                    and not (point.latitude == 0 and point.longitude == 0)
+                    and point.source != "network"
+                    for point in points
+                ],
+                dtype=bool,
+            )
+            if max_speed and keep.sum() >= 3:
+                remaining = np.flatnonzero(keep)
+                keep[
+                    remaining[
+                        outliers(
+                            [to_timestamp(points[index].time) for index in remaining],
+                            np.array([points[index].latitude for index in remaining]),
+                            np.array([points[index].longitude for index in remaining]),
+                            max_speed,
+                        )
+                    ]
+                ] = False
 
-                # Clear point if at 0N 0E
-                if point.latitude == 0 and point.longitude == 0:
-                    cut_index.append(index)
+            if not keep.all():
+                cut += len(points) - int(keep.sum())
+                segment.points = [point for point, k in zip(points, keep) if k]
 
-                # <src>network</src>
-                if point.source == "network":
-                    cut_index.append(index)
+    logger.debug(f"{INDENT}{cut:,} 'bad' point{'s' if cut != 1 else ''} dropped.")
+
+    return gpx
+
+
+def _kept_runs(keep):
+    """
+    (start, end) of each run of points kept, and the number of runs removed,
+    of a boolean array of the points to keep.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], keep, [0]))))
+    gaps = int(~keep[0]) + int(np.count_nonzero(~keep[1:] & keep[:-1]))
+    return list(zip(edges[::2], edges[1::2])), gaps
 
-            # remove duplicates
-            cut_index = list(set(cut_index))
-            # remove points from the end of the list first
-            cut_index.sort(reverse=True)
-            for index in cut_index:
-                segment.remove_point(index)
+
+def exclude_privacy_zones(gpx, pelican_settings):
+    """
+    Remove the points inside any of the ``GPX_PRIVACY_ZONES`` (see
+    `privacy.py`): track points, waypoints, and route points. Segments and
+    routes are split where they were, so the track (or route) doesn't cross
+    the zone.
+
+    Returns:
+        (number of points removed, number of gaps: the runs of track or route
+        points removed)
+    """
+    zones = pelican_settings["GPX_PRIVACY_ZONES"]
+    if not zones:
+        return 0, 0
+
+    points = TrackPoints.from_gpx(gpx)
+    others = gpx.waypoints + [point for route in gpx.routes for point in route.points]
+    removed = load_privacy_zones(zones).contains(
+        np.concatenate((points.latitude, [point.latitude for point in others])),
+        np.concatenate((points.longitude, [point.longitude for point in others])),
+    )
+    if not removed.any():
+        return 0, 0
+
+    cut = int(removed.sum())
+    gaps = 0
+    segment_index = 0
+    for track in gpx.tracks:
+        segments = []
+        for segment in track.segments:
+            start = points.segment_starts[segment_index]
+            keep = ~removed[start : start + len(segment.points)]
+            segment_index += 1
+            if keep.all():
+                segments.append(segment)
+                continue
+
+            # runs of points kept, each a segment of its own
+            runs, segment_gaps = _kept_runs(keep)
+            gaps += segment_gaps
+            for run_start, run_end in runs:
+                segments.append(
+                    gpxpy.gpx.GPXTrackSegment(points=segment.points[run_start:run_end])
+                )
+        track.segments = segments
+
+    start = len(points)
+    waypoints_removed = removed[start : start + len(gpx.waypoints)]
+    gpx.waypoints = [
+        waypoint
+        for waypoint, waypoint_removed in zip(gpx.waypoints, waypoints_removed)
+        if not waypoint_removed
+    ]
+
+    start += len(waypoints_removed)
+    routes = []
+    for route in gpx.routes:
+        keep = ~removed[start : start + len(route.points)]
+        start += len(route.points)
+        if keep.all():
+            routes.append(route)
+            continue
+
+        # runs of points kept, each a route of its own (with the same name,
+        # and so on)
+        runs, route_gaps = _kept_runs(keep)
+        gaps += route_gaps
+        for run_start, run_end in runs:
+            part = copy.copy(route)
+            part.points = route.points[run_start:run_end]
+            routes.append(part)
+    gpx.routes = routes
+
+    logger.debug(
+        f"{INDENT}{cut:,} point{'s' if cut != 1 else ''} in privacy zones "
+        f"removed, leaving {gaps:,} gap{'s' if gaps != 1 else ''}."
+    )
+    return cut, gaps
+
+
+def collapse_stops(gpx, pelican_settings):
+    """
+    Collapse the points logged while standing still (a blob of GPS jitter) to
+    a stub of two points, where the stop started and ended, both at the
+    middle of the blob.
+
+    A stop is at least ``GPX_STOP_TIME`` seconds within ``GPX_STOP_RADIUS``
+    meters (see `points.find_stops()`). Set either to None to keep all the
+    points. Segments without times are left as they are.
+
+    Returns:
+        (number of stops, total time stopped in seconds)
+    """
+    radius = pelican_settings["GPX_STOP_RADIUS"]
+    min_seconds = pelican_settings["GPX_STOP_TIME"]
+    if not (radius and min_seconds):
+        return 0, 0.0
+
+    stop_count = 0
+    stopped_s = 0.0
+    cut = 0
+    for track in gpx.tracks:
+        for segment in track.segments:
+            points = segment.points
+            if len(points) < 3:
+                continue
+            times = np.array([to_timestamp(point.time) for point in points])
+            if np.isnan(times).any():
+                continue
+            latitude = np.array([point.latitude for point in points])
+            longitude = np.array([point.longitude for point in points])
+            stops = find_stops(times, latitude, longitude, radius, min_seconds)
+            if not len(stops):
+                continue
+
+            kept = []
+            previous_end = -1
+            for start, end in stops:
+                kept.extend(points[previous_end + 1 : start])
+                middle = (
+                    float(latitude[start : end + 1].mean()),
+                    float(longitude[start : end + 1].mean()),
+                )
+                for index in (start, end):
+                    point = points[index]
+                    point.latitude, point.longitude = middle
+                    kept.append(point)
+                previous_end = end
+                stopped_s += times[end] - times[start]
+            kept.extend(points[previous_end + 1 :])
+
+            stop_count += len(stops)
+            cut += len(points) - len(kept)
+            segment.points = kept
 
     logger.debug(
-        f"{INDENT}{len(cut_index):,} 'bad' point{'s' if len(cut_index) != 1 else ''} dropped."
+        f"{INDENT}{stop_count:,} stop{'s' if stop_count != 1 else ''} collapsed, "
+        f"{cut:,} point{'s' if cut != 1 else ''} dropped."
     )
+    return stop_count, float(stopped_s)
+
 
+def decimate_gpx(gpx, pelican_settings):
+    """
+    Thin out points logged more often than needed (e.g. every second, while
+    walking), as a quick first pass before `simplify_gpx()`.
+
+    In each segment, points less than ``GPX_DECIMATE_SECONDS`` after, or less
+    than ``GPX_DECIMATE_DISTANCE`` (in meters) on from, the last point kept
+    are dropped. Either (or both) can be None, to not thin out by it; values
+    that aren't more than 0 are ignored (with a warning).
+    """
+    limits = []
+    for key in ("GPX_DECIMATE_SECONDS", "GPX_DECIMATE_DISTANCE"):
+        value = pelican_settings[key]
+        if value is not None and not value > 0:
+            logger.warning(
+                "%s %s should be more than 0, not %r. Ignoring it.",
+                LOG_PREFIX,
+                key,
+                value,
+            )
+            value = None
+        limits.append(value)
+    min_seconds, min_distance = limits
+    if not (min_seconds or min_distance):
+        return gpx
+
+    cut = 0
+    for track in gpx.tracks:
+        for segment in track.segments:
+            points = segment.points
+            if len(points) < 3:
+                continue
+            latitude = np.array([point.latitude for point in points])
+            longitude = np.array([point.longitude for point in points])
+            keep = decimated(
+                [to_timestamp(point.time) for point in points] if min_seconds else None,
+                haversine(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:]),
+                min_seconds=min_seconds,
+                min_distance=min_distance,
+            )
+            cut += len(points) - len(keep)
+            segment.points = [points[index] for index in keep]
+
+    logger.debug(f"{INDENT}Decimated, {cut:,} point{'s' if cut != 1 else ''} dropped.")
     return gpx
 
 
@@ -115,6 +418,77 @@ def combine_gpx(gpxes, log_name=None):
     return combined_gpx
 
 
+_GPX_VERSION = re.compile(r'<gpx\b[^>]*\sversion="([^"]*)"')
+
+
+def _tracks_span(xml):
+    """
+    Where the tracks are in GPX XML (as written by gpxpy).
+
+    Returns:
+        (start, end): `xml[start:end]` is every ``<trk>`` element, as whole
+        lines. If there are no tracks, both are where tracks would go.
+    """
+    start = xml.find("<trk>")
+    if start == -1:
+        start = end = xml.rfind("\n", 0, xml.rfind("</gpx>")) + 1
+        return start, end
+
+    start = xml.rfind("\n", 0, start) + 1
+    end = xml.find("\n", xml.rfind("</trk>")) + 1 or len(xml)
+    return start, end
+
+
+def stream_combined_gpx(gpxes, log_name=None):
+    """
+    Combine a series of GPX files, like `combine_gpx()`, but a piece at a time.
+
+    The first file is kept, with the tracks of the others added after its
+    own, as `combine_gpx()` does. But the files are combined as text, so only
+    one file is in memory at a time, and never as gpxpy objects. Files of a
+    different GPX version than the first are converted (on their own).
+
+    Args:
+    ----
+        gpxes: iterable of the XML of a GPX file
+        log_name: name to display in the debug log
+
+    Yields:
+        str: pieces of the combined XML
+    """
+    version = None
+    tail = None
+    file_count = 0
+
+    for raw_gpx in gpxes:
+        file_count += 1
+        if tail is None:
+            match = _GPX_VERSION.search(raw_gpx)
+            version = match[1] if match else None
+            _, end = _tracks_span(raw_gpx)
+            yield raw_gpx[:end]
+            tail = raw_gpx[end:]
+            continue
+
+        match = _GPX_VERSION.search(raw_gpx)
+        if (match[1] if match else None) != version:
+            raw_gpx = gpxpy.parse(raw_gpx).to_xml(version=version)
+        start, end = _tracks_span(raw_gpx)
+        yield raw_gpx[start:end]
+
+    if tail is not None:
+        yield tail
+
+    if log_name:
+        logger.debug(
+            "%s combined GPX for %s, from %s file%s",
+            LOG_PREFIX,
+            log_name,
+            file_count,
+            "s" if file_count != 1 else "",
+        )
+
+
 def clip_gpx(lat_1, long_1, lat_2, long_2, gpx, heatmap_name):
     """
     Trims a GPX file to bounds specified by (lat1, long1) and (lat2, long2).
@@ -164,57 +538,113 @@ def clip_gpx(lat_1, long_1, lat_2, long_2, gpx, heatmap_name):
     return gpx
 
 
-def get_start_end_times(gpx, pelican_settings):
-    if TimezoneFinder:
-        tz_finder = TimezoneFinder()
+def clip_gpx_to_polygon(polygon, gpx, heatmap_name):
+    """
+    Trims a GPX file to a polygon (a `polygons.Polygon`), keeping the points
+    just outside it that are a step away from one inside (see
+    `Polygon.trim_mask()`), and splitting segments where points were removed.
+
+    Args:
+        polygon (polygons.Polygon):
+        gpx (gpxpy.gpx):
+        heatmap_name (str): used in logging
+    """
+    cut_count = 0
+    for track in gpx.tracks:
+        segments = []
+        for segment in track.segments:
+            keep = polygon.trim_mask(
+                [point.latitude for point in segment.points],
+                [point.longitude for point in segment.points],
+            )
+            cut_count += int(np.count_nonzero(~keep))
+            # runs of points kept, each a segment of its own
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], keep, [0]))))
+            for start, end in zip(edges[::2], edges[1::2]):
+                segments.append(
+                    gpxpy.gpx.GPXTrackSegment(points=segment.points[start:end])
+                )
+        track.segments = segments
+
+    logger.debug(
+        "%sTrimmed to a polygon (%s). %s points removed.",
+        INDENT,
+        heatmap_name,
+        cut_count,
+    )
+    return gpx
+
+
+def get_start_end_times(gpx, pelican_settings, points=None):
+    """
+    Start and end times of the GPX, in the local timezone (if it can be found).
+
+    Args:
+        gpx (gpxpy.gpx):
+        pelican_settings (dict):
+        points (TrackPoints): the points of `gpx`, if they've already been
+            extracted.
+    """
+    if points is None:
+        points = TrackPoints.from_gpx(gpx)
+
+    start_time, end_time = points.time_bounds()
+    if len(points):
+        start_lat_lon = (points.latitude[0], points.longitude[0])
+        end_lat_lon = (points.latitude[-1], points.longitude[-1])
     else:
-        tz_finder = None
+        start_lat_lon = end_lat_lon = None
 
-    time_bounds = gpx.get_time_bounds()
+    return localize_times(
+        start_time, end_time, start_lat_lon, end_lat_lon, pelican_settings
+    )
 
-    # TODO: deal with gpx'es that have no tracks, or tracks with no segments,
-    #       or segments with no points
-    first_point = gpx.tracks[0].segments[0].points[0]
-    last_point = gpx.tracks[-1].segments[-1].points[-1]
 
-    if tz_finder:
+def localize_times(start_time, end_time, start_lat_lon, end_lat_lon, pelican_settings):
+    """
+    Move the start and end times to the local timezone (if it can be found).
+
+    The timezone is looked up from the given (latitude, longitude) pairs, if
+    timezonefinder is installed, and otherwise Pelican's ``TIMEZONE`` is used.
+    If neither is available, the times are left as is (likely UTC).
+    """
+    tz_finder = _timezone_finder()
+
+    tz_start = tz_end = None
+    if tz_finder and start_lat_lon and end_lat_lon:
         tz_start = timezone(
-            tz_finder.timezone_at(lng=first_point.longitude, lat=first_point.latitude)
-        )
-        tz_end = timezone(
-            tz_finder.timezone_at(lng=last_point.longitude, lat=last_point.latitude)
+            tz_finder.timezone_at(lat=start_lat_lon[0], lng=start_lat_lon[1])
         )
+        tz_end = timezone(tz_finder.timezone_at(lat=end_lat_lon[0], lng=end_lat_lon[1]))
     elif "TIMEZONE" in pelican_settings.keys():
         tz_start = tz_end = timezone(pelican_settings["TIMEZONE"])
 
-    if tz_start and tz_end:
-        start_time = time_bounds.start_time.astimezone(tz_start)
-        end_time = time_bounds.end_time.astimezone(tz_end)
-    else:
-        # likely UTC
-        start_time = time_bounds.start_time
-        end_time = time_bounds.end_time
+    if tz_start and tz_end and start_time and end_time:
+        start_time = start_time.astimezone(tz_start)
+        end_time = end_time.astimezone(tz_end)
 
     logger.debug(f"{INDENT}Start date is {start_time}")
 
     return start_time, end_time
 
 
-def generate_metadata(gpx, source_file, pelican_settings):
-    latlong_bounds = gpx.get_bounds()
-    elev_bounds = gpx.get_elevation_extremes()
-    # time_bounds = gpx.get_time_bounds()
-
-    track_count = len(gpx.tracks)
-    segment_count = 0
-    point_count = 0
-
-    for track in gpx.tracks:
-        segment_count += len(track.segments)
-        for segment in track.segments:
-            point_count += len(segment.points)
+def generate_metadata(
+    gpx, source_file, pelican_settings, stops=(0, 0.0), privacy=(0, 0)
+):
+    """
+    Args:
+        stops: (number of stops, total time stopped in seconds), as returned
+            by `collapse_stops()`
+        privacy: (number of points removed, number of gaps left), as returned
+            by `exclude_privacy_zones()`
+    """
+    points = TrackPoints.from_gpx(gpx)
+    stats = track_statistics(points, pelican_settings["GPX_STOPPED_SPEED"])
 
-    travel_length_km = gpx.length_2d() / 1000
+    track_count = stats.tracks
+    segment_count = stats.segments
+    point_count = stats.points
+    travel_length_km = stats.length_m / 1000
 
     logger.debug(
         f"{INDENT}{track_count:,} track{'s' if track_count != 1 else ''}, "
@@ -227,7 +657,7 @@ def generate_metadata(gpx, source_file, pelican_settings):
         raise TooShortGPXException(point_count)
 
     start_time, end_time = get_start_end_times(
-        gpx=gpx, pelican_settings=pelican_settings
+        gpx=gpx, pelican_settings=pelican_settings, points=points
     )
 
     metadata = {
@@ -239,20 +669,31 @@ def generate_metadata(gpx, source_file, pelican_settings):
         #     "tag_b",
         # ],
         "author": pelican_settings["GPX_AUTHOR"],
-        "slug": f"{source_file.stem}".replace(".", "-"),
+        "slug": gpx_stem(source_file).replace(".", "-"),
         "status": pelican_settings["GPX_STATUS"],
         "gpx_start_time": start_time,
         "gpx_end_time": end_time,
-        "gpx_min_elevation": elev_bounds.minimum,
-        "gpx_max_elevation": elev_bounds.maximum,
-        "gpx_min_latitude": latlong_bounds.min_latitude,
-        "gpx_min_longitude": latlong_bounds.min_longitude,
-        "gpx_max_latitude": latlong_bounds.max_latitude,
-        "gpx_max_longitude": latlong_bounds.max_longitude,
+        "gpx_min_elevation": stats.min_elevation,
+        "gpx_max_elevation": stats.max_elevation,
+        "gpx_min_latitude": stats.min_latitude,
+        "gpx_min_longitude": stats.min_longitude,
+        "gpx_max_latitude": stats.max_latitude,
+        "gpx_max_longitude": stats.max_longitude,
         "gpx_tracks": track_count,
         "gpx_segments": segment_count,
         "gpx_points": point_count,
         "gpx_length_km": travel_length_km,
+        "gpx_moving_time": timedelta(seconds=stats.moving_time_s),
+        "gpx_stops": stops[0],
+        "gpx_stopped_time": timedelta(seconds=stops[1]),
+        "gpx_privacy_points": privacy[0],
+        "gpx_privacy_gaps": privacy[1],
+        "gpx_max_speed_kmh": stats.max_speed_kmh,
+        "gpx_average_speed_kmh": stats.average_speed_kmh,
+        "gpx_elevation_gain": stats.elevation_gain_m,
+        "gpx_elevation_loss": stats.elevation_loss_m,
+        "gpx_points_per_km": stats.points_per_km,
+        "gpx_point_data": points,
         "valid": True,
     }
 
@@ -262,39 +703,117 @@ def generate_metadata(gpx, source_file, pelican_settings):
     )
 
     for heatmap in pelican_settings["GPX_HEATMAPS"].keys():
-        image_key = f"gpx_{heatmap}_image"
-        trimmed_gpx_key = f"gpx_{heatmap}_trimmed"
-        trimmed_gpx_save_as_key = f"gpx_{heatmap}_save_as"
-        trimmed_gpx_hash_key = f"gpx_{heatmap}_hash"
+        metadata.update(heatmap_metadata(points, heatmap, metadata, pelican_settings))
 
-        if pelican_settings["GPX_HEATMAPS"][heatmap]["extent"] is None:
-            metadata[trimmed_gpx_key] = gpx.to_xml()
-        else:
-            metadata[trimmed_gpx_key] = clip_gpx(
-                *expand_trim_zone(
-                    *[
-                        float(x.removesuffix(","))
-                        for x in pelican_settings["GPX_HEATMAPS"][heatmap][
-                            "extent"
-                        ].split(" ")
-                    ]
-                ),
-                gpx,
-                heatmap,
-            ).to_xml()
+    metadata["date"] = str(metadata["date"])
+    return metadata
+
+
+def heatmap_metadata(points, heatmap, metadata, pelican_settings):
+    """
+    Metadata for one heatmap: the hash of the track trimmed to the heatmap's
+    extent, and where it (and things made from it) are saved; with
+    ``variants``, also the size of each image.
 
-        my_hash = gpx_hash(metadata[trimmed_gpx_key])
+    The trimmed GPX itself is only made when needed; see `trimmed_xml()`.
 
-        metadata[trimmed_gpx_hash_key] = my_hash
-        metadata[image_key] = pelican_settings["GPX_IMAGE_SAVE_AS"].format(
-            heatmap=heatmap, hash=my_hash, **metadata
+    Args:
+        points (TrackPoints): all the points of the track
+        heatmap (str): heatmap name
+        metadata (dict): the rest of the GPX file's metadata, for the
+            ``*_SAVE_AS`` settings
+        pelican_settings (dict):
+    """
+    from .cache import clip_fingerprint
+
+    heatmap_settings = pelican_settings["GPX_HEATMAPS"][heatmap]
+    points = clip_points(points, heatmap_settings)
+
+    my_hash = points_hash(points)
+    # extra keys for the ``*_SAVE_AS`` settings
+    format_keys = {**metadata, "heatmap": heatmap, "hash": my_hash}
+
+    new_metadata = {
+        f"gpx_{heatmap}_hash": my_hash,
+        f"gpx_{heatmap}_fingerprint": clip_fingerprint(heatmap_settings),
+        f"gpx_{heatmap}_image": pelican_settings["GPX_IMAGE_SAVE_AS"].format(
+            **format_keys
+        ),
+        f"gpx_{heatmap}_save_as": pelican_settings["GPX_SAVE_AS"].format(**format_keys),
+    }
+    for data_format in DATA_FORMATS:
+        data_save_as = pelican_settings[f"GPX_{data_format.upper()}_SAVE_AS"]
+        new_metadata[f"gpx_{heatmap}_{data_format}_save_as"] = (
+            data_save_as.format(**format_keys) if data_save_as else None
         )
-        metadata[trimmed_gpx_save_as_key] = pelican_settings["GPX_SAVE_AS"].format(
-            heatmap=heatmap, hash=my_hash, **metadata
+
+    # the image at each size, for ``srcset``
+    new_metadata[f"gpx_{heatmap}_image_variants"] = []
+    if heatmap_settings["variants"] and new_metadata[f"gpx_{heatmap}_image"]:
+        from .heatmap import image_variants
+
+        new_metadata[f"gpx_{heatmap}_image_variants"] = image_variants(
+            [points], heatmap_settings, new_metadata[f"gpx_{heatmap}_image"]
         )
+    return new_metadata
 
-    metadata["date"] = str(metadata["date"])
-    return metadata
+
+def trimmed_xml(xml, heatmap, pelican_settings):
+    """
+    GPX XML, trimmed to the extent of `heatmap` (if it has one).
+
+    Args:
+        xml (str): GPX XML, as read (and simplified) by `GPXReader`
+        heatmap (str): heatmap name
+        pelican_settings (dict):
+    """
+    extent = pelican_settings["GPX_HEATMAPS"][heatmap]["extent"]
+    if is_polygon_extent(extent):
+        return clip_gpx_to_polygon(
+            load_polygon(extent), gpxpy.parse(xml), heatmap
+        ).to_xml()
+    zone = trim_zone(pelican_settings["GPX_HEATMAPS"][heatmap])
+    if zone is None:
+        return xml
+    return clip_gpx(*zone, gpxpy.parse(xml), heatmap).to_xml()
+
+
+def clip_points(points, heatmap_settings):
+    """
+    Track points (as `points.TrackPoints`), trimmed to the heatmap's extent,
+    as `trimmed_xml()` trims the GPX; or all of them, if it has none.
+    """
+    if is_polygon_extent(heatmap_settings["extent"]):
+        return points.within(load_polygon(heatmap_settings["extent"]))
+    zone = trim_zone(heatmap_settings)
+    if zone is None:
+        return points
+    return points.clipped(*zone)
+
+
+def parse_extent(extent):
+    """
+    Turn an `extent` heatmap setting into numbers.
+
+    e.g. "-17, -150, -18, -149" becomes [-17.0, -150.0, -18.0, -149.0]
+    """
+    return [float(x.removesuffix(",")) for x in extent.split(" ")]
+
+
+def trim_zone(heatmap_settings):
+    """
+    Bounds that GPX data is trimmed to for a heatmap.
+
+    Returns:
+        (min_lat, min_long, max_lat, max_long), or None if the heatmap has no
+        `extent` (and so the GPX data isn't trimmed), or it is a polygon (see
+        `clip_gpx_to_polygon()`).
+    """
+    if heatmap_settings["extent"] is None or is_polygon_extent(
+        heatmap_settings["extent"]
+    ):
+        return None
+    return expand_trim_zone(*parse_extent(heatmap_settings["extent"]))
 
 
 def expand_trim_zone(lat_1, long_1, lat_2, long_2):
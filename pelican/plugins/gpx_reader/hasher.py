@@ -1,4 +1,4 @@
-from hashlib import md5
+from hashlib import blake2b, md5
 
 def gpx_hash(gpx):
     """
@@ -7,3 +7,35 @@ def gpx_hash(gpx):
     Can be used to determine if two GPX tracks are the same.
     """
     return md5(str(gpx).encode()).hexdigest()
+
+
+def points_hash(points):
+    """
+    Given track points (as `points.TrackPoints`), returns a hash.
+
+    Much quicker than hashing the XML, as the points are already in arrays.
+    """
+    hasher = md5()
+    for array in (
+        points.latitude,
+        points.longitude,
+        points.elevation,
+        points.time,
+        points.segment_starts,
+    ):
+        hasher.update(array.tobytes())
+    return hasher.hexdigest()
+
+
+def file_digest(path, chunk_size=2**20):
+    """
+    Digest of the bytes of a file.
+
+    Used to find copies of the same source file, so it only needs to be quick,
+    and read the file a chunk at a time.
+    """
+    hasher = blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -1,62 +1,1018 @@
+"""
+Heatmap images, drawn with NumPy.
+
+Follows the approach (and settings) of sethoscope's heatmap library: each step
+of a track is projected onto the image, and adds "heat" to the pixels within
+``radius`` of it (as set by the ``kernel``). Where steps overlap, their heat is
+combined as set by ``decay``. The result is coloured by value, from
+``hsva_min`` to ``hsva_max`` (or by a ``gradient`` image), over the
+``background`` colour, or a basemap (see `basemap`).
+
+Heat is kept in a sparse matrix of fixed-size tiles, which are only allocated
+once a track reaches them, so memory use follows the area the tracks actually
+cover, rather than the size of the image. The image is then coloured a tile
+at a time. Images are kept within the ``max_pixels`` and ``max_memory``
+settings; see `fit_heatmap()`.
+
+Animations (see `AnimatedHeatmap`) draw each period's tracks once, into a
+matrix of its own, and make each frame from those by running sums (and, for
+rolling windows, taking away the periods that drop out of the window).
+
+Smaller copies of an image (its ``variants``, e.g. for ``srcset``) are made
+from the same matrix, averaged down before it is coloured, rather than drawn
+again; see `Heatmap.make_image()`.
+"""
+
+from abc import ABC, abstractmethod
+from colorsys import hsv_to_rgb
 import logging
-from pathlib import Path
+import math
+import posixpath
+
+from PIL import Image, ImageColor
+import numpy as np
 
-from ._vendor.heatmap import heatmap
+from .basemap import basemap_source, make_basemap
 from .constants import INDENT
 
 logger = logging.getLogger(__name__)
 
+# pixels along each side of a matrix tile
+TILE_SIZE = 256
+# long steps are split into pieces of about this many pixels, so the pixels
+# near each one can be found without looking at the whole bounding box of the
+# step
+PIECE_LENGTH = 32
+# limit on the number of (candidate) pixels handled at once
+PIXEL_CHUNK = 2**20
+# for converting scale, as in Web Mercator; in meters
+EARTH_RADIUS = 6378137
+# points left out on each side when an oversized heatmap is clipped, as a
+# percentage; see `robust_bounds()`
+OUTLIER_PERCENTILE = 0.5
+# heat left over from taking one summed matrix away from another (a rounding
+# error) is dropped below this
+ROUNDING_ERROR = 1e-9
+# with a ``decay`` between 0 and 1, the smallest values at a pixel are dropped
+# once they could add no more than this share of its largest value (half a
+# step of a 256 colour map)
+DECAY_TOLERANCE = 1 / 512
+
+
+class Projection(ABC):
+    """
+    Maps (latitude, longitude) to pixels.
+
+    Args:
+        meters_per_pixel (float): scale at the equator
+    """
+
+    def __init__(self, meters_per_pixel):
+        self.meters_per_pixel = meters_per_pixel
+        self.pixels_per_degree = 2 * math.pi * EARTH_RADIUS / 360 / meters_per_pixel
+
+    @property
+    def key(self):
+        """Projections with the same key project points the same way."""
+        return (type(self).__name__, self.meters_per_pixel)
+
+    @abstractmethod
+    def project(self, latitude, longitude):
+        """
+        Returns:
+            (x, y) arrays, with y increasing to the south
+        """
+
+    @abstractmethod
+    def unproject(self, x, y):
+        """
+        The reverse of `project()`. Latitude only depends on `y`, and
+        longitude on `x`, so they don't need to be the same length.
+
+        Returns:
+            (latitude, longitude) arrays
+        """
+
+
+class EquirectangularProjection(Projection):
+    def project(self, latitude, longitude):
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        return longitude * self.pixels_per_degree, -latitude * self.pixels_per_degree
+
+    def unproject(self, x, y):
+        return (
+            -np.asarray(y, dtype=np.float64) / self.pixels_per_degree,
+            np.asarray(x, dtype=np.float64) / self.pixels_per_degree,
+        )
+
+
+class MercatorProjection(Projection):
+    # past this, the projection heads off to infinity
+    MAX_LATITUDE = 85.0511
+
+    def project(self, latitude, longitude):
+        latitude = np.clip(
+            np.asarray(latitude, dtype=np.float64),
+            -self.MAX_LATITUDE,
+            self.MAX_LATITUDE,
+        )
+        longitude = np.asarray(longitude, dtype=np.float64)
+        pixels_per_radian = self.pixels_per_degree * (180 / math.pi)
+        return (
+            longitude * self.pixels_per_degree,
+            -pixels_per_radian * np.log(np.tan(math.pi / 4 + math.pi / 360 * latitude)),
+        )
+
+    def unproject(self, x, y):
+        pixels_per_radian = self.pixels_per_degree * (180 / math.pi)
+        y = np.asarray(y, dtype=np.float64)
+        return (
+            np.degrees(2 * np.arctan(np.exp(-y / pixels_per_radian)) - math.pi / 2),
+            np.asarray(x, dtype=np.float64) / self.pixels_per_degree,
+        )
+
+
+PROJECTIONS = {
+    "mercator": MercatorProjection,
+    "equirectangular": EquirectangularProjection,
+}
+
+
+class LinearKernel:
+    """Heat falls off in a straight line, to 0 at `radius` pixels."""
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    def heat(self, distance):
+        return np.clip(1 - distance / self.radius, 0, None)
+
+
+class GaussianKernel:
+    """Heat falls off exponentially, to 1/256 at `radius` pixels."""
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.scale = math.log(256) / radius
+
+    def heat(self, distance):
+        return np.where(distance <= self.radius, np.exp(-distance * self.scale), 0)
+
+
+KERNELS = {
+    "linear": LinearKernel,
+    "gaussian": GaussianKernel,
+}
+
+
+class TiledMatrix(ABC):
+    """
+    Sparse matrix of heat, for an image of `shape` (rows, columns).
+
+    Stored as square tiles of `TILE_SIZE` pixels, keyed by (tile row, tile
+    column), and only created the first time a pixel in them is added to.
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.tile_columns = -(-shape[1] // TILE_SIZE)
+        self.tiles = {}
+
+    def _new_tile(self):
+        return np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float64)
+
+    @abstractmethod
+    def _add_to_tile(self, tile, rows, columns, values):
+        """Add `values` at (`rows`, `columns`) of a tile."""
+
+    def add(self, rows, columns, values):
+        """Add heat `values` at the pixels (`rows`, `columns`) (all arrays)."""
+        inside = (
+            (rows >= 0)
+            & (rows < self.shape[0])
+            & (columns >= 0)
+            & (columns < self.shape[1])
+        )
+        rows, columns, values = rows[inside], columns[inside], values[inside]
+        if not len(rows):
+            return
+
+        # group the pixels by tile
+        keys = (rows // TILE_SIZE) * self.tile_columns + columns // TILE_SIZE
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+
+        for start, end in zip(starts, ends):
+            tile_key = divmod(int(keys[start]), self.tile_columns)
+            tile = self.tiles.get(tile_key)
+            if tile is None:
+                tile = self.tiles[tile_key] = self._new_tile()
+            group = order[start:end]
+            self._add_to_tile(
+                tile, rows[group] % TILE_SIZE, columns[group] % TILE_SIZE, values[group]
+            )
+
+    def finalized(self):
+        """Matrix with the final value of each pixel."""
+        return self
+
+    def max(self):
+        return max((float(tile.max()) for tile in self.tiles.values()), default=0.0)
+
+    def downsampled(self, factor):
+        """
+        Matrix `factor` times smaller each way, with each pixel the mean of
+        the `factor` x `factor` pixels it covers.
+        """
+        downsampled = SummingMatrix(variant_shape(self.shape, factor))
+        if TILE_SIZE % factor == 0:
+            # each tile lands in a block of a single smaller tile
+            size = TILE_SIZE // factor
+            per_tile = factor
+            for (tile_row, tile_column), tile in self.tiles.items():
+                tile_key = (tile_row // per_tile, tile_column // per_tile)
+                target = downsampled.tiles.get(tile_key)
+                if target is None:
+                    target = downsampled.tiles[tile_key] = downsampled._new_tile()
+                top = tile_row % per_tile * size
+                left = tile_column % per_tile * size
+                target[top : top + size, left : left + size] += tile.reshape(
+                    size, factor, size, factor
+                ).mean(axis=(1, 3))
+        else:
+            for (tile_row, tile_column), tile in self.tiles.items():
+                rows, columns = np.nonzero(tile)
+                downsampled.add(
+                    (tile_row * TILE_SIZE + rows) // factor,
+                    (tile_column * TILE_SIZE + columns) // factor,
+                    tile[rows, columns] / factor**2,
+                )
+        return downsampled
+
+
+class SummingMatrix(TiledMatrix):
+    """Overlapping heat is added together (``decay`` of 1)."""
+
+    def _add_to_tile(self, tile, rows, columns, values):
+        np.add.at(tile, (rows, columns), values)
+
+    def add_matrix(self, other, weight=1):
+        """
+        Add another summed matrix (of the same shape), tile by tile; or, with
+        a `weight` of -1, take it away.
+        """
+        for tile_key, other_tile in other.tiles.items():
+            tile = self.tiles.get(tile_key)
+            if tile is None:
+                tile = self.tiles[tile_key] = self._new_tile()
+            tile += weight * other_tile
+            if weight < 0:
+                tile[tile < ROUNDING_ERROR] = 0
+                if not tile.any():
+                    del self.tiles[tile_key]
+
+
+class MaxingMatrix(TiledMatrix):
+    """Only the most heat at each pixel counts (``decay`` of 0)."""
+
+    def _add_to_tile(self, tile, rows, columns, values):
+        np.maximum.at(tile, (rows, columns), values)
+
+
+class DecayingMatrix(TiledMatrix):
+    """
+    Overlapping heat is added together, with each value counting less.
+
+    At each pixel, the values are sorted largest first, and value *n* is
+    weighted by ``decay ** n``. So the values have to be kept until the matrix
+    is finalized. Only the largest `ranks` of them at each pixel are, though:
+    the rest would add less than `DECAY_TOLERANCE` of the pixel's largest
+    value. New values pile up in each tile, and are folded in once there are
+    as many as are kept (or a tile's worth), so memory follows the pixels the
+    tracks cover, rather than the number of steps drawn over them.
+    """
+
+    def __init__(self, shape, decay):
+        super().__init__(shape)
+        self.decay = decay
+        # decay ** ranks / (1 - decay) is the most the rest could add
+        self.ranks = max(
+            math.ceil(math.log(DECAY_TOLERANCE * (1 - decay)) / math.log(decay)), 1
+        )
+
+    def _new_tile(self):
+        return _DecayingTile()
+
+    def _add_to_tile(self, tile, rows, columns, values):
+        tile.pending.append(((rows * TILE_SIZE + columns).astype(np.int32), values))
+        tile.pending_count += len(values)
+        if tile.pending_count >= max(len(tile.values), TILE_SIZE * TILE_SIZE):
+            self._fold(tile)
+
+    def _fold(self, tile):
+        """
+        Fold the tile's new values in with those kept, keeping the largest
+        `ranks` at each pixel.
+
+        Returns:
+            rank of each value kept, at its pixel
+        """
+        pixels = np.concatenate([tile.pixels] + [p for p, _ in tile.pending])
+        values = np.concatenate([tile.values] + [v for _, v in tile.pending])
+
+        # by pixel, then largest value first
+        order = np.lexsort((-values, pixels))
+        pixels, values = pixels[order], values[order]
+        starts = np.flatnonzero(np.r_[True, pixels[1:] != pixels[:-1]])
+        counts = np.diff(np.r_[starts, len(pixels)])
+        rank = np.arange(len(pixels)) - np.repeat(starts, counts)
+
+        kept = rank < self.ranks
+        tile.pixels, tile.values = pixels[kept], values[kept]
+        tile.pending = []
+        tile.pending_count = 0
+        return rank[kept]
+
+    def finalized(self):
+        finalized = SummingMatrix(self.shape)
+        for tile_key in list(self.tiles):
+            tile = self.tiles.pop(tile_key)
+            rank = self._fold(tile)
+            finalized.tiles[tile_key] = np.bincount(
+                tile.pixels,
+                weights=tile.values * self.decay**rank,
+                minlength=TILE_SIZE * TILE_SIZE,
+            ).reshape(TILE_SIZE, TILE_SIZE)
+        return finalized
+
+    def max(self):
+        raise TypeError("finalize the matrix first")
+
+
+class _DecayingTile:
+    """Values of a `DecayingMatrix` tile: those kept, and those to fold in."""
+
+    def __init__(self):
+        self.pixels = np.zeros(0, dtype=np.int32)
+        self.values = np.zeros(0, dtype=np.float64)
+        self.pending = []
+        self.pending_count = 0
+
+
+def matrix_factory(decay, shape):
+    if decay == 1:
+        return SummingMatrix(shape)
+    elif decay == 0:
+        return MaxingMatrix(shape)
+    return DecayingMatrix(shape, decay)
+
+
+class ColorMap:
+    """
+    Colours for heat values, from 0 to 1.
+
+    Either a linear progression from `hsva_min` to `hsva_max` (each a hex
+    string, as "HHHSSVVAA"), or the (RGBA) pixels of the first column of a
+    gradient `image` (the bottom pixel for 0, and the top one for 1).
+    """
+
+    def __init__(self, hsva_min, hsva_max, image=None, steps=256):
+        if image is not None:
+            if image.mode != "RGBA":
+                raise ValueError(f"Gradient image must be RGBA, not {image.mode}.")
+            values = np.asarray(image)[::-1, 0]
+        else:
+            hsva_min = self.str_to_hsva(hsva_min)
+            hsva_max = self.str_to_hsva(hsva_max)
+            values = []
+            for step in range(steps):
+                hsva = [
+                    step / (steps - 1) * (high - low) + low
+                    for low, high in zip(hsva_min, hsva_max)
+                ]
+                hsva[0] = hsva[0] % 1  # in case hue is out of range
+                values.append(
+                    tuple(int(x * 255) for x in hsv_to_rgb(*hsva[:3]) + (hsva[3],))
+                )
+        self.values = np.array(values, dtype=np.uint8)
+
+    @staticmethod
+    def str_to_hsva(string):
+        """e.g. "02affffff" to (0.164, 0.996, 0.996, 0.996)."""
+        string = string.removeprefix("#")
+        return tuple(
+            int(part, 16) / 256
+            for part in (string[0:3], string[3:5], string[5:7], string[7:9])
+        )
+
+    def indexes(self, values):
+        """Index into `values` (the colours) for an array of values from 0 to 1."""
+        return (values * (len(self.values) - 1)).astype(np.intp)
+
+    def colors(self, values):
+        """(N, 4) RGBA colours for an array of values from 0 to 1."""
+        return self.values[self.indexes(values)]
+
+    def blended(self, background):
+        """(steps, 3) RGB colours, already blended over the `background`."""
+        alpha = self.values[:, 3:] / 255
+        return (self.values[:, :3] * alpha + np.array(background) * (1 - alpha)).astype(
+            np.uint8
+        )
+
+
+class ImageMaker:
+    """
+    Colours a (finalized) heat matrix, a tile at a time.
+
+    Each pixel is coloured by looking its value up in a table of colours,
+    made once per heatmap (see `for_settings()`), with the ``background``
+    colour blended in already.
+    """
+
+    # settings that change the colours
+    color_settings = ("gradient", "hsva_min", "hsva_max", "background")
+    _made = {}
 
-class heatmap_options_base(object):
     def __init__(self, heatmap_settings):
-        self.scale = heatmap_settings["scale"]
-        self.background = heatmap_settings["background"]
-        self.decay = heatmap_settings["decay"]
-        self.radius = heatmap_settings["radius"]
-        # self.kernel= heatmap.LinearKernel
-        # self.extent=
-        self.filetype = "gpx"
-
-        ## defaults
-        self.kernel = heatmap_settings["kernel"]
-        self.projection = heatmap_settings["projection"]
-        self.gradient = heatmap_settings["gradient"]
-        self.hsva_min = heatmap_settings["hsva_min"]
-        self.hsva_max = heatmap_settings["hsva_max"]
-        self.points = None
-        self.gpx = None
-        self.csv = None
-        self.shp_file = None
-        self.extent = heatmap_settings["extent"]
-        self.background_image = heatmap_settings["background_image"]
-
-
-def generate_heatmap(gpx_file_in, heatmap_raw_settings):
-    # hide heatmap logging calls
-    old_logging_level = logging.getLogger().getEffectiveLevel()
-    logging.getLogger().setLevel(logging.WARNING)
-
-    heatmap_config = heatmap.Configuration()
-    heatmap_options = heatmap_options_base(heatmap_raw_settings)
-    heatmap_options.files = [
-        str(Path(gpx_file_in).resolve()),
-    ]
-    heatmap_config.set_from_options(options=heatmap_options)
-    heatmap_config.fill_missing()
-    heatmap_matrix = heatmap.process_shapes(heatmap_config)
-    heatmap_matrix = heatmap_matrix.finalized()
-    heatmap_image = heatmap.ImageMaker(heatmap_config).make_image(heatmap_matrix)
-    # reset logging level
-    logging.getLogger().setLevel(old_logging_level)
-    # logger.debug(f"{INDENT}Heatmap file at {heatmap_image_out}")
-
-    return heatmap_image
-
-    # heatmap_image.save(heatmap_image_out, format="png")
-
-    # heatmap_image_buffer = BytesIO()
-    # heatmap_image.save(heatmap_image_buffer, format="png")
-    # heatmap_image_b64 = bytes(
-    #     "data:image/png;base64,", encoding="utf-8"
-    # ) + base64.b64encode(heatmap_image_buffer.getvalue())
-    # return heatmap_image_b64
+        if heatmap_settings["gradient"]:
+            with Image.open(heatmap_settings["gradient"]) as gradient:
+                self.colormap = ColorMap(None, None, image=gradient.convert("RGBA"))
+        else:
+            self.colormap = ColorMap(
+                heatmap_settings["hsva_min"], heatmap_settings["hsva_max"]
+            )
+
+        if heatmap_settings["background"] and not basemap_source(heatmap_settings):
+            self.background = ImageColor.getrgb(heatmap_settings["background"])
+            self.lookup = self.colormap.blended(self.background)
+        else:
+            self.background = None
+            self.lookup = self.colormap.values
+
+    @classmethod
+    def for_settings(cls, heatmap_settings):
+        """ImageMaker for a heatmap, shared by all the images drawn for it."""
+        key = tuple(heatmap_settings[setting] for setting in cls.color_settings) + (
+            basemap_source(heatmap_settings) is not None,
+        )
+        if key not in cls._made:
+            cls._made[key] = cls(heatmap_settings)
+        return cls._made[key]
+
+    def make_image(self, matrix, basemap=None, max_value=None):
+        """
+        Args:
+            matrix: finalized heat matrix
+            basemap: RGBA PIL.Image, the same size as the matrix, to draw the
+                heat over (see `basemap.make_basemap()`). Left as is.
+            max_value: heat given the hottest colour; by default, the most
+                heat in the matrix
+        """
+        rows, columns = matrix.shape
+        if basemap is not None:
+            image = basemap.copy()
+        elif self.background:
+            image = Image.new("RGB", (columns, rows), self.background)
+        else:
+            image = Image.new("RGBA", (columns, rows))
+
+        if max_value is None:
+            max_value = matrix.max()
+        for (tile_row, tile_column), tile in matrix.tiles.items():
+            top = tile_row * TILE_SIZE
+            left = tile_column * TILE_SIZE
+            tile = tile[: rows - top, : columns - left]
+            heated = tile > 0
+            if not heated.any():
+                continue
+
+            colors = self.lookup[self.colormap.indexes(np.minimum(tile / max_value, 1))]
+            if basemap is not None:
+                colors[~heated, 3] = 0
+                image.alpha_composite(Image.fromarray(colors), (left, top))
+                continue
+            image.paste(
+                Image.fromarray(np.ascontiguousarray(colors)),
+                (left, top),
+                mask=Image.fromarray(heated.astype(np.uint8) * 255),
+            )
+
+        return image
+
+
+class Heatmap:
+    """
+    Heatmap of tracks, drawn over `bounds` (min_lat, min_long, max_lat,
+    max_long), with `radius` pixels of margin around them.
+    """
+
+    def __init__(self, heatmap_settings, bounds):
+        self.settings = heatmap_settings
+        self.projection = PROJECTIONS[heatmap_settings["projection"]](
+            heatmap_settings["scale"]
+        )
+        self.kernel = KERNELS[heatmap_settings["kernel"]](heatmap_settings["radius"])
+
+        self.origin, shape = image_layout(self.projection, self.kernel.radius, bounds)
+        self.matrix = matrix_factory(heatmap_settings["decay"], shape)
+
+    def add(self, points):
+        """Add heat for each step of a track (as `points.TrackPoints`)."""
+        if len(points) < 2:
+            return
+
+        x, y = points.projected(self.projection)
+        x = x - self.origin[0]
+        y = y - self.origin[1]
+        steps = points.same_segment()
+        self.add_segments(x[:-1][steps], y[:-1][steps], x[1:][steps], y[1:][steps])
+
+    def add_segments(self, x_0, y_0, x_1, y_1):
+        """
+        Add heat around line segments, given in image pixels.
+
+        Each segment is split into pieces of up to `PIECE_LENGTH` pixels, and
+        the pixels near each piece are checked against the whole segment.
+        Each pixel is only counted for the piece that its nearest point on the
+        segment falls in, so a segment adds heat to a pixel once.
+        """
+        radius = self.kernel.radius
+        dx = x_1 - x_0
+        dy = y_1 - y_0
+        length_squared = dx * dx + dy * dy
+        piece_counts = np.maximum(
+            np.ceil(np.sqrt(length_squared) / PIECE_LENGTH), 1
+        ).astype(np.intp)
+
+        segment = np.repeat(np.arange(len(x_0)), piece_counts)
+        piece = np.arange(len(segment)) - np.repeat(
+            np.cumsum(piece_counts) - piece_counts, piece_counts
+        )
+        pieces = piece_counts[segment]
+        t_start = piece / pieces
+        t_end = (piece + 1) / pieces
+        piece_x = (
+            x_0[segment] + dx[segment] * t_start,
+            x_0[segment] + dx[segment] * t_end,
+        )
+        piece_y = (
+            y_0[segment] + dy[segment] * t_start,
+            y_0[segment] + dy[segment] * t_end,
+        )
+
+        # box of pixels around each piece
+        left = np.floor(np.minimum(*piece_x) - radius).astype(np.intp)
+        top = np.floor(np.minimum(*piece_y) - radius).astype(np.intp)
+        widths = np.ceil(np.maximum(*piece_x) + radius).astype(np.intp) - left + 1
+        heights = np.ceil(np.maximum(*piece_y) + radius).astype(np.intp) - top + 1
+        box_sizes = widths * heights
+
+        # work through the pieces in chunks, so only so many candidate pixels
+        # are in memory at once
+        chunk = np.cumsum(box_sizes) // PIXEL_CHUNK
+        chunk_starts = np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]])
+        chunk_ends = np.r_[chunk_starts[1:], len(chunk)]
+        for start, end in zip(chunk_starts, chunk_ends):
+            p = np.arange(start, end)
+            sizes = box_sizes[p]
+            which = np.repeat(p, sizes)
+            index = np.arange(len(which)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            columns = left[which] + index % widths[which]
+            rows = top[which] + index // widths[which]
+
+            s = segment[which]
+            # nearest point on the segment
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = ((columns - x_0[s]) * dx[s] + (rows - y_0[s]) * dy[s]) / (
+                    length_squared[s]
+                )
+            t = np.clip(np.nan_to_num(t), 0, 1)
+            own_piece = np.minimum(
+                (t * pieces[which]).astype(np.intp), pieces[which] - 1
+            )
+
+            distance = np.hypot(
+                columns - (x_0[s] + t * dx[s]), rows - (y_0[s] + t * dy[s])
+            )
+            heat = self.kernel.heat(distance)
+            keep = (own_piece == piece[which]) & (heat > 0)
+            self.matrix.add(rows[keep], columns[keep], heat[keep])
+
+    def make_image(self, basemaps=None, factor=1):
+        """
+        Args:
+            basemaps (cache.BasemapCache): where to get the basemap from, if
+                the heatmap has one. If not given, it is made from scratch.
+            factor (int): make the image this many times smaller each way
+                (see `variant_factors()`). Can be called again for each size.
+        """
+        # kept, as finalizing can use up the matrix
+        self.matrix = self.matrix.finalized()
+        projection = self.projection
+        origin = self.origin
+        matrix = self.matrix
+        if factor != 1:
+            projection = PROJECTIONS[self.settings["projection"]](
+                self.settings["scale"] * factor
+            )
+            origin = (origin[0] / factor, origin[1] / factor)
+            matrix = matrix.downsampled(factor)
+
+        logger.debug(
+            "%sHeatmap of %s x %s pixels, %s tile%s used",
+            INDENT,
+            matrix.shape[1],
+            matrix.shape[0],
+            len(matrix.tiles),
+            "s" if len(matrix.tiles) != 1 else "",
+        )
+        if basemaps is not None:
+            basemap = basemaps.get(self.settings, projection, origin, matrix.shape)
+        else:
+            basemap = make_basemap(self.settings, projection, origin, matrix.shape)
+        return ImageMaker.for_settings(self.settings).make_image(
+            matrix, basemap=basemap
+        )
+
+
+class AnimatedHeatmap(Heatmap):
+    """
+    Heatmap drawn one period at a time, for the frames of an animation.
+
+    Each period is drawn once, into a matrix of its own. A frame is then the
+    sum of a run of periods, made by adding each period in turn to a running
+    total (a prefix sum), and taking away the periods that have dropped out
+    of a rolling window; so making all the frames costs about as much as
+    drawing every track once, rather than once per frame.
+
+    Heat is always added together (as with a ``decay`` of 1), as only summed
+    heat can be taken away again.
+    """
+
+    def __init__(self, heatmap_settings, bounds):
+        super().__init__({**heatmap_settings, "decay": 1}, bounds)
+        self.periods = []
+
+    def add_period(self, tracks):
+        """Draw the tracks (as `points.TrackPoints`) of the next period."""
+        self.matrix = SummingMatrix(self.matrix.shape)
+        for points in tracks:
+            self.add(points)
+        self.periods.append(self.matrix)
+
+    def frames(self, firsts=None):
+        """
+        Heat of each frame, one per period. The same matrix is yielded each
+        time (updated in place), so it has to be used before the next.
+
+        Args:
+            firsts: for each frame, the index of the first period in it; these
+                can only go up from frame to frame. By default, every frame
+                starts from the first period (i.e. is cumulative).
+        """
+        total = SummingMatrix(self.matrix.shape)
+        first = 0
+        for index, period in enumerate(self.periods):
+            total.add_matrix(period)
+            while firsts is not None and first < firsts[index]:
+                total.add_matrix(self.periods[first], weight=-1)
+                first += 1
+            yield total
+
+    def make_images(self, firsts=None, basemaps=None):
+        """
+        Image of each frame (see `frames()`), all coloured on the same scale,
+        so the heat can be seen to build up (or fade away).
+
+        Returns:
+            generator of PIL.Image
+        """
+        max_value = max((frame.max() for frame in self.frames(firsts)), default=0.0)
+        shape = self.matrix.shape
+        logger.debug(
+            "%sAnimation of %s frame%s, %s x %s pixels",
+            INDENT,
+            len(self.periods),
+            "s" if len(self.periods) != 1 else "",
+            shape[1],
+            shape[0],
+        )
+        if basemaps is not None:
+            basemap = basemaps.get(self.settings, self.projection, self.origin, shape)
+        else:
+            basemap = make_basemap(self.settings, self.projection, self.origin, shape)
+        image_maker = ImageMaker.for_settings(self.settings)
+        for frame in self.frames(firsts):
+            yield image_maker.make_image(frame, basemap=basemap, max_value=max_value)
+
+
+def image_layout(projection, padding, bounds):
+    """
+    Where the image of `bounds` sits, once projected.
+
+    Returns:
+        ((x, y) of the top left corner, (rows, columns))
+    """
+    min_lat, min_long, max_lat, max_long = bounds
+    x, y = projection.project([min_lat, max_lat], [min_long, max_long])
+    origin = (float(x.min()) - padding, float(y.min()) - padding)
+    shape = (
+        int(y.max() - y.min() + 2 * padding) + 1,
+        int(x.max() - x.min() + 2 * padding) + 1,
+    )
+    return origin, shape
+
+
+def variant_factors(heatmap_settings):
+    """
+    How many times smaller (each way) each of the heatmap's ``variants`` is,
+    as whole numbers, smallest factor (largest image) first.
+    """
+    return sorted({int(factor) for factor in heatmap_settings["variants"] or ()} - {1})
+
+
+def variant_shape(shape, factor):
+    """Size (rows, columns) of an image of `shape`, made `factor` times smaller."""
+    return (-(-shape[0] // factor), -(-shape[1] // factor))
+
+
+def variant_save_as(save_as, shape, factor):
+    """
+    What a variant of the image saved as `save_as`, of `shape`, is saved as:
+    its width is added, e.g. ``abc-640w.png``. A `factor` of 1 is the image
+    itself.
+    """
+    if factor == 1:
+        return save_as
+    root, extension = posixpath.splitext(save_as)
+    return f"{root}-{variant_shape(shape, factor)[1]}w{extension}"
+
+
+def image_shape(heatmap_settings, bounds):
+    """Size (rows, columns) of the heatmap image of `bounds`."""
+    projection = PROJECTIONS[heatmap_settings["projection"]](heatmap_settings["scale"])
+    return image_layout(projection, heatmap_settings["radius"], bounds)[1]
+
+
+def max_image_pixels(heatmap_settings):
+    """
+    Largest image allowed by the ``max_pixels`` and ``max_memory`` (in MB)
+    settings, in pixels, or None if there is no limit.
+
+    Memory is reckoned as the heat matrix (if every tile gets used) plus the
+    image, and the basemap it is drawn over (if any).
+    """
+    limits = []
+    if heatmap_settings["max_pixels"]:
+        limits.append(int(heatmap_settings["max_pixels"]))
+    if heatmap_settings["max_memory"]:
+        bytes_per_pixel = np.dtype(np.float64).itemsize
+        if basemap_source(heatmap_settings):
+            bytes_per_pixel += 2 * 4  # RGBA basemap, and the image drawn over it
+        elif heatmap_settings["background"]:
+            bytes_per_pixel += 3  # RGB
+        else:
+            bytes_per_pixel += 4  # RGBA
+        limits.append(int(heatmap_settings["max_memory"] * 2**20 / bytes_per_pixel))
+    return min(limits, default=None)
+
+
+def robust_bounds(tracks, percentile=OUTLIER_PERCENTILE):
+    """
+    Bounds of the `tracks`, leaving out the outermost `percentile` of points
+    on each side (and always the very outermost point).
+    """
+    latitude = np.concatenate([points.latitude for points in tracks])
+    longitude = np.concatenate([points.longitude for points in tracks])
+    return (
+        float(np.percentile(latitude, percentile, method="higher")),
+        float(np.percentile(longitude, percentile, method="higher")),
+        float(np.percentile(latitude, 100 - percentile, method="lower")),
+        float(np.percentile(longitude, 100 - percentile, method="lower")),
+    )
+
+
+def fit_heatmap(tracks, heatmap_settings, bounds, name=None, log=True):
+    """
+    Keep the heatmap image within its ``max_pixels`` and ``max_memory``.
+
+    If the image would be larger than that, heatmaps without an ``extent``
+    (and an ``oversize`` setting of "clip") are first cut down to the
+    `robust_bounds()` of the tracks, as the size is usually down to a few
+    stray points. If the image is still too large, the ``scale`` is raised
+    until it fits. Either way, a warning is logged. This is all worked out
+    from the bounds, before anything is drawn.
+
+    `name` is only used for logging; nothing is logged without `log`.
+
+    Returns:
+        (heatmap settings, bounds) to draw the heatmap with
+    """
+    max_pixels = max_image_pixels(heatmap_settings)
+    if max_pixels is None:
+        return heatmap_settings, bounds
+    level = logging.WARNING if log else logging.DEBUG
+
+    rows, columns = image_shape(heatmap_settings, bounds)
+    if rows * columns <= max_pixels:
+        return heatmap_settings, bounds
+
+    if heatmap_settings["oversize"] == "clip" and heatmap_settings["extent"] is None:
+        clipped = robust_bounds(tracks)
+        clipped_rows, clipped_columns = image_shape(heatmap_settings, clipped)
+        logger.log(
+            level,
+            "%sHeatmap %s would be %s x %s pixels (limit is %s pixels). "
+            "Clipping to %.4f, %.4f, %.4f, %.4f (%s x %s pixels).",
+            INDENT,
+            name or "",
+            columns,
+            rows,
+            max_pixels,
+            *clipped,
+            clipped_columns,
+            clipped_rows,
+        )
+        bounds = clipped
+        rows, columns = clipped_rows, clipped_columns
+        if rows * columns <= max_pixels:
+            return heatmap_settings, bounds
+
+    # the padding doesn't shrink with the scale, so this may take a few goes
+    fitted = dict(heatmap_settings)
+    while rows * columns > max_pixels:
+        fitted["scale"] *= max(math.sqrt(rows * columns / max_pixels), 1.01)
+        rows, columns = image_shape(fitted, bounds)
+    logger.log(
+        level,
+        "%sHeatmap %s too large for limit of %s pixels. "
+        "Scale raised from %s to %.1f m/pixel (%s x %s pixels).",
+        INDENT,
+        name or "",
+        max_pixels,
+        heatmap_settings["scale"],
+        fitted["scale"],
+        columns,
+        rows,
+    )
+    return fitted, bounds
+
+
+def heatmap_bounds(tracks, heatmap_settings):
+    """
+    Area a heatmap covers: its ``extent``, if it has one, or else the bounds
+    of the `tracks`.
+    """
+    from .gpx import parse_extent
+    from .polygons import is_polygon_extent, load_polygon
+
+    if is_polygon_extent(heatmap_settings["extent"]):
+        return load_polygon(heatmap_settings["extent"]).bounds
+    if heatmap_settings["extent"] is not None:
+        lat_1, long_1, lat_2, long_2 = parse_extent(heatmap_settings["extent"])
+        return (
+            min(lat_1, lat_2),
+            min(long_1, long_2),
+            max(lat_1, lat_2),
+            max(long_1, long_2),
+        )
+
+    tracks = [points for points in tracks if len(points)]
+    if not tracks:
+        return (0.0, 0.0, 0.0, 0.0)
+    return (
+        min(float(points.latitude.min()) for points in tracks),
+        min(float(points.longitude.min()) for points in tracks),
+        max(float(points.latitude.max()) for points in tracks),
+        max(float(points.longitude.max()) for points in tracks),
+    )
+
+
+def draw_heatmap(tracks, heatmap_raw_settings, name=None):
+    """
+    Draw a heatmap, ready for its image (or images) to be made.
+
+    Args:
+        tracks: iterable of track points (as `points.TrackPoints`), added to
+            the heatmap one after the other. Only gone through once if the
+            heatmap has an ``extent``.
+        heatmap_raw_settings (dict): settings for this heatmap
+        name (str): what the image is saved as, for logging
+
+    Returns:
+        Heatmap
+    """
+    if heatmap_raw_settings["extent"] is None:
+        tracks = [points for points in tracks if len(points)]
+
+    heatmap = Heatmap(
+        *fit_heatmap(
+            tracks,
+            heatmap_raw_settings,
+            heatmap_bounds(tracks, heatmap_raw_settings),
+            name=name,
+        )
+    )
+    for points in tracks:
+        heatmap.add(points)
+    return heatmap
+
+
+def generate_heatmap(tracks, heatmap_raw_settings, name=None, basemaps=None):
+    """
+    Draw a heatmap. See `draw_heatmap()` for the arguments.
+
+    Args:
+        basemaps (cache.BasemapCache): basemaps to reuse, if any
+
+    Returns:
+        PIL.Image
+    """
+    heatmap = draw_heatmap(tracks, heatmap_raw_settings, name=name)
+    return heatmap.make_image(basemaps=basemaps)
+
+
+def generate_heatmap_variants(tracks, heatmap_raw_settings, save_as, basemaps=None):
+    """
+    Draw a heatmap, and make its image at full size, and at each of its
+    ``variants``. See `draw_heatmap()` for the arguments.
+
+    Returns:
+        dict of PIL.Image, by what each is saved as; the full size one (as
+        `save_as`) first
+    """
+    heatmap = draw_heatmap(tracks, heatmap_raw_settings, name=save_as)
+    shape = heatmap.matrix.shape
+    return {
+        variant_save_as(save_as, shape, factor): heatmap.make_image(
+            basemaps=basemaps, factor=factor
+        )
+        for factor in [1] + variant_factors(heatmap_raw_settings)
+    }
+
+
+def image_variants(tracks, heatmap_raw_settings, save_as):
+    """
+    What `generate_heatmap_variants()` would save the images of `tracks` as,
+    and their sizes, worked out without drawing anything.
+
+    Returns:
+        list of dicts, with "save_as", "width", and "height", the full size
+        image first
+    """
+    if heatmap_raw_settings["extent"] is None:
+        tracks = [points for points in tracks if len(points)]
+
+    shape = image_shape(
+        *fit_heatmap(
+            tracks,
+            heatmap_raw_settings,
+            heatmap_bounds(tracks, heatmap_raw_settings),
+            log=False,
+        )
+    )
+    variants = []
+    for factor in [1] + variant_factors(heatmap_raw_settings):
+        rows, columns = variant_shape(shape, factor)
+        variants.append(
+            {
+                "save_as": variant_save_as(save_as, shape, factor),
+                "width": columns,
+                "height": rows,
+            }
+        )
+    return variants
+
+
+def draw_animation(periods, heatmap_raw_settings, name=None):
+    """
+    Draw the periods of a heatmap animation, ready for its frames to be made.
+
+    Every frame covers the same area (that of all the tracks, or the
+    ``extent``), so that they line up.
+
+    Args:
+        periods: list (in date order) of lists of track points (as
+            `points.TrackPoints`), one for each period (frame)
+        heatmap_raw_settings (dict): settings for this heatmap
+        name (str): what the animation is saved as, for logging
+
+    Returns:
+        AnimatedHeatmap
+    """
+    tracks = [points for period in periods for points in period if len(points)]
+    heatmap = AnimatedHeatmap(
+        *fit_heatmap(
+            tracks,
+            heatmap_raw_settings,
+            heatmap_bounds(tracks, heatmap_raw_settings),
+            name=name,
+        )
+    )
+    for period in periods:
+        heatmap.add_period(period)
+    return heatmap
@@ -1,66 +1,155 @@
 import logging
 
 from .constants import (
+    ALL_GPX_BINARY_SAVE_AS,
+    ALL_GPX_GEOJSON_SAVE_AS,
     ALL_GPX_IMAGE_SAVE_AS,
+    ALL_GPX_POLYLINE_SAVE_AS,
     ALL_GPX_SAVE_AS,
+    CUMULATIVE_GPX_ANIMATION_SAVE_AS,
+    CUMULATIVE_GPX_FRAME_SAVE_AS,
+    DAY_GPX_BINARY_SAVE_AS,
+    DAY_GPX_GEOJSON_SAVE_AS,
     DAY_GPX_IMAGE_SAVE_AS,
+    DAY_GPX_POLYLINE_SAVE_AS,
     DAY_GPX_SAVE_AS,
+    GPX_ANIMATION_FRAME_DURATION,
+    GPX_ANIMATION_PERIOD,
+    GPX_ANIMATION_WINDOW,
     GPX_AUTHOR,
     GPX_BACKGROUND,
     GPX_BACKGROUND_IMAGE,
+    GPX_BINARY_SAVE_AS,
     GPX_CATEGORY,
+    GPX_COORDINATE_PRECISION,
     GPX_DECAY,
+    GPX_DECIMATE_DISTANCE,
+    GPX_DECIMATE_SECONDS,
     GPX_EXCLUDES,
     GPX_EXTENT,
+    GPX_GEOJSON_SAVE_AS,
     GPX_GRADIENT,
     GPX_HEATMAPS,
     GPX_HSVA_MAX,
     GPX_HSVA_MIN,
     GPX_IMAGE_SAVE_AS,
     GPX_KERNEL,
+    GPX_MAX_FILE_SIZE,
+    GPX_MAX_MEMORY,
+    GPX_MAX_PIXELS,
+    GPX_MAX_POINTS,
+    GPX_MAX_READ_TIME,
+    GPX_MAX_SPEED,
+    GPX_OVERLAP_DISTANCE,
+    GPX_OVERLAPS,
+    GPX_OVERSIZE,
     GPX_PATHS,
+    GPX_POLYLINE_SAVE_AS,
+    GPX_PRIVACY_ZONES,
     GPX_PROJECTION,
     GPX_RADIUS,
     GPX_SAVE_AS,
     GPX_SCALE,
     GPX_SIMPLIFY_DISTANCE,
     GPX_STATUS,
+    GPX_STOP_RADIUS,
+    GPX_STOP_TIME,
+    GPX_STOPPED_SPEED,
+    GPX_TILES,
+    GPX_VARIANTS,
     LOG_PREFIX,
+    MONTH_GPX_BINARY_SAVE_AS,
+    MONTH_GPX_GEOJSON_SAVE_AS,
     MONTH_GPX_IMAGE_SAVE_AS,
+    MONTH_GPX_POLYLINE_SAVE_AS,
     MONTH_GPX_SAVE_AS,
+    ROLLING_GPX_ANIMATION_SAVE_AS,
+    ROLLING_GPX_FRAME_SAVE_AS,
+    WEEK_GPX_BINARY_SAVE_AS,
+    WEEK_GPX_GEOJSON_SAVE_AS,
     WEEK_GPX_IMAGE_SAVE_AS,
+    WEEK_GPX_POLYLINE_SAVE_AS,
     WEEK_GPX_SAVE_AS,
+    YEAR_GPX_BINARY_SAVE_AS,
+    YEAR_GPX_GEOJSON_SAVE_AS,
     YEAR_GPX_IMAGE_SAVE_AS,
+    YEAR_GPX_POLYLINE_SAVE_AS,
     YEAR_GPX_SAVE_AS,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def is_variant_factor(factor):
+    """Can `factor` be a heatmap variant: a whole number, 2 or more?"""
+    try:
+        return int(factor) == factor and factor >= 2
+    except (OverflowError, TypeError, ValueError):
+        return False
+
+
 def check_settings(pelican):
     """
     Insert defaults in Pelican settings, as needed.
     """
     logger.debug("%s massaging settings, setting defaults.", LOG_PREFIX)
     for key in [
+        "ALL_GPX_BINARY_SAVE_AS",
+        "ALL_GPX_GEOJSON_SAVE_AS",
         "ALL_GPX_IMAGE_SAVE_AS",
+        "ALL_GPX_POLYLINE_SAVE_AS",
         "ALL_GPX_SAVE_AS",
+        "CUMULATIVE_GPX_ANIMATION_SAVE_AS",
+        "CUMULATIVE_GPX_FRAME_SAVE_AS",
+        "DAY_GPX_BINARY_SAVE_AS",
+        "DAY_GPX_GEOJSON_SAVE_AS",
         "DAY_GPX_IMAGE_SAVE_AS",
+        "DAY_GPX_POLYLINE_SAVE_AS",
         "DAY_GPX_SAVE_AS",
+        "GPX_ANIMATION_FRAME_DURATION",
+        "GPX_ANIMATION_PERIOD",
+        "GPX_ANIMATION_WINDOW",
         "GPX_AUTHOR",
+        "GPX_BINARY_SAVE_AS",
         "GPX_CATEGORY",
+        "GPX_COORDINATE_PRECISION",
+        "GPX_DECIMATE_DISTANCE",
+        "GPX_DECIMATE_SECONDS",
         "GPX_EXCLUDES",
+        "GPX_GEOJSON_SAVE_AS",
         "GPX_HEATMAPS",
         "GPX_IMAGE_SAVE_AS",
+        "GPX_MAX_FILE_SIZE",
+        "GPX_MAX_POINTS",
+        "GPX_MAX_READ_TIME",
+        "GPX_MAX_SPEED",
+        "GPX_OVERLAP_DISTANCE",
+        "GPX_OVERLAPS",
         "GPX_PATHS",
+        "GPX_POLYLINE_SAVE_AS",
+        "GPX_PRIVACY_ZONES",
         "GPX_SAVE_AS",
         "GPX_SIMPLIFY_DISTANCE",
         "GPX_STATUS",
+        "GPX_STOP_RADIUS",
+        "GPX_STOP_TIME",
+        "GPX_STOPPED_SPEED",
+        "MONTH_GPX_BINARY_SAVE_AS",
+        "MONTH_GPX_GEOJSON_SAVE_AS",
         "MONTH_GPX_IMAGE_SAVE_AS",
+        "MONTH_GPX_POLYLINE_SAVE_AS",
         "MONTH_GPX_SAVE_AS",
+        "ROLLING_GPX_ANIMATION_SAVE_AS",
+        "ROLLING_GPX_FRAME_SAVE_AS",
+        "WEEK_GPX_BINARY_SAVE_AS",
+        "WEEK_GPX_GEOJSON_SAVE_AS",
         "WEEK_GPX_IMAGE_SAVE_AS",
+        "WEEK_GPX_POLYLINE_SAVE_AS",
         "WEEK_GPX_SAVE_AS",
+        "YEAR_GPX_BINARY_SAVE_AS",
+        "YEAR_GPX_GEOJSON_SAVE_AS",
         "YEAR_GPX_IMAGE_SAVE_AS",
+        "YEAR_GPX_POLYLINE_SAVE_AS",
         "YEAR_GPX_SAVE_AS",
     ]:
         if key not in pelican.settings.keys():
@@ -96,6 +185,11 @@ def check_settings(pelican):
             "hsva_max",
             "extent",
             "background_image",
+            "max_pixels",
+            "max_memory",
+            "oversize",
+            "tiles",
+            "variants",
         ]:
             if (
                 not heatmap_setting
@@ -110,3 +204,18 @@ def check_settings(pelican):
                     pelican.settings["GPX_HEATMAPS"][heatmap_name][
                         heatmap_setting
                     ] = eval(key_3)
+
+        variants = pelican.settings["GPX_HEATMAPS"][heatmap_name]["variants"]
+        if variants:
+            invalid = [x for x in variants if not is_variant_factor(x)]
+            if invalid:
+                logger.warning(
+                    "%s Heatmap %r variants should be whole numbers, 2 or more. "
+                    "Ignoring %s.",
+                    LOG_PREFIX,
+                    heatmap_name,
+                    invalid,
+                )
+                pelican.settings["GPX_HEATMAPS"][heatmap_name]["variants"] = [
+                    x for x in variants if is_variant_factor(x)
+                ]
@@ -0,0 +1,193 @@
+"""
+Finding the same trip, recorded more than once (e.g. on a watch and a phone).
+
+Recordings are first matched by time: a sweep through them in order of start
+time, keeping a heap of those still under way, finds every pair that overlaps
+in O(n log n) (plus the number of pairs), rather than comparing every pair.
+Pairs that overlap for most of the shorter recording are then compared where
+they were at the same moments, sampled over the overlap; if they stayed close
+together, they are the same trip.
+"""
+
+import heapq
+import logging
+
+import numpy as np
+
+from .constants import LOG_PREFIX
+from .points import haversine
+
+logger = logging.getLogger(__name__)
+
+# share of the shorter recording that has to overlap the other in time
+MIN_TIME_OVERLAP = 0.5
+# moments compared between two recordings
+SAMPLES = 32
+
+OVERLAP_POLICIES = ("keep", "skip", "exclude-combined")
+
+
+def time_span(points):
+    """First and last time of the points, as seconds, or None if unknown."""
+    known = points.time[~np.isnan(points.time)]
+    if not len(known):
+        return None
+    return float(known.min()), float(known.max())
+
+
+def overlapping_pairs(spans):
+    """
+    Pairs (i, j) of `spans` that overlap, where each span is (start, end).
+
+    The spans are swept through by start time, with a heap (by end time) of
+    those still open when each one starts.
+    """
+    order = sorted(range(len(spans)), key=lambda i: spans[i][0])
+    open_spans = []
+    for i in order:
+        start, end = spans[i]
+        while open_spans and open_spans[0][0] < start:
+            heapq.heappop(open_spans)
+        for _, j in open_spans:
+            yield j, i
+        heapq.heappush(open_spans, (end, i))
+
+
+def _positions(points, times):
+    """Where the track was at `times`, interpolated between its points."""
+    known = ~np.isnan(points.time)
+    order = np.argsort(points.time[known], kind="stable")
+    track_times = points.time[known][order]
+    return (
+        np.interp(times, track_times, points.latitude[known][order]),
+        np.interp(times, track_times, points.longitude[known][order]),
+    )
+
+
+def same_trip(points_1, span_1, points_2, span_2, max_distance):
+    """
+    Are two recordings of the same trip?
+
+    They need to overlap in time for at least `MIN_TIME_OVERLAP` of the
+    shorter one, and be (for the median of `SAMPLES` moments over the
+    overlap) within `max_distance` meters of each other.
+    """
+    start = max(span_1[0], span_2[0])
+    end = min(span_1[1], span_2[1])
+    shorter = min(span_1[1] - span_1[0], span_2[1] - span_2[0])
+    if end - start < MIN_TIME_OVERLAP * shorter or end <= start:
+        return False
+
+    times = np.linspace(start, end, SAMPLES)
+    distances = haversine(*_positions(points_1, times), *_positions(points_2, times))
+    return float(np.median(distances)) <= max_distance
+
+
+def find_overlaps(gpxes, max_distance):
+    """
+    Group GPX files (`contents.GPX`) that are recordings of the same trip.
+
+    Returns:
+        list of groups, each a list of GPX files, with the one to keep first:
+        the one that covers the most time, or else the shortest (GPS jitter
+        only adds length). Files without a match are left out.
+    """
+    spans = []
+    candidates = []
+    for gpx in gpxes:
+        span = time_span(gpx.gpx_point_data)
+        if span is not None:
+            spans.append(span)
+            candidates.append(gpx)
+
+    # union-find, so trips recorded three (or more) times end up together
+    parents = list(range(len(candidates)))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in overlapping_pairs(spans):
+        if root(i) != root(j) and same_trip(
+            candidates[i].gpx_point_data,
+            spans[i],
+            candidates[j].gpx_point_data,
+            spans[j],
+            max_distance,
+        ):
+            parents[root(j)] = root(i)
+
+    groups = {}
+    for i in range(len(candidates)):
+        groups.setdefault(root(i), []).append(i)
+    return [
+        [
+            candidates[i]
+            for i in sorted(
+                group,
+                key=lambda i: (
+                    spans[i][0] - spans[i][1],
+                    candidates[i].gpx_length_km,
+                    candidates[i].source_path,
+                ),
+            )
+        ]
+        for group in groups.values()
+        if len(group) > 1
+    ]
+
+
+def resolve_overlaps(gpxes, settings):
+    """
+    Deal with recordings of the same trip, as set by ``GPX_OVERLAPS``.
+
+    - "keep": all are kept, and only logged;
+    - "skip": only one of them (see `find_overlaps()`) is kept;
+    - "exclude-combined": all are kept, but the others are left out of
+      combined (period) files, heatmaps, and animations. The tracks are not
+      merged into one.
+
+    Either way, the one kept lists the others (by slug) in ``gpx_overlaps``,
+    and the others name it in ``gpx_overlap_of``.
+
+    Returns:
+        the GPX files to keep
+    """
+    policy = settings["GPX_OVERLAPS"]
+    if policy not in OVERLAP_POLICIES:
+        logger.warning(
+            "%s Unknown GPX_OVERLAPS %r; should be one of %s. Keeping all.",
+            LOG_PREFIX,
+            policy,
+            ", ".join(OVERLAP_POLICIES),
+        )
+        policy = "keep"
+
+    # reset, as cached files may still have them from an earlier build
+    for gpx in gpxes:
+        gpx.gpx_overlaps = []
+        gpx.gpx_overlap_of = None
+
+    valid = [gpx for gpx in gpxes if getattr(gpx, "valid", False)]
+    skipped = set()
+    for kept, *others in find_overlaps(valid, settings["GPX_OVERLAP_DISTANCE"]):
+        logger.info(
+            "%s Same trip recorded in %s. Using %s%s.",
+            LOG_PREFIX,
+            ", ".join(gpx.relative_source_path for gpx in others),
+            kept.relative_source_path,
+            {
+                "keep": ", but keeping them all",
+                "skip": " instead",
+                "exclude-combined": " in combined files",
+            }[policy],
+        )
+        kept.gpx_overlaps = [gpx.slug for gpx in others]
+        for gpx in others:
+            gpx.gpx_overlap_of = kept.slug
+        if policy == "skip":
+            skipped.update(id(gpx) for gpx in others)
+
+    return [gpx for gpx in gpxes if id(gpx) not in skipped]
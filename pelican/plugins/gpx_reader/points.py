@@ -0,0 +1,553 @@
+"""
+GPX point data as flat NumPy arrays, and the statistics derived from them.
+
+gpxpy stores every point as its own Python object, so each of its helpers
+(``get_bounds()``, ``length_2d()``, ``get_time_bounds()``, etc.) is a separate
+walk over the whole track. Here, the points are pulled out once, and all the
+per-track numbers are then computed together over arrays.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import numpy as np
+
+# same radius as used by gpxpy, in meters
+EARTH_RADIUS = 6378.137 * 1000
+# longest run of points taken as a bad fix, rather than a real detour; see
+# `outliers()`
+MAX_OUTLIER_POINTS = 5
+
+TrackStatistics = namedtuple(
+    "TrackStatistics",
+    [
+        "tracks",
+        "segments",
+        "points",
+        "min_latitude",
+        "min_longitude",
+        "max_latitude",
+        "max_longitude",
+        "min_elevation",
+        "max_elevation",
+        "length_m",
+        "moving_time_s",
+        "max_speed_kmh",
+        "average_speed_kmh",
+        "elevation_gain_m",
+        "elevation_loss_m",
+        "points_per_km",
+    ],
+)
+
+
+class TrackPoints:
+    """
+    All the points of a GPX, as flat arrays.
+
+    Segments are stored end to end. ``segment_starts`` holds the index of the
+    first point of each segment, followed by the total point count, so segment
+    *i* is ``segment_starts[i]:segment_starts[i + 1]``. ``segment_tracks``
+    holds the index of the track each segment belongs to.
+
+    Times are stored as seconds since the (UTC) epoch; missing times and
+    elevations are NaN.
+    """
+
+    def __init__(
+        self,
+        latitude,
+        longitude,
+        elevation,
+        time,
+        segment_starts,
+        segment_tracks,
+        track_count,
+    ):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elevation = elevation
+        self.time = time
+        self.segment_starts = segment_starts
+        self.segment_tracks = segment_tracks
+        self.track_count = track_count
+
+    @classmethod
+    def from_gpx(cls, gpx):
+        """Pull the points out of a (gpxpy) GPX, in a single pass."""
+        latitude = []
+        longitude = []
+        elevation = []
+        time = []
+        segment_starts = []
+        segment_tracks = []
+
+        nan = float("nan")
+        for track_index, track in enumerate(gpx.tracks):
+            for segment in track.segments:
+                segment_starts.append(len(latitude))
+                segment_tracks.append(track_index)
+                for point in segment.points:
+                    latitude.append(point.latitude)
+                    longitude.append(point.longitude)
+                    elevation.append(
+                        nan if point.elevation is None else point.elevation
+                    )
+                    time.append(to_timestamp(point.time))
+        segment_starts.append(len(latitude))
+
+        return cls(
+            latitude=np.array(latitude, dtype=np.float64),
+            longitude=np.array(longitude, dtype=np.float64),
+            elevation=np.array(elevation, dtype=np.float64),
+            time=np.array(time, dtype=np.float64),
+            segment_starts=np.array(segment_starts, dtype=np.intp),
+            segment_tracks=np.array(segment_tracks, dtype=np.intp),
+            track_count=len(gpx.tracks),
+        )
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def __getstate__(self):
+        # projections are only kept for the build (see `projected()`)
+        state = self.__dict__.copy()
+        state.pop("_projected", None)
+        return state
+
+    def projected(self, projection):
+        """
+        (x, y) arrays of the points, in pixels of `projection` (a
+        `heatmap.Projection`).
+
+        Worked out once per projection and scale, and then kept, so the same
+        points drawn in several images (e.g. for a track and each of its
+        periods) are only projected once.
+        """
+        projected = self.__dict__.setdefault("_projected", {})
+        if projection.key not in projected:
+            projected[projection.key] = projection.project(
+                self.latitude, self.longitude
+            )
+        return projected[projection.key]
+
+    @property
+    def segment_count(self):
+        return len(self.segment_tracks)
+
+    def same_segment(self):
+        """
+        Boolean mask over consecutive point pairs.
+
+        Entry *i* is True if points *i* and *i + 1* are in the same segment
+        (i.e. the pair is a real step along the track).
+        """
+        mask = np.ones(max(len(self) - 1, 0), dtype=bool)
+        boundaries = self.segment_starts[1:-1]
+        boundaries = boundaries[(boundaries > 0) & (boundaries < len(self))]
+        mask[boundaries - 1] = False
+        return mask
+
+    def segment_coordinates(self):
+        """
+        (latitude, longitude) of the points, as an (N, 2) array per segment.
+
+        Empty segments are skipped.
+        """
+        coordinates = np.column_stack((self.latitude, self.longitude))
+        return [
+            coordinates[start:end]
+            for start, end in zip(self.segment_starts[:-1], self.segment_starts[1:])
+            if end > start
+        ]
+
+    def masked(self, keep, split=False):
+        """
+        Copy, with only the points where `keep` is True.
+
+        Segments (even if they end up empty) and tracks are kept as is; or,
+        with `split`, segments are split wherever points were left out (so the
+        track doesn't jump across the gap), and empty ones are dropped.
+        """
+        segment_ids = np.repeat(
+            np.arange(self.segment_count), np.diff(self.segment_starts)
+        )
+        if split:
+            kept = np.flatnonzero(keep)
+            starts = np.flatnonzero(
+                np.concatenate(
+                    (
+                        [True],
+                        (np.diff(kept) > 1) | (np.diff(segment_ids[kept]) != 0),
+                    )
+                )
+            )[: len(kept)]
+            segment_starts = np.concatenate((starts, [len(kept)])).astype(np.intp)
+            segment_tracks = self.segment_tracks[segment_ids[kept[starts]]]
+        else:
+            counts = np.bincount(segment_ids[keep], minlength=self.segment_count)
+            segment_starts = np.concatenate(([0], np.cumsum(counts))).astype(np.intp)
+            segment_tracks = self.segment_tracks
+        return TrackPoints(
+            latitude=self.latitude[keep],
+            longitude=self.longitude[keep],
+            elevation=self.elevation[keep],
+            time=self.time[keep],
+            segment_starts=segment_starts,
+            segment_tracks=segment_tracks,
+            track_count=self.track_count,
+        )
+
+    def clipped(self, min_lat, min_long, max_lat, max_long):
+        """
+        Copy, with only the points inside the given bounds.
+
+        The array equivalent of `gpx.clip_gpx()`.
+        """
+        return self.masked(
+            (self.latitude >= min_lat)
+            & (self.latitude <= max_lat)
+            & (self.longitude >= min_long)
+            & (self.longitude <= max_long)
+        )
+
+    def within(self, polygon):
+        """
+        Copy, trimmed to a `polygons.Polygon` (see `Polygon.trim_mask()`),
+        with segments split where points were left out.
+
+        The array equivalent of `gpx.clip_gpx_to_polygon()`.
+        """
+        return self.masked(
+            polygon.trim_mask(self.latitude, self.longitude, self.same_segment()),
+            split=True,
+        )
+
+    def time_bounds(self):
+        """
+        First and last known times, as UTC datetimes.
+
+        Matches gpxpy's ``get_time_bounds()``, in that these are the times in
+        track order, rather than the minimum and maximum.
+        """
+        known = np.flatnonzero(~np.isnan(self.time))
+        if not len(known):
+            return None, None
+        return (
+            datetime.fromtimestamp(self.time[known[0]], tz=timezone.utc),
+            datetime.fromtimestamp(self.time[known[-1]], tz=timezone.utc),
+        )
+
+
+def to_timestamp(point_time):
+    """(gpxpy) point time, as seconds since the epoch; NaN if there isn't one."""
+    if point_time is None:
+        return float("nan")
+    if point_time.tzinfo is None:
+        # gpxpy leaves times without an offset naive; GPX times are UTC
+        point_time = point_time.replace(tzinfo=timezone.utc)
+    return point_time.timestamp()
+
+
+def haversine(lat_1, long_1, lat_2, long_2):
+    """Great circle distance (in meters) between arrays of points."""
+    lat_1, long_1, lat_2, long_2 = (
+        np.radians(x) for x in (lat_1, long_1, lat_2, long_2)
+    )
+    a = (
+        np.sin((lat_2 - lat_1) / 2) ** 2
+        + np.cos(lat_1) * np.cos(lat_2) * np.sin((long_2 - long_1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def decimated(times, distances, min_seconds=None, min_distance=None):
+    """
+    Indexes of the points of a segment to keep, so that each is at least
+    `min_seconds` after, and `min_distance` (in meters, along the track) on
+    from, the last one kept. The first and last points are always kept.
+
+    Args:
+        times: array of seconds (NaN where unknown); only used if
+            `min_seconds` is given
+        distances: array of distances of each step, one less than the points;
+            only used if `min_distance` is given
+
+    Rather than checking every point in turn, the next point to keep is found
+    by binary search, so this only loops once per point kept.
+    """
+    point_count = len(distances) + 1
+    if point_count < 3 or not (min_seconds or min_distance):
+        return np.arange(point_count)
+
+    # both made non-decreasing, so they can be searched; as lists, as
+    # `bisect` is much quicker than NumPy for one value at a time
+    limits = []
+    if min_seconds:
+        times = np.asarray(times, dtype=np.float64)
+        if not np.isnan(times).any():
+            limits.append((np.maximum.accumulate(times).tolist(), min_seconds))
+    if min_distance:
+        cumulative = np.concatenate(([0.0], np.cumsum(distances)))
+        limits.append((cumulative.tolist(), min_distance))
+    if not limits:
+        return np.arange(point_count)
+
+    # (with only one limit, it is simply checked twice)
+    (values_1, limit_1), (values_2, limit_2) = limits[0], limits[-1]
+    keep = [0]
+    last = point_count - 1
+    index = 0
+    while True:
+        # always at least one point on, even if the limit is too small to
+        # register against the values (e.g. a fraction of a second, against
+        # times since the epoch)
+        index = max(
+            bisect_left(values_1, values_1[index] + limit_1, index),
+            bisect_left(values_2, values_2[index] + limit_2, index),
+            index + 1,
+        )
+        if index >= last:
+            break
+        keep.append(index)
+    keep.append(last)
+    return np.array(keep, dtype=np.intp)
+
+
+def outliers(times, latitude, longitude, max_speed_kmh, max_points=MAX_OUTLIER_POINTS):
+    """
+    Points of a segment that jumped away and back (e.g. a bad GPS fix), as a
+    boolean array.
+
+    Steps faster than `max_speed_kmh` are "jumps"; steps that don't go
+    forward in time (e.g. two points logged in the same second) never are.
+    Up to `max_points` points between a jump away and a jump back are
+    outliers, as long as going straight from before to after them isn't a
+    jump too (as it would be on a plane). The same goes for a few points at
+    the very start (or end) of the segment, before the first jump (or after
+    the last), if they all have times, and the step on from the jump is known
+    not to be one; with a single jump, only the fewer of those at either end.
+
+    Args:
+        times: array of seconds; steps without times are never jumps
+        latitude, longitude: arrays
+    """
+    point_count = len(times)
+    drop = np.zeros(point_count, dtype=bool)
+    if point_count < 3:
+        return drop
+
+    times = np.asarray(times, dtype=np.float64)
+    timed = ~np.isnan(times)
+    max_speed = max_speed_kmh / 3.6  # in m/s
+
+    def too_fast(first, second):
+        distance = haversine(
+            latitude[first], longitude[first], latitude[second], longitude[second]
+        )
+        seconds = times[second] - times[first]
+        with np.errstate(invalid="ignore"):
+            return (seconds > 0) & (distance > max_speed * seconds)
+
+    def steady(first, second):
+        # known not to be a jump; a step without times may hide one
+        return timed[first] and timed[second] and not too_fast(first, second)
+
+    steps = np.arange(point_count - 1)
+    jumps = np.flatnonzero(too_fast(steps, steps + 1))
+    if not len(jumps):
+        return drop
+
+    # away and back again
+    away, back = jumps[:-1], jumps[1:]
+    short = back - away <= max_points
+    away, back = away[short], back[short]
+    bypass = ~too_fast(away, back + 1)
+    for start, end in zip(away[bypass] + 1, back[bypass] + 1):
+        drop[start:end] = True
+
+    # at the ends; unless the next jump comes back, making the points between
+    # the jumps the outliers (too many of them to be dropped, if they're kept)
+    first, last = jumps[0], jumps[-1]
+    drop_start = (
+        first < max_points
+        and timed[: first + 1].all()
+        and steady(first + 1, min(first + 2, point_count - 1))
+        and (len(jumps) == 1 or too_fast(first, jumps[1] + 1))
+    )
+    drop_end = (
+        point_count - 1 - last <= max_points
+        and timed[last + 1 :].all()
+        and steady(max(last - 1, 0), last)
+        and (len(jumps) == 1 or too_fast(jumps[-2], last + 1))
+    )
+    if len(jumps) == 1 and drop_start and drop_end:
+        # a short segment, with one jump: whichever side of it is shorter is
+        # the outliers, or (if neither is) it's a real jump
+        start_count, end_count = first + 1, point_count - 1 - last
+        drop_start, drop_end = start_count < end_count, end_count < start_count
+    if drop_start:
+        drop[: first + 1] = True
+    if drop_end:
+        drop[last + 1 :] = True
+
+    return drop
+
+
+def find_stops(times, latitude, longitude, radius, min_seconds):
+    """
+    Where a segment stood still: runs of points that, `min_seconds` on, are
+    still within `radius` meters of where they were. Looking that far ahead
+    (rather than at the speed between points) sees past GPS jitter, which
+    can look quite fast from one point to the next.
+
+    Each stop is then kept within `radius` meters of its first point, so a
+    slow drift doesn't become one long stop: it ends before the first point
+    further away, and the rest of the run can start another. Stops shorter
+    than `min_seconds` (once cut) are dropped.
+
+    Args:
+        times: array of seconds; should have no NaNs
+        latitude, longitude: arrays
+
+    Returns:
+        (N, 2) array of the first and last index of each stop
+    """
+    point_count = len(times)
+    if point_count < 3:
+        return np.empty((0, 2), dtype=np.intp)
+
+    # (non-decreasing, so it can be searched)
+    times = np.maximum.accumulate(np.asarray(times, dtype=np.float64))
+    ahead = np.searchsorted(times, times + min_seconds, side="left")
+    reached = ahead < point_count
+    ahead = np.minimum(ahead, point_count - 1)
+    still = reached & (
+        haversine(latitude, longitude, latitude[ahead], longitude[ahead]) <= radius
+    )
+
+    edges = np.diff(np.concatenate(([0], still.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    if not len(starts):
+        return np.empty((0, 2), dtype=np.intp)
+    # each stop runs to the point its last still point was compared with
+    ends = np.maximum.accumulate(ahead[np.flatnonzero(edges == -1) - 1])
+
+    # stops that now run into each other become one
+    new_stop = np.concatenate(([True], starts[1:] > ends[:-1]))
+    last_of_stop = np.concatenate((new_stop[1:], [True]))
+
+    stops = []
+    for start, end in zip(starts[new_stop], ends[last_of_stop]):
+        while True:
+            far = np.flatnonzero(
+                haversine(
+                    latitude[start],
+                    longitude[start],
+                    latitude[start + 1 : end + 1],
+                    longitude[start + 1 : end + 1],
+                )
+                > radius
+            )
+            stop_end = start + far[0] if len(far) else end
+            if times[stop_end] - times[start] >= min_seconds:
+                stops.append((start, stop_end))
+            if not len(far):
+                break
+            # the next still point, from the first one out of reach
+            following = np.flatnonzero(still[stop_end + 1 : end + 1])
+            if not len(following):
+                break
+            start = stop_end + 1 + following[0]
+    return np.array(stops, dtype=np.intp).reshape(-1, 2)
+
+
+def step_distances(points):
+    """
+    Distance (in meters) of each step between consecutive points.
+
+    Steps that would cross from one segment to the next are zero.
+    """
+    distances = haversine(
+        points.latitude[:-1],
+        points.longitude[:-1],
+        points.latitude[1:],
+        points.longitude[1:],
+    )
+    distances[~points.same_segment()] = 0
+    return distances
+
+
+def track_statistics(points, stopped_speed=1):
+    """
+    Compute all the summary numbers for a track at once.
+
+    Args:
+        points (TrackPoints):
+        stopped_speed (float): in km/h. Steps slower than this don't count
+            towards moving time (or average speed).
+
+    Returns:
+        TrackStatistics. Values that can't be determined (e.g. elevation
+        for a track without any) are None.
+    """
+    point_count = len(points)
+
+    if point_count:
+        bounds = (
+            float(points.latitude.min()),
+            float(points.longitude.min()),
+            float(points.latitude.max()),
+            float(points.longitude.max()),
+        )
+    else:
+        bounds = (None, None, None, None)
+
+    known_elevation = points.elevation[~np.isnan(points.elevation)]
+    if len(known_elevation):
+        elevation_bounds = (
+            float(known_elevation.min()),
+            float(known_elevation.max()),
+        )
+    else:
+        elevation_bounds = (None, None)
+
+    in_segment = points.same_segment()
+    distances = step_distances(points)
+    length_m = float(distances.sum())
+
+    delta_elevation = np.diff(points.elevation)[in_segment]
+    delta_elevation = delta_elevation[~np.isnan(delta_elevation)]
+    elevation_gain = float(delta_elevation[delta_elevation > 0].sum())
+    elevation_loss = float(-delta_elevation[delta_elevation < 0].sum())
+
+    delta_time = np.diff(points.time)
+    timed = in_segment & (delta_time > 0)  # NaN compares False
+    speeds_kmh = distances[timed] / delta_time[timed] * 3.6
+    moving = speeds_kmh > stopped_speed
+    moving_time_s = float(delta_time[timed][moving].sum())
+    moving_length_m = float(distances[timed][moving].sum())
+
+    max_speed_kmh = float(speeds_kmh.max()) if len(speeds_kmh) else None
+    if moving_time_s:
+        average_speed_kmh = moving_length_m / moving_time_s * 3.6
+    else:
+        average_speed_kmh = None
+
+    points_per_km = point_count / (length_m / 1000) if length_m else None
+
+    return TrackStatistics(
+        points.track_count,
+        points.segment_count,
+        point_count,
+        *bounds,
+        *elevation_bounds,
+        length_m,
+        moving_time_s,
+        max_speed_kmh,
+        average_speed_kmh,
+        elevation_gain,
+        elevation_loss,
+        points_per_km,
+    )
@@ -0,0 +1,315 @@
+"""
+Polygon ``extent``s for heatmaps, such as a coastline or a city boundary.
+
+Besides a rectangle (as "lat, long, lat, long"; see `gpx.parse_extent()`), an
+``extent`` can be:
+
+- a GeoJSON file (named ``*.geojson`` or ``*.json``), or a GeoJSON object (as
+  a dict): its Polygons and MultiPolygons, either directly, or as Features;
+- a list of (lat, long) pairs: a polygon; or a list of such lists: several
+  polygons.
+
+A point is inside if it is inside an odd number of the rings (so holes work,
+as long as polygons don't overlap). Edges are straight lines in latitude and
+longitude, as in GeoJSON. A point on an edge (or a vertex) counts as if it
+were a tiny bit east (then north) of it, so is in just one of two polygons
+that share the edge.
+
+Points are tested all at once, against a grid laid over the polygon: each
+cell knows the edges that pass through it, and whether its centre is inside.
+A point is then inside if its cell's centre is, unless an odd number of the
+cell's edges come between the two. With a few cells for each edge, each
+point is only checked against a few edges, however detailed the polygon, so
+the time taken grows with the number of points, rather than points x edges.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+from .constants import INDENT
+
+logger = logging.getLogger(__name__)
+
+# grid cells per edge of the polygon (about)
+CELLS_PER_EDGE = 4
+# cells along each side of the grid, at most
+MAX_GRID_SIZE = 1024
+# limit on the number of (point, edge) pairs checked at once
+PAIR_CHUNK = 2**20
+# crossings this close to the centre of a cell (in cells) are checked exactly
+TIE = 1e-6
+
+GEOJSON_EXTENSIONS = (".geojson", ".json")
+
+_loaded = {}
+
+
+def is_polygon_extent(extent):
+    """Is the ``extent`` a polygon, rather than a rectangle (or None)?"""
+    if extent is None:
+        return False
+    if isinstance(extent, str):
+        return extent.lower().endswith(GEOJSON_EXTENSIONS)
+    return True
+
+
+def extent_key(extent):
+    """
+    The ``extent``, for settings fingerprints; for a GeoJSON file, along with
+    when it was last changed, so editing the file counts as a new extent.
+    """
+    if isinstance(extent, str) and is_polygon_extent(extent):
+        stat = os.stat(extent)
+        return (extent, stat.st_mtime_ns, stat.st_size)
+    return extent
+
+
+def _geojson_rings(geojson):
+    """Rings of a GeoJSON object, as lists of (long, lat) positions."""
+    kind = geojson.get("type")
+    if kind == "FeatureCollection":
+        return [
+            ring for feature in geojson["features"] for ring in _geojson_rings(feature)
+        ]
+    elif kind == "Feature":
+        return _geojson_rings(geojson["geometry"]) if geojson["geometry"] else []
+    elif kind == "GeometryCollection":
+        return [
+            ring
+            for geometry in geojson["geometries"]
+            for ring in _geojson_rings(geometry)
+        ]
+    elif kind == "Polygon":
+        return list(geojson["coordinates"])
+    elif kind == "MultiPolygon":
+        return [ring for polygon in geojson["coordinates"] for ring in polygon]
+    logger.debug("%sIgnoring GeoJSON %s in heatmap extent", INDENT, kind)
+    return []
+
+
+def load_polygon(extent):
+    """
+    `Polygon` of a polygon ``extent`` (see `is_polygon_extent()`).
+
+    Loaded (and indexed) once, and then reused.
+    """
+    key = json.dumps(extent_key(extent), default=repr)
+    if key not in _loaded:
+        if isinstance(extent, str):
+            with open(extent, encoding="utf-8") as f:
+                extent = json.load(f)
+        if isinstance(extent, dict):
+            # GeoJSON is (long, lat)
+            rings = [
+                np.asarray(ring, dtype=np.float64)[:, 1::-1]
+                for ring in _geojson_rings(extent)
+            ]
+        elif np.ndim(extent[0]) == 1:
+            rings = [np.asarray(extent, dtype=np.float64)]
+        else:
+            rings = [np.asarray(ring, dtype=np.float64) for ring in extent]
+        _loaded[key] = Polygon([ring for ring in rings if len(ring) >= 3])
+    return _loaded[key]
+
+
+class Polygon:
+    """
+    One or more rings, each an (N, 2) array of (lat, long), indexed by a grid
+    for quick point-in-polygon tests (see `contains()`).
+    """
+
+    def __init__(self, rings):
+        if not rings:
+            raise ValueError("Heatmap extent has no polygons.")
+
+        # edges, as (x, y) = (long, lat), from each point of a ring to the next
+        starts = np.concatenate(rings)
+        ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+        self.x_0, self.y_0 = starts[:, 1], starts[:, 0]
+        self.x_1, self.y_1 = ends[:, 1], ends[:, 0]
+
+        self.bounds = (
+            float(starts[:, 0].min()),
+            float(starts[:, 1].min()),
+            float(starts[:, 0].max()),
+            float(starts[:, 1].max()),
+        )
+        self._index()
+
+    def _index(self):
+        """Lay the grid over the polygon, and note what is in each cell."""
+        min_y, min_x, max_y, max_x = self.bounds
+        width = max(max_x - min_x, 1e-9)
+        height = max(max_y - min_y, 1e-9)
+        cells = len(self.x_0) * CELLS_PER_EDGE
+        self.columns = int(min(max(np.sqrt(cells * width / height), 1), MAX_GRID_SIZE))
+        self.rows = int(min(max(np.sqrt(cells * height / width), 1), MAX_GRID_SIZE))
+        self.cell_width = width / self.columns
+        self.cell_height = height / self.rows
+        self.origin = (min_x, min_y)
+
+        # each edge goes in every cell its bounding box touches
+        first_column, last_column = (
+            self._column(np.minimum(self.x_0, self.x_1)),
+            self._column(np.maximum(self.x_0, self.x_1)),
+        )
+        first_row, last_row = (
+            self._row(np.minimum(self.y_0, self.y_1)),
+            self._row(np.maximum(self.y_0, self.y_1)),
+        )
+        widths = last_column - first_column + 1
+        sizes = widths * (last_row - first_row + 1)
+        edge = np.repeat(np.arange(len(sizes)), sizes)
+        offset = np.arange(len(edge)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        cell = (first_row[edge] + offset // widths[edge]) * self.columns + (
+            first_column[edge] + offset % widths[edge]
+        )
+        order = np.argsort(cell, kind="stable")
+        self.cell_edges = edge[order]
+        self.cell_starts = np.searchsorted(
+            cell[order], np.arange(self.rows * self.columns + 1)
+        )
+
+        # is the centre of each cell inside? A ray from the centre of each
+        # row of cells, to the east, crosses these edges
+        center_x = min_x + (np.arange(self.columns) + 0.5) * self.cell_width
+        self.cell_inside = np.zeros((self.rows, self.columns), dtype=bool)
+        for row in range(self.rows):
+            y = min_y + (row + 0.5) * self.cell_height
+            crossing = (self.y_0 <= y) != (self.y_1 <= y)
+            y_0, y_1 = self.y_0[crossing], self.y_1[crossing]
+            x_0, x_1 = self.x_0[crossing], self.x_1[crossing]
+            crossings = x_0 + (y - y_0) / (y_1 - y_0) * (x_1 - x_0)
+            east = len(crossings) - np.searchsorted(
+                np.sort(crossings), center_x, side="right"
+            )
+            # where a crossing is (about) on a centre, rounding could put it
+            # on either side: go by `_crosses()`, as `contains()` does
+            column = self._column(crossings)
+            near = np.flatnonzero(
+                np.abs(crossings - center_x[column]) <= TIE * self.cell_width
+            )
+            if len(near):
+                column = column[near]
+                rounded = crossings[near] > center_x[column]
+                exact = _left(
+                    x_0[near], y_0[near], x_1[near], y_1[near], center_x[column], y, 1
+                ) == (y_1[near] > y_0[near])
+                np.add.at(east, column, exact.astype(np.intp) - rounded)
+            self.cell_inside[row] = east % 2 == 1
+        self.cell_inside = self.cell_inside.ravel()
+
+    def _column(self, x):
+        column = ((x - self.origin[0]) / self.cell_width).astype(np.intp)
+        return np.clip(column, 0, self.columns - 1)
+
+    def _row(self, y):
+        row = ((y - self.origin[1]) / self.cell_height).astype(np.intp)
+        return np.clip(row, 0, self.rows - 1)
+
+    def contains(self, latitude, longitude):
+        """Boolean array: which of the points are inside the polygon."""
+        y = np.asarray(latitude, dtype=np.float64)
+        x = np.asarray(longitude, dtype=np.float64)
+        min_y, min_x, max_y, max_x = self.bounds
+        inside = np.zeros(len(x), dtype=bool)
+        candidates = np.flatnonzero(
+            (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        )
+        if not len(candidates):
+            return inside
+
+        rows = self._row(y[candidates])
+        columns = self._column(x[candidates])
+        cells = rows * self.columns + columns
+        inside[candidates] = self.cell_inside[cells]
+
+        # points in cells with edges: flip for each edge between the point
+        # and the centre of its cell
+        counts = self.cell_starts[cells + 1] - self.cell_starts[cells]
+        has_edges = counts > 0
+        candidates, rows, columns, cells, counts = (
+            a[has_edges] for a in (candidates, rows, columns, cells, counts)
+        )
+        chunk = np.cumsum(counts) // PAIR_CHUNK
+        chunk_starts = np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]])
+        chunk_ends = np.r_[chunk_starts[1:], len(chunk)]
+        for start, end in zip(chunk_starts, chunk_ends):
+            sizes = counts[start:end]
+            which = np.repeat(np.arange(start, end), sizes)
+            offset = np.arange(len(which)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            edge = self.cell_edges[self.cell_starts[cells[which]] + offset]
+
+            point = candidates[which]
+            center_x = self.origin[0] + (columns[which] + 0.5) * self.cell_width
+            center_y = self.origin[1] + (rows[which] + 0.5) * self.cell_height
+            crosses = _crosses(
+                center_x,
+                center_y,
+                x[point],
+                y[point],
+                self.x_0[edge],
+                self.y_0[edge],
+                self.x_1[edge],
+                self.y_1[edge],
+            )
+            flips = np.bincount(which[crosses] - start, minlength=end - start)
+            inside[candidates[start:end]] ^= flips % 2 == 1
+        return inside
+
+    def trim_mask(self, latitude, longitude, steps=None):
+        """
+        Points to keep when trimming a track to the polygon: those inside,
+        and the ones just outside, on the other end of a step across the
+        edge, so the step is still drawn.
+
+        Args:
+            steps: boolean array, for each pair of consecutive points, if it
+                is a step along the track; by default, they all are
+        """
+        inside = self.contains(latitude, longitude)
+        if steps is None:
+            steps = np.ones(max(len(inside) - 1, 0), dtype=bool)
+        keep = inside.copy()
+        keep[:-1] |= inside[1:] & steps
+        keep[1:] |= inside[:-1] & steps
+        return keep
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    """Which side of the line a -> b point c is on: > 0 to the left."""
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def _left(ax, ay, bx, by, cx, cy, nudge):
+    """
+    Is point c, moved a tiny bit east (then north) if `nudge` is 1, or west
+    (then south) if -1, to the left of the line a -> b?
+    """
+    orientation = _orientation(ax, ay, bx, by, cx, cy)
+    left = orientation > 0
+    ties = np.flatnonzero(orientation == 0)
+    if len(ties):
+        ax, ay, bx, by = (
+            np.broadcast_to(v, left.shape)[ties] for v in (ax, ay, bx, by)
+        )
+        left[ties] = np.where(ay != by, (ay - by) * nudge > 0, (bx - ax) * nudge > 0)
+    return left
+
+
+def _crosses(ax, ay, bx, by, cx, cy, dx, dy):
+    """
+    Does segment a -> b cross segment c -> d (all arrays)?
+
+    As for the rays in `Polygon._index()`, a and b are taken to be a tiny bit
+    east (then north) of where they are, so neither is ever exactly on c -> d,
+    and c and d are never exactly on a -> b: a point on an edge (or a vertex)
+    of a polygon is inside just when a point right next to it, to the east,
+    would be.
+    """
+    c_d_apart = _left(ax, ay, bx, by, cx, cy, -1) != _left(ax, ay, bx, by, dx, dy, -1)
+    a_b_apart = _left(cx, cy, dx, dy, ax, ay, 1) != _left(cx, cy, dx, dy, bx, by, 1)
+    return c_d_apart & a_b_apart
@@ -0,0 +1,205 @@
+"""
+Privacy zones: places (such as home, or work) that no point of a published
+track should give away.
+
+``GPX_PRIVACY_ZONES`` is a list of zones, each either:
+
+- (lat, long, radius): a circle, with the radius in meters;
+- a polygon, given as for a heatmap ``extent`` (see `polygons.py`): a GeoJSON
+  file or object, or a list of (lat, long) points.
+
+Points inside any of them are removed as the GPX file is read, right after
+`gpx.clean_gpx()`, and segments are split where they were, so the track
+doesn't draw a line across the zone.
+
+The zones are indexed by a grid of cells, about the size of a typical zone.
+Each cell lists the zones that overlap it, so each point is only checked
+against those in its own cell (usually none, or one), and hundreds of zones
+take about as long as one. Zones much larger than the cells are checked
+directly, by their bounds first.
+"""
+
+import json
+import logging
+
+import numpy as np
+
+from .constants import INDENT
+from .points import EARTH_RADIUS, haversine
+from .polygons import extent_key, load_polygon
+
+logger = logging.getLogger(__name__)
+
+# smallest grid cell, in degrees (about a meter)
+MIN_CELL_SIZE = 1e-5
+# zones over more cells than this are checked directly, rather than through
+# the grid
+MAX_ZONE_CELLS = 1024
+# points checked at once
+POINT_CHUNK = 2**18
+# cell keys are row * KEY_STRIDE + column
+KEY_STRIDE = 2**32
+
+_loaded = {}
+
+
+def is_circle(zone):
+    """Is the privacy zone a circle, (lat, long, radius), or a polygon?"""
+    return not isinstance(zone, (str, dict)) and np.ndim(zone) == 1
+
+
+def load_privacy_zones(zones):
+    """
+    `PrivacyZones` of the ``GPX_PRIVACY_ZONES`` setting.
+
+    Loaded (and indexed) once, and then reused.
+    """
+    key = json.dumps([extent_key(zone) for zone in zones], default=repr)
+    if key not in _loaded:
+        _loaded[key] = PrivacyZones(zones)
+    return _loaded[key]
+
+
+class PrivacyZones:
+    """Circles and polygons, indexed by a grid; see `contains()`."""
+
+    def __init__(self, zones):
+        circles = [zone for zone in zones if is_circle(zone)]
+        self.circles = np.array(circles, dtype=np.float64).reshape(-1, 3)
+        self.polygons = [load_polygon(zone) for zone in zones if not is_circle(zone)]
+
+        # bounds of each zone, circles first
+        latitude, longitude, radius = self.circles.T
+        half_height = np.degrees(radius / EARTH_RADIUS)
+        half_width = np.minimum(
+            half_height / np.maximum(np.cos(np.radians(latitude)), 1e-6), 180
+        )
+        bounds = np.concatenate(
+            (
+                np.column_stack(
+                    (
+                        latitude - half_height,
+                        longitude - half_width,
+                        latitude + half_height,
+                        longitude + half_width,
+                    )
+                ),
+                np.array(
+                    [polygon.bounds for polygon in self.polygons], dtype=np.float64
+                ).reshape(-1, 4),
+            )
+        )
+        self._index(bounds)
+
+        logger.debug(
+            "%s%s privacy zone%s, %s in a grid of %s degree cells",
+            INDENT,
+            len(bounds),
+            "s" if len(bounds) != 1 else "",
+            len(bounds) - len(self.large),
+            f"{self.cell_size:.5f}",
+        )
+
+    def _index(self, bounds):
+        """Lay the grid over the zones, and note which are in each cell."""
+        sizes = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+        self.cell_size = max(
+            float(np.median(sizes)) if len(sizes) else 1.0, MIN_CELL_SIZE
+        )
+
+        first_row, first_column = self._cell(bounds[:, 0], bounds[:, 1])
+        last_row, last_column = self._cell(bounds[:, 2], bounds[:, 3])
+        widths = last_column - first_column + 1
+        counts = widths * (last_row - first_row + 1)
+        self.large = np.flatnonzero(counts > MAX_ZONE_CELLS)
+        self.bounds = bounds
+        counts[self.large] = 0
+
+        zone = np.repeat(np.arange(len(counts)), counts)
+        offset = np.arange(len(zone)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (first_row[zone] + offset // widths[zone]) * KEY_STRIDE + (
+            first_column[zone] + offset % widths[zone]
+        )
+        order = np.argsort(keys, kind="stable")
+        # only the cells with zones in them, as the grid covers the world
+        self.cell_keys, self.cell_starts = np.unique(keys[order], return_index=True)
+        self.cell_starts = np.append(self.cell_starts, len(keys))
+        self.cell_zones = zone[order]
+
+    def _cell(self, latitude, longitude):
+        """(row, column) of the cell each point is in."""
+        return (
+            np.floor((latitude + 90) / self.cell_size).astype(np.int64),
+            np.floor((longitude + 180) / self.cell_size).astype(np.int64),
+        )
+
+    def contains(self, latitude, longitude):
+        """Boolean array: which of the points are inside any of the zones."""
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        inside = np.zeros(len(latitude), dtype=bool)
+        for start in range(0, len(latitude), POINT_CHUNK):
+            end = start + POINT_CHUNK
+            inside[start:end] = self._contains(
+                latitude[start:end], longitude[start:end]
+            )
+        return inside
+
+    def _contains(self, latitude, longitude):
+        inside = np.zeros(len(latitude), dtype=bool)
+
+        # (point, zone) pairs, from the cell each point is in
+        rows, columns = self._cell(latitude, longitude)
+        keys = rows * KEY_STRIDE + columns
+        if len(self.cell_keys):
+            cells = np.minimum(
+                np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1
+            )
+            found = np.flatnonzero(self.cell_keys[cells] == keys)
+        else:
+            cells = found = np.zeros(0, dtype=np.intp)
+        counts = self.cell_starts[cells[found] + 1] - self.cell_starts[cells[found]]
+        point = np.repeat(found, counts)
+        offset = np.arange(len(point)) - np.repeat(np.cumsum(counts) - counts, counts)
+        zone = self.cell_zones[self.cell_starts[cells[point]] + offset]
+
+        # and the zones too large for the grid, where the points are in bounds
+        for large in self.large:
+            min_lat, min_long, max_lat, max_long = self.bounds[large]
+            in_bounds = np.flatnonzero(
+                (latitude >= min_lat)
+                & (latitude <= max_lat)
+                & (longitude >= min_long)
+                & (longitude <= max_long)
+            )
+            point = np.concatenate((point, in_bounds))
+            zone = np.concatenate((zone, np.full(len(in_bounds), large)))
+
+        circle = zone < len(self.circles)
+        point_c, zone_c = point[circle], zone[circle]
+        close = (
+            haversine(
+                latitude[point_c],
+                longitude[point_c],
+                self.circles[zone_c, 0],
+                self.circles[zone_c, 1],
+            )
+            <= self.circles[zone_c, 2]
+        )
+        inside[point_c[close]] = True
+
+        # the points of each polygon, together
+        order = np.argsort(zone[~circle], kind="stable")
+        point_p, zone_p = point[~circle][order], zone[~circle][order]
+        polygons, starts = np.unique(zone_p, return_index=True)
+        for index, start, end in zip(
+            polygons, starts, np.append(starts[1:], len(zone_p))
+        ):
+            polygon = self.polygons[index - len(self.circles)]
+            candidates = point_p[start:end]
+            candidates = candidates[~inside[candidates]]
+            if len(candidates):
+                inside[candidates] |= polygon.contains(
+                    latitude[candidates], longitude[candidates]
+                )
+        return inside
@@ -1,18 +1,32 @@
+from datetime import datetime
 import logging
 from pathlib import Path
 
-import gpxpy
-
 from pelican.readers import BaseReader
-from pelican.utils import pelican_open
 
+from .budget import ReadWorker, check_size, time_limit
 from .constants import INDENT, LOG_PREFIX, test_enabled
 from .exceptions import TooShortGPXException
-from .gpx import clean_gpx, generate_metadata, simplify_gpx, get_start_end_times
+from .files import open_gpx_files
+from .scan import merge_scans, scan_gpx
 
 logger = logging.getLogger(__name__)
 
 
+class _LazyEnabled:
+    """
+    Stand-in for `BaseReader.enabled`, only checked when Pelican first asks.
+
+    This keeps the dependency check (and its log message) out of importing
+    the plugin.
+    """
+
+    def __get__(self, instance, owner):
+        if owner._enabled is None:
+            owner._enabled = test_enabled(log=True)
+        return owner._enabled
+
+
 class GPXReader(BaseReader):
     """
     Pelican Reader for GPX files.
@@ -21,21 +35,81 @@ class GPXReader(BaseReader):
     the (raw, but cleaned) XML of the GPX file.
     """
 
-    enabled = test_enabled(log=True)
+    enabled = _LazyEnabled()
+    _enabled = None
     file_extensions = [
         "gpx",
     ]
+    # Compressed GPX files are read too, but those extensions aren't registered
+    # with Pelican, so other generators don't pick up unrelated compressed
+    # files. See `GPXGenerator._include_path()`
     extensions = None
+    # see `budget.ReadWorker`
+    _worker = None
 
     def read(self, source_path):
         # TODO: Show relative path?
         logger.debug("%s read file: %s", LOG_PREFIX, source_path)
 
         source_file = Path(source_path).resolve()
-        with pelican_open(source_file) as fn:
-            gpx = gpxpy.parse(fn)
 
-        clean_gpx(gpx)
+        # cheap check first, to skip empty (or nearly so) files without
+        # paying for the full parse. Two points is all we need to know about.
+        scans = []
+        for _, f in open_gpx_files(source_file):
+            scans.append(scan_gpx(f, stop_after=2))
+            if sum(s.points for s in scans) >= 2:
+                break
+        scan = merge_scans(scans)
+        if scan.points < 2:
+            logger.info(
+                "%sGPX track has %s point%s. Skipping file (%s)",
+                INDENT,
+                scan.points,
+                "" if scan.points == 1 else "s",
+                source_file.name,
+            )
+            return None, self._skipped_metadata(source_file, scan)
+
+        # the rest is where a pathological file could stall the build
+        check_size(source_file, self.settings)
+        seconds = self.settings["GPX_MAX_READ_TIME"]
+        if seconds and ReadWorker.available():
+            # loaded here, so workers are forked with it, rather than each
+            # loading it again (and against the time limit)
+            from . import gpx  # noqa: F401
+
+            if self._worker is None:
+                self._worker = ReadWorker(self._read_gpx)
+            return self._worker.run(source_file, seconds, source_file, scan)
+        with time_limit(source_file, self.settings):
+            return self._read_gpx(source_file, scan)
+
+    def _read_gpx(self, source_file, scan):
+        """
+        Parse, clean, and simplify the GPX file, and generate its metadata.
+
+        Args:
+            source_file (pathlib.Path):
+            scan (GPXScan): result of the pre-parse scan of `source_file`
+        """
+        # imported here, so the cost is only paid if there are GPX files to read
+        from .gpx import (
+            clean_gpx,
+            collapse_stops,
+            decimate_gpx,
+            exclude_privacy_zones,
+            generate_metadata,
+            read_gpx,
+            simplify_gpx,
+        )
+
+        gpx = read_gpx(source_file)
+
+        clean_gpx(gpx, self.settings)
+        privacy = exclude_privacy_zones(gpx, self.settings)
+        stops = collapse_stops(gpx, self.settings)
+        decimate_gpx(gpx, self.settings)
         simplify_gpx(gpx, self.settings)
 
         content = gpx.to_xml()
@@ -45,6 +119,8 @@ class GPXReader(BaseReader):
                 gpx=gpx,
                 source_file=source_file,
                 pelican_settings=self.settings,
+                stops=stops,
+                privacy=privacy,
             )
         except TooShortGPXException as e:
             logger.info(
@@ -52,15 +128,7 @@ class GPXReader(BaseReader):
                 INDENT,
                 source_file.name,
             )
-            # dummy information to keep Pelican from crashing, but to skip this
-            # file
-            start_time, _ = get_start_end_times(gpx=gpx, pelican_settings=self.settings)
-            return None, {
-                "title": f"GPX track for {source_file.name}",
-                "date": start_time,
-                "heatmap": None,
-                "valid": False,
-            }
+            return None, self._skipped_metadata(source_file, scan)
 
         parsed_metadata = {}
         for key, value in metadata.items():
@@ -68,3 +136,31 @@ class GPXReader(BaseReader):
             parsed_metadata[key] = self.process_metadata(key, value)
 
         return content, parsed_metadata
+
+    def _skipped_metadata(self, source_file, scan):
+        """
+        Dummy information to keep Pelican from crashing, but to skip this file.
+
+        Args:
+            source_file (pathlib.Path):
+            scan (GPXScan): result of the pre-parse scan of `source_file`
+        """
+        from .gpx import localize_times
+
+        start_time, _ = localize_times(
+            scan.start_time,
+            scan.end_time,
+            scan.start_lat_lon,
+            scan.end_lat_lon,
+            self.settings,
+        )
+        if start_time is None:
+            # no times at all, so fall back to the file itself
+            start_time = datetime.fromtimestamp(source_file.stat().st_mtime)
+
+        return {
+            "title": f"GPX track for {source_file.name}",
+            "date": start_time,
+            "heatmap": None,
+            "valid": False,
+        }
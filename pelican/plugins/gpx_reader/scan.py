@@ -0,0 +1,163 @@
+"""
+Cheap, streaming look at a GPX file, before committing to a full parse.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timezone
+from os import PathLike
+from xml.etree import ElementTree
+
+from .files import open_gpx_files
+
+# read this many bytes at a time, when measuring a file
+MEASURE_CHUNK = 2**20
+
+GPXScan = namedtuple(
+    "GPXScan",
+    [
+        "points",
+        "start_time",
+        "end_time",
+        "start_lat_lon",
+        "end_lat_lon",
+    ],
+)
+
+
+def _local_name(tag):
+    """Strip the namespace from an ElementTree tag."""
+    return tag.rpartition("}")[2]
+
+
+def _parse_time(text):
+    if not text:
+        return None
+    text = text.strip()
+    if text.endswith("Z"):
+        # Python < 3.11 doesn't understand the "Z" suffix
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def scan_gpx(source, stop_after=None):
+    """
+    Count the track points in a GPX file, and find its first and last times.
+
+    This streams through the XML without building gpxpy objects (or keeping
+    the points around), so it is much cheaper than a full parse. Points that
+    ``clean_gpx()`` will certainly drop (at 0N 0E, or from a ``network``
+    source) are not counted.
+
+    Args:
+        source: filename or (binary) file object of the GPX file
+        stop_after (int): if given, stop reading once this many points have
+            been found. The point count (and the end time and position) are
+            then only what was seen up to that point.
+
+    Returns:
+        GPXScan. Times are UTC datetimes, or None if no point has a (readable)
+        time.
+    """
+    if isinstance(source, (str, PathLike)):
+        # open it ourselves, so the file is closed even if we stop early
+        with open(source, "rb") as f:
+            return scan_gpx(f, stop_after=stop_after)
+
+    points = 0
+    start_time = end_time = None
+    start_lat_lon = end_lat_lon = None
+
+    for _, element in ElementTree.iterparse(source, events=("end",)):
+        tag = _local_name(element.tag)
+        if tag == "trkseg":
+            # points have already been counted; don't keep them around
+            element.clear()
+            continue
+        elif tag != "trkpt":
+            continue
+
+        lat_lon = (float(element.get("lat")), float(element.get("lon")))
+        point_time = None
+        source_type = None
+        for child in element:
+            child_tag = _local_name(child.tag)
+            if child_tag == "time":
+                point_time = child.text
+            elif child_tag == "src":
+                source_type = child.text
+        element.clear()
+
+        if lat_lon == (0, 0) or source_type == "network":
+            continue
+
+        points += 1
+        if start_lat_lon is None:
+            start_lat_lon = lat_lon
+        end_lat_lon = lat_lon
+
+        point_time = _parse_time(point_time)
+        if point_time is not None:
+            if start_time is None:
+                start_time = point_time
+            end_time = point_time
+
+        if stop_after is not None and points >= stop_after:
+            break
+
+    return GPXScan(points, start_time, end_time, start_lat_lon, end_lat_lon)
+
+
+def merge_scans(scans):
+    """Combine the scans of several GPX documents, taken as one after another."""
+    scans = list(scans)
+    start_times = [s.start_time for s in scans if s.start_time is not None]
+    end_times = [s.end_time for s in scans if s.end_time is not None]
+    start_lat_lons = [s.start_lat_lon for s in scans if s.start_lat_lon is not None]
+    end_lat_lons = [s.end_lat_lon for s in scans if s.end_lat_lon is not None]
+
+    return GPXScan(
+        sum(s.points for s in scans),
+        start_times[0] if start_times else None,
+        end_times[-1] if end_times else None,
+        start_lat_lons[0] if start_lat_lons else None,
+        end_lat_lons[-1] if end_lat_lons else None,
+    )
+
+
+def measure_gpx(path, max_bytes=None, max_points=None):
+    """
+    Size (once decompressed) and number of track points of a GPX file (or of
+    all the GPX files in a zip file).
+
+    Points are counted straight from the bytes (as ``<trkpt`` tags), which is
+    much quicker again than `scan_gpx()`, and doesn't depend on the XML being
+    readable.
+
+    Args:
+        max_bytes, max_points (int): if given, stop as soon as either is
+            passed; the counts are then only what was seen up to then.
+
+    Returns:
+        (bytes, points)
+    """
+    tag = b"<trkpt"
+    size = points = 0
+    for _, f in open_gpx_files(path):
+        # end of the last chunk, for tags split between chunks; too short to
+        # hold a whole tag, so none are counted twice
+        tail = b""
+        while chunk := f.read(MEASURE_CHUNK):
+            size += len(chunk)
+            points += (tail + chunk).count(tag)
+            tail = chunk[-(len(tag) - 1) :]
+            if (max_bytes is not None and size > max_bytes) or (
+                max_points is not None and points > max_points
+            ):
+                return size, points
+    return size, points
@@ -0,0 +1,65 @@
+import io
+import math
+import urllib.error
+
+from PIL import Image
+
+from . import basemap
+from .basemap import EARTH_RADIUS, MAP_TILE_SIZE, tiles_basemap
+from .heatmap import MercatorProjection
+
+TEMPLATE = "https://tiles.example.com/{z}/{x}/{y}.png"
+
+# the whole world, at zoom level 2: 4 x 4 tiles (just under, so zoom level 3
+# isn't needed)
+WORLD = 4 * MAP_TILE_SIZE - 8
+PROJECTION = MercatorProjection(2 * math.pi * EARTH_RADIUS / WORLD)
+ORIGIN = (-WORLD / 2, -WORLD / 2)
+SHAPE = (WORLD, WORLD)
+
+
+def tile_server(monkeypatch, error=None):
+    """Serve every tile (or fail with `error`); returns the URLs asked for."""
+    tile = io.BytesIO()
+    Image.new("RGBA", (MAP_TILE_SIZE, MAP_TILE_SIZE), "red").save(tile, "PNG")
+    requests = []
+
+    def urlopen(request, timeout):
+        assert timeout == basemap.TILE_TIMEOUT
+        requests.append(request.full_url)
+        if error is not None:
+            raise error
+        return io.BytesIO(tile.getvalue())
+
+    monkeypatch.setattr(basemap.urllib.request, "urlopen", urlopen)
+    return requests
+
+
+def test_tile_downloads_limited(monkeypatch, tmp_path):
+    monkeypatch.setattr(basemap, "MAX_TILE_DOWNLOADS", 5)
+    requests = tile_server(monkeypatch)
+
+    image = tiles_basemap(TEMPLATE, PROJECTION, ORIGIN, SHAPE, tile_dir=tmp_path)
+    assert len(requests) == 5
+    assert image.info["missing_tiles"] == 16 - 5
+
+    # the next build downloads the next few
+    image = tiles_basemap(TEMPLATE, PROJECTION, ORIGIN, SHAPE, tile_dir=tmp_path)
+    assert len(set(requests)) == len(requests) == 10
+    assert image.info["missing_tiles"] == 16 - 10
+
+
+def test_tile_server_not_answering(monkeypatch, tmp_path):
+    requests = tile_server(monkeypatch, error=TimeoutError("timed out"))
+    image = tiles_basemap(TEMPLATE, PROJECTION, ORIGIN, SHAPE, tile_dir=tmp_path)
+    assert len(requests) == 1
+    assert image.info["missing_tiles"] == 16
+
+
+def test_tile_not_found(monkeypatch, tmp_path):
+    error = urllib.error.HTTPError(TEMPLATE, 404, "Not Found", {}, None)
+    requests = tile_server(monkeypatch, error=error)
+    image = tiles_basemap(TEMPLATE, PROJECTION, ORIGIN, SHAPE, tile_dir=tmp_path)
+    # only that tile is missing, so the rest are still tried
+    assert len(requests) == 16
+    assert image.info["missing_tiles"] == 16
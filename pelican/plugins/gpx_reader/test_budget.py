@@ -0,0 +1,91 @@
+import os
+import signal
+import time
+
+import pytest
+
+from .budget import ReadWorker, time_limit
+from .exceptions import OverBudgetGPXException
+
+pytestmark = pytest.mark.skipif(
+    not ReadWorker.available() or not hasattr(signal, "setitimer"),
+    reason="needs fork and setitimer",
+)
+
+
+def read(what, seconds=0):
+    """Stands in for reading a file: takes `seconds`, then does `what`."""
+    time.sleep(seconds)
+    if what == "pid":
+        return os.getpid()
+    if what == "exit":
+        os._exit(3)
+    raise ValueError(what)
+
+
+def test_read_worker():
+    worker = ReadWorker(read)
+    try:
+        pid = worker.run("a.gpx", 5, "pid")
+        assert pid != os.getpid()
+        # kept for the next file
+        assert worker.run("b.gpx", 5, "pid") == pid
+
+        with pytest.raises(ValueError, match="broken"):
+            worker.run("c.gpx", 5, "broken")
+        assert worker.run("d.gpx", 5, "pid") == pid
+    finally:
+        worker.stop()
+
+
+def test_read_worker_over_time():
+    worker = ReadWorker(read)
+    try:
+        pid = worker.run("a.gpx", 5, "pid")
+        with pytest.raises(OverBudgetGPXException, match="long.gpx took over 0.2"):
+            worker.run("long.gpx", 0.2, "pid", 60)
+        # stopped, and replaced for the next file
+        assert worker._process is None
+        assert worker.run("b.gpx", 5, "pid") not in (pid, os.getpid())
+    finally:
+        worker.stop()
+
+
+def test_read_worker_exits():
+    worker = ReadWorker(read)
+    try:
+        with pytest.raises(RuntimeError, match=r"a.gpx stopped \(exit code 3\)"):
+            worker.run("a.gpx", 5, "exit")
+        assert worker.run("b.gpx", 5, "pid") != os.getpid()
+    finally:
+        worker.stop()
+
+
+def test_time_limit():
+    handler = signal.getsignal(signal.SIGALRM)
+    settings = {"GPX_MAX_READ_TIME": 0.2}
+
+    with pytest.raises(OverBudgetGPXException, match="long.gpx took over 0.2"):
+        with time_limit("long.gpx", settings):
+            time.sleep(60)
+    assert signal.getsignal(signal.SIGALRM) == handler
+
+    # the parser's own error, while stopping it, is reported as over time
+    with pytest.raises(OverBudgetGPXException) as excinfo:
+        with time_limit("long.gpx", settings):
+            try:
+                time.sleep(60)
+            except OverBudgetGPXException as e:
+                raise ValueError("parse error") from e
+    assert isinstance(excinfo.value.__cause__, ValueError)
+
+    # other errors are left alone
+    with pytest.raises(ValueError):
+        with time_limit("a.gpx", settings):
+            raise ValueError("parse error")
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
+
+    start = time.monotonic()
+    with time_limit("a.gpx", {"GPX_MAX_READ_TIME": None}):
+        time.sleep(0.3)
+    assert time.monotonic() - start >= 0.3
@@ -0,0 +1,63 @@
+import os
+
+from PIL import Image
+
+from . import hasher
+from .cache import HeatmapImageCache, SourceDigestIndex
+
+
+def image_cache(path):
+    return HeatmapImageCache(
+        {
+            "CACHE_PATH": path,
+            "GPX_HEATMAPS": {"default": {"scale": 250}},
+            "CACHE_CONTENT": True,
+            "LOAD_CONTENT_CACHE": True,
+        }
+    )
+
+
+def test_heatmap_image_cache_jpeg(tmp_path):
+    cache = image_cache(tmp_path)
+    name = "images/gpx/default/a/abc.jpg"
+    assert cache.get(name, "default") is None
+
+    cache.put(name, "default", Image.new("RGB", (4, 3), (200, 100, 50)))
+    image = cache.get(name, "default")
+    assert image.format == "JPEG"
+    assert image.size == (4, 3)
+
+
+def digest_index(path, load=True):
+    return SourceDigestIndex(
+        {"CACHE_PATH": path, "CACHE_CONTENT": True, "LOAD_CONTENT_CACHE": load}
+    )
+
+
+def test_source_digest_index(tmp_path, monkeypatch):
+    digested = []
+    file_digest = hasher.file_digest
+    monkeypatch.setattr(
+        hasher, "file_digest", lambda path: digested.append(path) or file_digest(path)
+    )
+    a, b, c = (str(tmp_path / name) for name in ("a.gpx", "b.gpx", "c.gpx"))
+    for path, contents in [(a, b"<gpx/>"), (b, b"<gpx/>"), (c, b"<gpx></gpx>")]:
+        with open(path, "wb") as f:
+            f.write(contents)
+
+    index = digest_index(tmp_path / "cache")
+    assert index.digest(a) == index.digest(b) != index.digest(c)
+    index.save()
+    assert len(digested) == 3
+
+    # kept between builds, and only worked out again for changed files
+    index = digest_index(tmp_path / "cache")
+    with open(c, "wb") as f:
+        f.write(b"<gpx/>")
+    os.utime(c, ns=(0, 0))
+    assert index.digest(a) == index.digest(c)
+    assert digested[3:] == [c]
+
+    # unless the cache isn't loaded
+    digest_index(tmp_path / "cache", load=False).digest(a)
+    assert digested[4:] == [a]
@@ -0,0 +1,69 @@
+import bz2
+import gzip
+import lzma
+import zipfile
+
+import pytest
+
+from .files import gpx_stem, open_gpx_files
+from .gpx import read_gpx
+
+
+def gpx_document(name, lat=45.0):
+    """A small GPX document (with a BOM), with a waypoint, a route, and a track."""
+    return f"""\ufeff<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+<wpt lat="{lat}" lon="7"><name>{name}</name></wpt>
+<rte><name>{name}</name><rtept lat="{lat}" lon="7"/></rte>
+<trk><name>{name}</name><trkseg>
+<trkpt lat="{lat}" lon="7"><time>2020-01-01T00:00:00Z</time></trkpt>
+<trkpt lat="{lat + 0.001}" lon="7"><time>2020-01-01T00:00:10Z</time></trkpt>
+</trkseg></trk>
+</gpx>
+""".encode()
+
+
+@pytest.mark.parametrize(
+    "suffix, compress",
+    [
+        (".gpx", lambda data: data),
+        (".gpx.gz", gzip.compress),
+        (".gpx.bz2", bz2.compress),
+        (".gpx.xz", lzma.compress),
+    ],
+)
+def test_open_compressed(tmp_path, suffix, compress):
+    path = tmp_path / f"20200101{suffix.upper()}"
+    path.write_bytes(compress(gpx_document("a")))
+
+    documents = [(name, f.read()) for name, f in open_gpx_files(path)]
+    assert documents == [(path.name, gpx_document("a"))]
+    assert gpx_stem(path) == "20200101"
+
+
+def test_open_zip(tmp_path):
+    path = tmp_path / "bundle.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("a.gpx", gpx_document("a"))
+        archive.writestr("notes.txt", "not a GPX file")
+        archive.writestr("day 2/", "")
+        archive.writestr("day 2/B.GPX", gpx_document("b"))
+
+    documents = [(name, f.read()) for name, f in open_gpx_files(path)]
+    assert documents == [
+        ("a.gpx", gpx_document("a")),
+        ("day 2/B.GPX", gpx_document("b")),
+    ]
+
+
+def test_read_gpx_combines_zip(tmp_path):
+    path = tmp_path / "bundle.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("a.gpx", gpx_document("a", lat=45))
+        archive.writestr("b.gpx", gpx_document("b", lat=46))
+
+    gpx = read_gpx(path)
+    assert [w.name for w in gpx.waypoints] == ["a", "b"]
+    assert [r.name for r in gpx.routes] == ["a", "b"]
+    assert [t.name for t in gpx.tracks] == ["a", "b"]
+    assert gpx.tracks[1].segments[0].points[0].latitude == 46
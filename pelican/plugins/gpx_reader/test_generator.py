@@ -0,0 +1,40 @@
+import copy
+import gzip
+from types import SimpleNamespace
+
+from pelican.settings import DEFAULT_CONFIG
+
+from .generator import GPXGenerator
+from .initialize import check_settings
+
+
+def gpx_generator(content_path, cache_path):
+    settings = copy.deepcopy(DEFAULT_CONFIG)
+    settings["CACHE_PATH"] = str(cache_path)
+    check_settings(SimpleNamespace(settings=settings))
+    return GPXGenerator(
+        context={},
+        settings=settings,
+        path=str(content_path),
+        theme=settings["THEME"],
+        output_path=str(cache_path),
+    )
+
+
+def test_source_files_skips_copies(tmp_path):
+    content_path = tmp_path / "content"
+    (content_path / "gpx" / "phone").mkdir(parents=True)
+    for name, contents in [
+        ("gpx/b.gpx", b"<gpx>1</gpx>"),
+        ("gpx/phone/a.gpx", b"<gpx>2</gpx>"),
+        ("gpx/a.gpx", b"<gpx>1</gpx>"),
+        ("gpx/c.gpx", b"<gpx>2</gpx>"),
+        # the same GPX, but not the same bytes
+        ("gpx/d.gpx.gz", gzip.compress(b"<gpx>1</gpx>")),
+        ("gpx/notes.txt", b"<gpx>3</gpx>"),
+    ]:
+        (content_path / name).write_bytes(contents)
+
+    generator = gpx_generator(content_path, tmp_path / "cache")
+    # the first (by path) of each
+    assert generator.source_files() == ["gpx/a.gpx", "gpx/c.gpx", "gpx/d.gpx.gz"]
@@ -0,0 +1,237 @@
+import math
+
+from PIL import Image
+import gpxpy.gpx
+import numpy as np
+
+from . import constants
+from .heatmap import (
+    DECAY_TOLERANCE,
+    EARTH_RADIUS,
+    TILE_SIZE,
+    ColorMap,
+    DecayingMatrix,
+    Heatmap,
+    ImageMaker,
+    MaxingMatrix,
+    SummingMatrix,
+    fit_heatmap,
+    image_shape,
+    variant_factors,
+    variant_save_as,
+)
+from .points import TrackPoints
+
+# a scale of one pixel per degree, at the equator
+DEGREE = 2 * math.pi * EARTH_RADIUS / 360
+
+HEATMAP_SETTINGS = [
+    "background",
+    "background_image",
+    "decay",
+    "extent",
+    "gradient",
+    "hsva_max",
+    "hsva_min",
+    "kernel",
+    "max_memory",
+    "max_pixels",
+    "oversize",
+    "projection",
+    "radius",
+    "scale",
+    "tiles",
+    "variants",
+]
+
+
+def heatmap_settings(**settings):
+    """Settings for a heatmap: the defaults, updated with `settings`."""
+    defaults = {
+        key: getattr(constants, f"GPX_{key.upper()}") for key in HEATMAP_SETTINGS
+    }
+    return {**defaults, **settings}
+
+
+def dense(matrix):
+    """The (rows, columns) array of a tiled matrix."""
+    rows, columns = matrix.shape
+    array = np.zeros(
+        (-(-rows // TILE_SIZE) * TILE_SIZE, -(-columns // TILE_SIZE) * TILE_SIZE)
+    )
+    for (tile_row, tile_column), tile in matrix.tiles.items():
+        array[
+            tile_row * TILE_SIZE : (tile_row + 1) * TILE_SIZE,
+            tile_column * TILE_SIZE : (tile_column + 1) * TILE_SIZE,
+        ] = tile
+    return array[:rows, :columns]
+
+
+def random_pixels(shape, count, seed=0):
+    """`count` (rows, columns, values), some of them repeated, in `shape`."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, shape[0], count)
+    columns = rng.integers(0, shape[1], count)
+    # the same pixels again, with other values
+    rows = np.concatenate((rows, rows[: count // 4]))
+    columns = np.concatenate((columns, columns[: count // 4]))
+    return rows, columns, rng.random(len(rows))
+
+
+def test_summing_matrix_across_tiles():
+    shape = (600, 530)
+    rows, columns, values = random_pixels(shape, 20_000)
+    # and some outside the image, which are left out
+    rows = np.concatenate((rows, [-1, 0, shape[0], 5]))
+    columns = np.concatenate((columns, [0, -1, 5, shape[1]]))
+    values = np.concatenate((values, [1, 1, 1, 1]))
+
+    matrix = SummingMatrix(shape)
+    half = len(rows) // 2
+    matrix.add(rows[:half], columns[:half], values[:half])
+    matrix.add(rows[half:], columns[half:], values[half:])
+
+    expected = np.zeros(shape)
+    inside = (rows >= 0) & (rows < shape[0]) & (columns >= 0) & (columns < shape[1])
+    np.add.at(expected, (rows[inside], columns[inside]), values[inside])
+    assert np.allclose(dense(matrix), expected)
+    assert len(matrix.tiles) == 3 * 3
+
+
+def test_maxing_matrix_across_tiles():
+    shape = (300, 300)
+    rows, columns, values = random_pixels(shape, 5_000)
+    matrix = MaxingMatrix(shape)
+    matrix.add(rows, columns, values)
+
+    expected = np.zeros(shape)
+    np.maximum.at(expected, (rows, columns), values)
+    assert np.array_equal(dense(matrix), expected)
+
+
+def test_decaying_matrix_within_tolerance():
+    decay = 0.5
+    shape = (300, 300)
+    # many values at a few pixels, either side of the tile edges, added in
+    # batches so they are folded in (and cut down) more than once
+    pixels = [(0, 0), (255, 255), (256, 256), (255, 256), (299, 10)]
+    rng = np.random.default_rng(0)
+    matrix = DecayingMatrix(shape, decay)
+    added = {pixel: [] for pixel in pixels}
+    for _ in range(10):
+        which = rng.integers(0, len(pixels), 20_000)
+        values = rng.random(len(which))
+        rows = np.array([pixels[x][0] for x in which])
+        columns = np.array([pixels[x][1] for x in which])
+        matrix.add(rows, columns, values)
+        for pixel, value in zip(which, values):
+            added[pixels[pixel]].append(value)
+
+    result = dense(matrix.finalized())
+    for pixel, values in added.items():
+        values = np.sort(values)[::-1]
+        expected = float((values * decay ** np.arange(len(values))).sum())
+        assert abs(result[pixel] - expected) <= DECAY_TOLERANCE * values[0]
+    assert np.count_nonzero(result) == len(pixels)
+
+
+def test_downsampled_uneven_shape():
+    shape = (600, 530)
+    rows, columns, values = random_pixels(shape, 20_000)
+    matrix = SummingMatrix(shape)
+    matrix.add(rows, columns, values)
+    array = dense(matrix)
+
+    # 2 and 4 go evenly into a tile, 3 and 5 don't; none into the shape
+    for factor in (2, 3, 4, 5, 7):
+        padded = np.zeros(
+            (-(-shape[0] // factor) * factor, -(-shape[1] // factor) * factor)
+        )
+        padded[: shape[0], : shape[1]] = array
+        expected = padded.reshape(
+            padded.shape[0] // factor, factor, padded.shape[1] // factor, factor
+        ).mean(axis=(1, 3))
+
+        downsampled = matrix.downsampled(factor)
+        assert downsampled.shape == expected.shape
+        assert np.allclose(dense(downsampled), expected)
+
+
+def test_color_map_ends():
+    colormap = ColorMap(constants.GPX_HSVA_MIN, constants.GPX_HSVA_MAX)
+    assert len(colormap.values) == 256
+    assert colormap.values[0].tolist() == [254, 0, 0, 0]
+    assert colormap.values[-1].tolist() == [254, 250, 0, 254]
+    assert colormap.indexes(np.array([0.0, 1.0])).tolist() == [0, 255]
+
+    # transparent at 0, so only the background shows
+    blended = colormap.blended((10, 20, 30))
+    assert blended[0].tolist() == [10, 20, 30]
+    assert blended[-1].tolist() == [253, 249, 0]
+
+
+def test_color_map_gradient():
+    gradient = Image.new("RGBA", (1, 2))
+    gradient.putpixel((0, 0), (255, 0, 0, 255))  # top: hottest
+    gradient.putpixel((0, 1), (0, 0, 255, 128))
+    colormap = ColorMap(None, None, image=gradient)
+    assert colormap.colors(np.array([0.0, 1.0])).tolist() == [
+        [0, 0, 255, 128],
+        [255, 0, 0, 255],
+    ]
+
+
+def test_tiny_render():
+    settings = heatmap_settings(
+        scale=DEGREE, projection="equirectangular", radius=1, decay=1
+    )
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    track.segments.append(
+        gpxpy.gpx.GPXTrackSegment(
+            points=[gpxpy.gpx.GPXTrackPoint(0, 0), gpxpy.gpx.GPXTrackPoint(0, 4)]
+        )
+    )
+    gpx.tracks.append(track)
+
+    # a pixel of padding all round a line 4 pixels long
+    heatmap = Heatmap(settings, (0, 0, 0, 4))
+    heatmap.add(TrackPoints.from_gpx(gpx))
+    image = heatmap.make_image()
+
+    assert image.size == (7, 3)
+    assert image.mode == "RGB"
+    hot = tuple(ImageMaker.for_settings(settings).lookup[-1].tolist())
+    pixels = np.asarray(image)
+    heated = np.zeros((3, 7), dtype=bool)
+    heated[1, 1:6] = True
+    assert (pixels[heated] == hot).all()
+    assert (pixels[~heated] == 0).all()
+
+
+def test_fit_heatmap_raises_scale():
+    settings = heatmap_settings(max_pixels=10_000, oversize="scale")
+    bounds = (45, 7, 46, 8)
+    rows, columns = image_shape(settings, bounds)
+    assert rows * columns > 10_000
+
+    fitted, fitted_bounds = fit_heatmap([], settings, bounds, log=False)
+    rows, columns = image_shape(fitted, fitted_bounds)
+    assert fitted_bounds == bounds
+    assert fitted["scale"] > settings["scale"]
+    assert rows * columns <= 10_000
+
+
+def test_variant_factors():
+    assert variant_factors({"variants": [4, 2, 1, 2, 3.0]}) == [2, 3, 4]
+    assert variant_factors({"variants": None}) == []
+
+    save_as = "images/gpx/default/a/abc.png"
+    assert variant_save_as(save_as, (101, 640), 1) == save_as
+    # rounded up, so nothing is cut off
+    assert (
+        variant_save_as(save_as, (101, 640), 2) == "images/gpx/default/a/abc-320w.png"
+    )
+    assert (
+        variant_save_as(save_as, (101, 641), 3) == "images/gpx/default/a/abc-214w.png"
+    )
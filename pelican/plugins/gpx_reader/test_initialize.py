@@ -0,0 +1,30 @@
+import copy
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from pelican.settings import DEFAULT_CONFIG
+
+from .initialize import check_settings, is_variant_factor
+
+
+def test_is_variant_factor():
+    for factor in (2, 3.0, 16, np.int64(4)):
+        assert is_variant_factor(factor)
+    for factor in (1, 0, -2, 2.5, "3", None, True, float("nan"), float("inf")):
+        assert not is_variant_factor(factor)
+
+
+def test_check_settings_drops_bad_variants(caplog):
+    settings = copy.deepcopy(DEFAULT_CONFIG)
+    settings["GPX_HEATMAPS"] = {
+        "default": {"variants": [2, 1, 2.5, "3", 4]},
+        "other": None,
+    }
+    with caplog.at_level(logging.WARNING):
+        check_settings(SimpleNamespace(settings=settings))
+
+    assert settings["GPX_HEATMAPS"]["default"]["variants"] == [2, 4]
+    assert "Ignoring [1, 2.5, '3']" in caplog.text
+    assert "'other'" not in caplog.text
@@ -0,0 +1,99 @@
+from itertools import combinations
+from types import SimpleNamespace
+
+import numpy as np
+
+from .overlaps import find_overlaps, overlapping_pairs, resolve_overlaps
+from .points import TrackPoints
+
+# about a meter, in degrees of latitude
+METER = 1 / 111_195
+
+
+def recording(name, start, end, longitude=7.0):
+    """
+    A GPX file (enough of one for `overlaps.py`) of a trip north at 5 m/s,
+    recorded from `start` to `end` (in seconds). Recordings of the same trip
+    (at the same `longitude`) are in the same place at the same time.
+    """
+    time = np.arange(start, end + 1, 10, dtype=np.float64)
+    points = TrackPoints(
+        latitude=45 + time * 5 * METER,
+        longitude=np.full(len(time), longitude),
+        elevation=np.full(len(time), np.nan),
+        time=time,
+        segment_starts=np.array([0, len(time)]),
+        segment_tracks=np.array([0]),
+        track_count=1,
+    )
+    return SimpleNamespace(
+        gpx_point_data=points,
+        gpx_length_km=(end - start) * 5 / 1000,
+        slug=name,
+        source_path=f"{name}.gpx",
+        relative_source_path=f"{name}.gpx",
+        valid=True,
+    )
+
+
+def test_overlapping_pairs_transitive():
+    # A overlaps B, and B overlaps C, but A and C don't overlap
+    spans = [(0, 10), (5, 15), (12, 20)]
+    assert sorted(overlapping_pairs(spans)) == [(0, 1), (1, 2)]
+
+
+def test_overlapping_pairs_touching():
+    # a span that starts as another ends is still paired with it
+    spans = [(10, 20), (0, 10), (21, 30)]
+    assert sorted(overlapping_pairs(spans)) == [(1, 0)]
+
+
+def test_overlapping_pairs_matches_every_pair():
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 1000, 200)
+    spans = [(int(x), int(x + y)) for x, y in zip(starts, rng.integers(0, 50, 200))]
+
+    expected = {
+        (i, j)
+        for i, j in combinations(range(len(spans)), 2)
+        if spans[i][0] <= spans[j][1] and spans[j][0] <= spans[i][1]
+    }
+    found = [tuple(sorted(pair)) for pair in overlapping_pairs(spans)]
+    assert len(found) == len(set(found))
+    assert set(found) == expected
+
+
+def test_find_overlaps_transitive():
+    # A and C hardly overlap in time, but are grouped through B
+    a = recording("a", 0, 1000)
+    b = recording("b", 400, 1600)
+    c = recording("c", 900, 2000)
+    other = recording("other", 0, 2000, longitude=7.1)
+
+    assert find_overlaps([a, c, other], 50) == []
+    # the one covering the most time first
+    assert find_overlaps([a, b, c, other], 50) == [[b, c, a]]
+
+
+def test_find_overlaps_touching():
+    # one recording picks up as the other ends: not the same recording twice
+    first = recording("first", 0, 1000)
+    second = recording("second", 1000, 2000)
+    assert find_overlaps([first, second], 50) == []
+
+
+def test_resolve_overlaps_policies():
+    for policy, kept in [
+        ("keep", ["long", "short"]),
+        ("skip", ["long"]),
+        ("exclude-combined", ["long", "short"]),
+    ]:
+        long = recording("long", 0, 2000)
+        short = recording("short", 100, 1900)
+        settings = {"GPX_OVERLAPS": policy, "GPX_OVERLAP_DISTANCE": 50}
+
+        result = resolve_overlaps([short, long], settings)
+        assert sorted(gpx.slug for gpx in result) == kept
+        assert long.gpx_overlaps == ["short"]
+        assert long.gpx_overlap_of is None
+        assert short.gpx_overlap_of == "long"
@@ -0,0 +1,117 @@
+import numpy as np
+
+from .points import decimated, outliers
+
+# about a meter, in degrees of latitude
+METER = 1 / 111_195
+
+
+def steady_track(point_count=10, speed=5):
+    """A straight track at `speed` m/s (18 km/h), a point a second."""
+    times = np.arange(point_count, dtype=np.float64)
+    latitude = 45 + np.arange(point_count) * speed * METER
+    longitude = np.full(point_count, 7.0)
+    return times, latitude, longitude
+
+
+def test_outliers_steady_track():
+    times, latitude, longitude = steady_track()
+    assert not outliers(times, latitude, longitude, 1000).any()
+
+
+def test_outliers_repeated_timestamps():
+    times, latitude, longitude = steady_track()
+    times[2] = times[1]
+    times[6] = times[5]
+    assert not outliers(times, latitude, longitude, 1000).any()
+
+
+def test_outliers_spike():
+    times, latitude, longitude = steady_track()
+    latitude[4] += 10_000 * METER
+    assert np.flatnonzero(outliers(times, latitude, longitude, 1000)).tolist() == [4]
+
+
+def test_outliers_without_times():
+    times, latitude, longitude = steady_track()
+    latitude[4] += 10_000 * METER
+    # steps without times are never jumps, and can't show that the points
+    # either side of a jump (or at the ends) are where they should be
+    for untimed in (4, 5, 3):
+        some_times = times.copy()
+        some_times[untimed] = np.nan
+        assert not outliers(some_times, latitude, longitude, 1000).any()
+    no_times = np.full(len(times), np.nan)
+    assert not outliers(no_times, latitude, longitude, 1000).any()
+
+
+def test_outliers_one_jump():
+    for shift_from, expected in [
+        (2, [0, 1]),
+        (4, [0, 1, 2, 3]),
+        # as many points either side: a real jump
+        (5, []),
+        (6, [6, 7, 8, 9]),
+        (8, [8, 9]),
+    ]:
+        times, latitude, longitude = steady_track()
+        latitude[shift_from:] += 10_000 * METER
+        dropped = outliers(times, latitude, longitude, 1000)
+        assert np.flatnonzero(dropped).tolist() == expected
+
+
+def decimated_one_by_one(times, distances, min_seconds, min_distance):
+    """`decimated()`, checking every point in turn."""
+    times = np.maximum.accumulate(times)
+    cumulative = np.concatenate(([0.0], np.cumsum(distances)))
+    keep = [0]
+    for index in range(1, len(times) - 1):
+        last = keep[-1]
+        if (
+            times[index] >= times[last] + min_seconds
+            and cumulative[index] >= cumulative[last] + min_distance
+        ):
+            keep.append(index)
+    return keep + [len(times) - 1]
+
+
+def test_decimated_boundaries():
+    times = np.arange(11, dtype=np.float64)
+    distances = np.ones(10)
+    # points exactly at the limit are kept
+    assert decimated(times, distances, min_seconds=3).tolist() == [0, 3, 6, 9, 10]
+    assert decimated(times, distances, min_distance=5).tolist() == [0, 5, 10]
+    # the stricter of the two
+    assert decimated(times, distances, 3, 4).tolist() == [0, 4, 8, 10]
+    # the same time twice, and a step back in time
+    times[4] = times[3]
+    times[6] = 2
+    assert decimated(times, distances, min_seconds=3).tolist() == [0, 3, 7, 10]
+
+
+def test_decimated_nothing_to_do():
+    times = 1.6e9 + np.arange(5, dtype=np.float64)
+    distances = np.ones(4)
+    everything = [0, 1, 2, 3, 4]
+    assert decimated(times, distances).tolist() == everything
+    # too small to register against times since the epoch
+    assert decimated(times, distances, min_seconds=1e-9).tolist() == everything
+    # only limited by distance, if any time is unknown
+    times[2] = np.nan
+    assert decimated(times, distances, min_seconds=3).tolist() == everything
+    assert decimated(times, distances, 3, 2).tolist() == [0, 2, 4]
+    assert decimated(times[:2], distances[:1], min_seconds=3).tolist() == [0, 1]
+
+
+def test_decimated_matches_one_by_one():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        count = rng.integers(3, 500)
+        times = np.cumsum(rng.integers(0, 4, count)).astype(np.float64)
+        distances = rng.random(count - 1) * 10
+        for min_seconds, min_distance in [(5, 0), (0, 20), (7, 15)]:
+            assert decimated(
+                times, distances, min_seconds, min_distance
+            ).tolist() == decimated_one_by_one(
+                times, distances, min_seconds, min_distance
+            )
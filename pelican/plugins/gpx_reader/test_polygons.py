@@ -0,0 +1,64 @@
+import numpy as np
+
+from .polygons import Polygon, load_polygon
+
+
+def ray_cast(rings, latitude, longitude):
+    """Which points are inside, one edge at a time (the slow way)."""
+    inside = []
+    for y, x in zip(latitude, longitude):
+        crossings = 0
+        for ring in rings:
+            for (y_0, x_0), (y_1, x_1) in zip(ring, np.roll(ring, -1, axis=0)):
+                # a point on an edge counts as just to its east
+                if (y_0 <= y) != (y_1 <= y):
+                    crossings += x_0 + (y - y_0) / (y_1 - y_0) * (x_1 - x_0) > x
+        inside.append(crossings % 2 == 1)
+    return inside
+
+
+def test_contains_edges_and_vertices():
+    polygon = load_polygon([(0, 0), (0, 4), (4, 4), (4, 0)])
+    latitude, longitude = np.mgrid[-1:6, -1:6].reshape(2, -1)
+
+    # points on the south and west edges are inside; on the north and east,
+    # outside
+    inside = polygon.contains(latitude, longitude)
+    assert (
+        inside.tolist()
+        == (
+            (latitude >= 0) & (latitude < 4) & (longitude >= 0) & (longitude < 4)
+        ).tolist()
+    )
+
+
+def test_contains_shared_edge():
+    west = [(0, 0), (0, 2), (2, 2), (2, 0)]
+    east = [(0, 2), (0, 4), (2, 4), (2, 2)]
+    latitude, longitude = np.mgrid[0:3, 0:5].reshape(2, -1)
+
+    # each point is in one or the other, or neither, never both
+    both = Polygon([np.array(west, dtype=float)]).contains(
+        latitude, longitude
+    ) & Polygon([np.array(east, dtype=float)]).contains(latitude, longitude)
+    assert not both.any()
+    assert (
+        load_polygon([west, east]).contains(latitude, longitude).tolist()
+        == ((latitude < 2) & (longitude < 4)).tolist()
+    )
+
+
+def test_contains_matches_ray_cast():
+    # corners on a lattice, so there are plenty of edges through cell
+    # centres, and points on edges and vertices, including ones that
+    # retrace, or cross, one another
+    rng = np.random.default_rng(0)
+    latitude, longitude = np.mgrid[-1:9:0.5, -1:9:0.5].reshape(2, -1)
+    for _ in range(40):
+        rings = [
+            rng.integers(0, 8, (rng.integers(3, 12), 2)).astype(np.float64)
+            for _ in range(rng.integers(1, 3))
+        ]
+        assert Polygon(rings).contains(latitude, longitude).tolist() == ray_cast(
+            rings, latitude, longitude
+        )
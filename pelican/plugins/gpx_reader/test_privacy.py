@@ -0,0 +1,57 @@
+import gpxpy.gpx
+
+from .gpx import exclude_privacy_zones
+
+HOME = (45.0, 7.0)
+# about 1 km south of home, home, and about 1 km north
+LATITUDES = (44.991, 45.0, 45.009)
+
+SETTINGS = {"GPX_PRIVACY_ZONES": [(*HOME, 200)]}
+
+
+def home_gpx():
+    """A GPX with a waypoint, a route, and a track through (and at) home."""
+    gpx = gpxpy.gpx.GPX()
+    gpx.waypoints = [
+        gpxpy.gpx.GPXWaypoint(*HOME, name="Home"),
+        gpxpy.gpx.GPXWaypoint(45.009, 7.0, name="Cafe"),
+    ]
+
+    route = gpxpy.gpx.GPXRoute(name="Commute")
+    route.points = [gpxpy.gpx.GPXRoutePoint(x, 7.0) for x in LATITUDES]
+    gpx.routes.append(route)
+
+    track = gpxpy.gpx.GPXTrack()
+    track.segments.append(
+        gpxpy.gpx.GPXTrackSegment(
+            points=[gpxpy.gpx.GPXTrackPoint(x, 7.0) for x in LATITUDES]
+        )
+    )
+    gpx.tracks.append(track)
+    return gpx
+
+
+def test_exclude_privacy_zones():
+    gpx = home_gpx()
+
+    # a waypoint, a route point, and a track point; a gap in the route, and
+    # one in the track
+    assert exclude_privacy_zones(gpx, SETTINGS) == (3, 2)
+
+    assert [x.name for x in gpx.waypoints] == ["Cafe"]
+    assert [x.name for x in gpx.routes] == ["Commute", "Commute"]
+    assert [[x.latitude for x in route.points] for route in gpx.routes] == [
+        [44.991],
+        [45.009],
+    ]
+    assert [
+        [x.latitude for x in segment.points] for segment in gpx.tracks[0].segments
+    ] == [[44.991], [45.009]]
+
+
+def test_exclude_privacy_zones_elsewhere():
+    gpx = home_gpx()
+    assert exclude_privacy_zones(gpx, {"GPX_PRIVACY_ZONES": [(0, 0, 200)]}) == (0, 0)
+    assert len(gpx.waypoints) == 2
+    assert len(gpx.routes[0].points) == 3
+    assert len(gpx.tracks[0].segments[0].points) == 3
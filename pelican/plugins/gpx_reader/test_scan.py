@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+import io
+
+from .scan import GPXScan, merge_scans, scan_gpx
+
+
+def gpx_document(*points, end="</trkseg></trk></gpx>"):
+    """A GPX document, with `points` (``<trkpt>`` elements) in one segment."""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        "<trk><trkseg>" + "".join(points) + end
+    ).encode()
+
+
+def point(lat, lon, time=None, src=None):
+    children = ""
+    if time is not None:
+        children += f"<time>{time}</time>"
+    if src is not None:
+        children += f"<src>{src}</src>"
+    return f'<trkpt lat="{lat}" lon="{lon}">{children}</trkpt>'
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_scan_gpx():
+    document = gpx_document(
+        point(45, 7, "2020-01-01T10:00:00Z"),
+        # left out, as clean_gpx() drops them
+        point(0, 0, "2019-01-01T00:00:00Z"),
+        point(45.1, 7.1, "2019-01-01T00:00:00Z", src="network"),
+        point(45.2, 7.2, "2020-01-01T12:30:00+02:00"),
+        point(45.3, 7.3),
+    )
+    scan = scan_gpx(io.BytesIO(document))
+    assert scan.points == 3
+    assert scan.start_time == utc(2020, 1, 1, 10)
+    assert scan.end_time == utc(2020, 1, 1, 10, 30)
+    assert scan.start_lat_lon == (45, 7)
+    assert scan.end_lat_lon == (45.3, 7.3)
+
+
+def test_scan_gpx_no_points(tmp_path):
+    path = tmp_path / "empty.gpx"
+    path.write_bytes(gpx_document())
+    assert scan_gpx(path) == (0, None, None, None, None)
+
+
+def test_scan_gpx_stop_after():
+    # broken after the second point, which is never read
+    document = gpx_document(
+        point(45, 7, "2020-01-01T10:00:00Z"),
+        point(45.1, 7.1, "2020-01-01T10:01:00Z"),
+        point(45.2, 7.2, "2020-01-01T10:02:00Z"),
+        end="<trkpt lat=" + "x" * 100_000,
+    )
+    scan = scan_gpx(io.BytesIO(document), stop_after=2)
+    assert scan.points == 2
+    assert scan.end_time == utc(2020, 1, 1, 10, 1)
+    assert scan.end_lat_lon == (45.1, 7.1)
+
+
+def test_merge_scans():
+    # e.g. the GPX files of a zip file; the first has no times
+    scans = [
+        GPXScan(2, None, None, (45, 7), (45.1, 7.1)),
+        GPXScan(0, None, None, None, None),
+        GPXScan(3, utc(2020, 1, 1, 10), utc(2020, 1, 1, 11), (46, 8), (46.1, 8.1)),
+        GPXScan(1, utc(2020, 1, 2, 10), None, (47, 9), (47, 9)),
+    ]
+    assert merge_scans(scans) == (
+        6,
+        utc(2020, 1, 1, 10),
+        utc(2020, 1, 1, 11),
+        (45, 7),
+        (47, 9),
+    )
+    assert merge_scans([]) == (0, None, None, None, None)
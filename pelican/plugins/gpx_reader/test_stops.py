@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import gpxpy.gpx
+import numpy as np
+
+from .gpx import collapse_stops
+from .points import find_stops, haversine
+
+# about a meter, in degrees of latitude
+METER = 1 / 111_195
+
+SETTINGS = {"GPX_STOP_RADIUS": 10, "GPX_STOP_TIME": 60}
+
+
+def walk_stop_walk():
+    """
+    (times, latitude, longitude) of a point a second: walking (50 m a step)
+    to a spot reached at 9 s, stood still there (within 2 m) until 209 s,
+    then 10 s more walking.
+    """
+    rng = np.random.default_rng(0)
+    steps = np.concatenate((np.full(10, 50.0), np.zeros(200), np.full(10, 50.0)))
+    meters = np.cumsum(steps)
+    meters[10:210] += rng.uniform(-2, 2, 200)
+    times = np.arange(len(meters), dtype=np.float64)
+    return times, 45 + meters * METER, np.full(len(meters), 7.0)
+
+
+def test_find_stops():
+    times, latitude, longitude = walk_stop_walk()
+    assert find_stops(times, latitude, longitude, 10, 60).tolist() == [[9, 209]]
+    # too short
+    assert find_stops(times, latitude, longitude, 10, 250).tolist() == []
+    assert find_stops(times[:2], latitude[:2], longitude[:2], 10, 60).shape == (0, 2)
+
+
+def test_find_stops_slow_drift():
+    # still, 60 s on, the whole way; but cut into stops 20 m across
+    times = np.arange(1000, dtype=np.float64)
+    latitude = 45 + times * 0.125 * METER
+    longitude = np.full(len(times), 7.0)
+
+    stops = find_stops(times, latitude, longitude, 20, 60)
+    assert len(stops) > 1
+    assert (stops[1:, 0] > stops[:-1, 1]).all()
+    for start, end in stops:
+        assert times[end] - times[start] >= 60
+        assert haversine(latitude[start], 7, latitude[end], 7) <= 20
+        # and no further
+        assert end == len(times) - 1 or (
+            haversine(latitude[start], 7, latitude[end + 1], 7) > 20
+        )
+
+
+def segment_gpx(times, latitude, longitude):
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    track.segments.append(
+        gpxpy.gpx.GPXTrackSegment(
+            points=[
+                gpxpy.gpx.GPXTrackPoint(
+                    lat, lon, time=None if t is None else start + timedelta(seconds=t)
+                )
+                for t, lat, lon in zip(times, latitude, longitude)
+            ]
+        )
+    )
+    gpx.tracks.append(track)
+    return gpx
+
+
+def test_collapse_stops():
+    times, latitude, longitude = walk_stop_walk()
+    gpx = segment_gpx(times, latitude, longitude)
+
+    assert collapse_stops(gpx, SETTINGS) == (1, 200.0)
+    points = gpx.tracks[0].segments[0].points
+    assert len(points) == 9 + 2 + 10
+    # a stub, in the middle of the blob, from when the stop started and ended
+    stub = points[9:11]
+    assert [(p.latitude, p.longitude) for p in stub] == [
+        (latitude[9:210].mean(), 7.0)
+    ] * 2
+    assert (stub[1].time - stub[0].time).total_seconds() == 200
+    assert [p.latitude for p in points[:9] + points[11:]] == (
+        latitude[:9].tolist() + latitude[210:].tolist()
+    )
+
+
+def test_collapse_stops_left_alone():
+    times, latitude, longitude = walk_stop_walk()
+
+    gpx = segment_gpx(times, latitude, longitude)
+    assert collapse_stops(gpx, {**SETTINGS, "GPX_STOP_TIME": None}) == (0, 0.0)
+    assert len(gpx.tracks[0].segments[0].points) == 220
+
+    # a segment with a point without a time
+    gpx = segment_gpx([None, *times[1:]], latitude, longitude)
+    assert collapse_stops(gpx, SETTINGS) == (0, 0.0)
+    assert len(gpx.tracks[0].segments[0].points) == 220
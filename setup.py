@@ -40,15 +40,12 @@ URL = find_meta(*META_PATH, meta_key="url")
 LICENSE = find_meta(*META_PATH, meta_key="license")
 PYTHON_REQUIRES = ">= 3.9"  # uses "str.removesuffix()"
 
-PACKAGES = setuptools.find_namespace_packages(
-    exclude=("vendor_src", "test-site", "dist", "build")
-)
+PACKAGES = setuptools.find_namespace_packages(exclude=("test-site", "dist", "build"))
 
 INSTALL_REQUIRES = [
     "pelican >= 4.7.0",
     "gpxpy",
-    # also vendorized heatmap -- https://github.com/sethoscope/heatmap
-    "osmviz",  # required by heatmap
+    "numpy",
     "pillow",
 ]
 
@@ -59,6 +56,9 @@ EXTRA_REQUIRES = {
     "lxml": [
         "lxml",  # speed up gpxpy
     ],
+    "brotli": [
+        "brotli",  # for XML_PRECOMPRESS_BROTLI
+    ],
     "build": [
         "pip-tools",
         "minchin.releaser",
@@ -152,6 +152,9 @@ setuptools.setup(
     python_requires=PYTHON_REQUIRES,
     platforms="any",
     classifiers=CLASSIFIERS,
+    entry_points={
+        "console_scripts": ["gpx-reader = pelican.plugins.gpx_reader.cli:main"],
+    },
     # namespace_packages=[
     #     "pelican",
     #     "pelican.plugins",
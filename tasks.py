@@ -1 +1,110 @@
-from minchin.releaser import make_release, vendorize
+from statistics import median
+import subprocess
+import sys
+
+from invoke import task
+
+from minchin.releaser import make_release
+
+# run in a fresh interpreter, so nothing is cached from a previous run
+_STARTUP_SCRIPT = """
+import copy
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Pelican itself is already loaded by the time plugins are
+import pelican.generators
+import pelican.readers
+import pelican.settings
+import pelican.writers
+
+already_loaded = set(sys.modules)
+start = time.perf_counter()
+import pelican.plugins.everything_writer
+import pelican.plugins.gpx_reader
+imported = time.perf_counter()
+pelican.plugins.everything_writer.register()
+pelican.plugins.gpx_reader.register()
+registered = time.perf_counter()
+
+# as Pelican does for every build, whether there are GPX files or not
+with tempfile.TemporaryDirectory() as path:
+    settings = copy.deepcopy(pelican.settings.DEFAULT_CONFIG)
+    settings["CACHE_PATH"] = path
+    ready = time.perf_counter()
+    pelican.plugins.gpx_reader.check_settings(SimpleNamespace(settings=settings))
+    pelican.plugins.gpx_reader.GPXGenerator(
+        context={},
+        settings=settings,
+        path=path,
+        theme=settings["THEME"],
+        output_path=path,
+    )
+    constructed = time.perf_counter()
+
+heavy = [
+    name
+    for name in (
+        "gpxpy",
+        "numpy",
+        "pytz",
+        "timezonefinder",
+        "PIL.Image",
+    )
+    if name in sys.modules and name not in already_loaded
+]
+print(
+    imported - start,
+    registered - imported,
+    constructed - ready,
+    ",".join(heavy),
+)
+"""
+
+
+@task
+def benchmark_startup(ctx, runs=10):
+    """
+    Time importing the plugins, calling their `register()`, and setting up
+    the GPX generator (with no GPX files).
+
+    Also lists any heavy dependencies that the plugins loaded (beyond what
+    Pelican already had); ideally, there are none, as they should only be
+    loaded once there is a GPX file to deal with.
+    """
+    import_times = []
+    register_times = []
+    generator_times = []
+    heavy = set()
+    for _ in range(int(runs)):
+        result = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        import_time, register_time, generator_time, loaded = result.stdout.split(" ")
+        import_times.append(float(import_time))
+        register_times.append(float(register_time))
+        generator_times.append(float(generator_time))
+        heavy.update(x for x in loaded.strip().split(",") if x)
+
+    print(f"Plugin startup, over {runs} runs (median / min):")
+    print(
+        f"    import:     {median(import_times) * 1000:7.1f} ms / "
+        f"{min(import_times) * 1000:7.1f} ms"
+    )
+    print(
+        f"    register(): {median(register_times) * 1000:7.1f} ms / "
+        f"{min(register_times) * 1000:7.1f} ms"
+    )
+    print(
+        f"    generator:  {median(generator_times) * 1000:7.1f} ms / "
+        f"{min(generator_times) * 1000:7.1f} ms"
+    )
+    if heavy:
+        print(f"    heavy dependencies loaded: {', '.join(sorted(heavy))}")
+    else:
+        print("    no heavy dependencies loaded")